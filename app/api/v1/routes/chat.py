@@ -1,21 +1,66 @@
-from typing import Dict
+import json
+from typing import Dict, Tuple
 from fastapi import APIRouter, HTTPException, Depends, Form, Query
-from app.core.models.pydantic_models import ChatSession, Message
-from app.core.dependencies import get_resume_repository, get_process_llm
+from fastapi.responses import StreamingResponse
+from app.core.models.pydantic_models import ChatSession, Message, PromptUsage
+from app.core.dependencies import get_resume_repository, get_process_llm, get_prompt_assembler
 from app.services.process_llm import ProcessLLM
+from app.services.prompt_assembler import PromptAssembler
 from app.services.resume_repository import ResumeRepository
-from app.services.llm_prompts import CHAT_PROMPT, DOCUMENT_TEMPLATE
+from app.services.llm_prompts import CHAT_PROMPT, CHAT_STREAM_PROMPT
 
 chat_router = APIRouter()
 chat_session: Dict[str, ChatSession] = {}
 
+
+def get_chat_session(
+    file_id: str,
+    message: str,
+    resume_repository: ResumeRepository,
+    assembler: PromptAssembler,
+    model: str,
+    prompt: str
+) -> Tuple[ChatSession, str, PromptUsage]:
+    """
+    Get the chat session of a resume, loading it from the database if needed, and assemble
+    the document sent to the LLM for a new message within the model's token budget.
+    
+    Raises:
+        HTTPException: If the resume does not exist.
+    """
+    if file_id not in chat_session:
+        # Try to get resume data from database if not in session
+        resume_data = resume_repository.get_resume(file_id)
+        if not resume_data:
+            raise HTTPException(status_code=404, detail="Resume not found.")
+
+        # Create new chat session
+        chat_session[file_id] = ChatSession(
+            messages=[],
+            resume=resume_data.resume_text,
+            feedback=resume_data.feedback.feedback
+        )
+    session = chat_session[file_id]
+
+    document, usage = assembler.chat(session.resume, session.feedback, session.messages, message, model, prompt)
+    return session, document, usage
+
+def save_chat_turn(file_id: str, session: ChatSession, message: str, response: str, resume_repository: ResumeRepository):
+    """ Append a user message and the bot response to the session and persist its history """
+    session.messages.append(Message(type="user", text=message))
+    session.messages.append(Message(type="bot", text=response))
+    session_messages_json = [msg.__dict__ for msg in session.messages]
+
+    resume_repository.save_resume_chat_history(file_id, session_messages_json)
+
 @chat_router.post("/")
 async def chat(
     file_id: str = Form(...), 
     message: str = Form(...), 
     model: str = "openai",
     resume_repository: ResumeRepository = Depends(get_resume_repository),
-    process_llm: ProcessLLM = Depends(get_process_llm)
+    process_llm: ProcessLLM = Depends(get_process_llm),
+    assembler: PromptAssembler = Depends(get_prompt_assembler)
 ):
     """
     Chat with a resume.
@@ -26,45 +71,16 @@ async def chat(
         model (str): The model to use for the chat.
     
     Returns:
-        dict: A dictionary containing the response from the chat.
+        dict: A dictionary containing the response from the chat, and the prompt tokens it used.
     """
     try:
-        if file_id not in chat_session:
-            # Try to get resume data from database if not in session
-            resume_data = resume_repository.get_resume(file_id)
-            if not resume_data:
-                raise HTTPException(status_code=404, detail="Resume not found.")
-
-            # Create new chat session
-            new_session = ChatSession(
-                messages=[],
-                resume=resume_data.resume_text,
-                feedback=resume_data.feedback.feedback
-            )
-            chat_session[file_id] = new_session
-        else:
-            new_session = chat_session[file_id]
-        
-        resume_text = new_session.resume
-        resume_feedback = new_session.feedback
-        
-        formatted_chat_history = "\n".join([f"{msg.type}: {msg.text}" for msg in new_session.messages])
-        formatted_chat_history += f"\nuser: {message}"
-    
-
-        document = DOCUMENT_TEMPLATE.format(
-            document=resume_text,
-            feedback=resume_feedback,
-            chat_history=formatted_chat_history,
+        new_session, document, usage = get_chat_session(
+            file_id, message, resume_repository, assembler, model, CHAT_PROMPT
         )
-        llm_response = process_llm.process(text=document, model=model, prompt=CHAT_PROMPT) or ""
-        # print("DEBUG", new_session)
-        new_session.messages.append(Message(type="user", text=message))
-        new_session.messages.append(Message(type="bot", text=llm_response.get("response")))
-        session_messages_json = [msg.__dict__ for msg in new_session.messages]
-
-        resume_repository.save_resume_chat_history(file_id, session_messages_json)
-        return llm_response
+
+        llm_response = await process_llm.process(text=document, model=model, prompt=CHAT_PROMPT) or ""
+        save_chat_turn(file_id, new_session, message, llm_response.get("response"), resume_repository)
+        return {**llm_response, "prompt_usage": usage.model_dump()}
     
     except HTTPException:
         raise
@@ -72,6 +88,54 @@ async def chat(
         print(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
     
+
+
+@chat_router.post("/stream")
+async def chat_stream(
+    file_id: str = Form(...), 
+    message: str = Form(...), 
+    model: str = "openai",
+    resume_repository: ResumeRepository = Depends(get_resume_repository),
+    process_llm: ProcessLLM = Depends(get_process_llm),
+    assembler: PromptAssembler = Depends(get_prompt_assembler)
+):
+    """
+    Chat with a resume, streaming the response as Server-Sent Events while it is generated.
+    A "token" event is sent for each piece of the response, then a "done" event with the whole
+    response and the prompt tokens it used once it has been saved to the chat history, or an "error" event if generation fails.
+    
+    Args:
+        file_id (str): The ID of the resume file.
+        message (str): The message to send to the chat.
+        model (str): The model to use for the chat.
+    
+    Returns:
+        StreamingResponse: A text/event-stream of the response.
+    """
+    new_session, document, usage = get_chat_session(
+        file_id, message, resume_repository, assembler, model, CHAT_STREAM_PROMPT
+    )
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for chunk in process_llm.stream(text=document, model=model, prompt=CHAT_STREAM_PROMPT):
+                chunks.append(chunk)
+                yield f"event: token\ndata: {json.dumps({'text': chunk})}\n\n"
+
+            response = "".join(chunks)
+            save_chat_turn(file_id, new_session, message, response, resume_repository)
+            yield f"event: done\ndata: {json.dumps({'response': response, 'prompt_usage': usage.model_dump()})}\n\n"
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    
      
 @chat_router.get("/start-chat")
 async def start_chat(
@@ -1,20 +1,28 @@
-from typing import List, Optional
-import os
-import numpy as np
-import heapq
+from typing import Any, List, Optional
+import asyncio
+import json
+import zipfile
 
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query, Form, Depends
+from fastapi import APIRouter, BackgroundTasks, File, UploadFile, HTTPException, Query, Form, Depends
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 
+from app.core.config import MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES, BATCH_MAX_FILES, SIMILAR_RESUMES_TOP_K, SIMILAR_RESUMES_BACKEND
 from app.core.dependencies import (
     get_resume_repository,
     get_file_processing,
-    get_process_llm,
+    get_upload_pipeline,
+    get_upload_jobs,
+    get_similarity_engine,
 )
-from app.services.file_processing import FileProcessing
+from app.services.category_review import REVIEW_MODES, REVIEW_PARALLEL, REVIEW_SINGLE
 from app.services.data_prep import DataPrep
-from app.services.process_llm import ProcessLLM
-from app.services.resume_repository import ResumeRepository
-from app.services.llm_prompts import DOCUMENT_TEMPLATE, BASE_PROMPT
+from app.services.file_processing import FileProcessing, UploadTooLargeError
+from app.services.extraction_executor import ExtractionQueueFullError, ExtractionTimeoutError
+from app.services.resume_repository import ResumeRepository, SEARCH_DOCUMENT, SEARCH_MODES
+from app.services.similarity_engine import SIMILARITY_MEMORY, SimilarityEngine
+from app.services.upload_jobs import UploadJobs
+from app.services.upload_pipeline import ReviewFailedError, UploadPipeline
 
 
 resume_router = APIRouter()
@@ -51,6 +59,7 @@ def get_all_resumes(
 @resume_router.post("/file", response_model=None)
 def get_resume(
     file_id: Optional[str] = Form(...),
+    highlight: bool = Form(False),
     resume_repository: ResumeRepository = Depends(get_resume_repository),
 ):
     """
@@ -58,13 +67,24 @@ def get_resume(
     
     Args:
         file_id (str): The ID of the resume file.
+        highlight (bool): Whether to also return the text with the annotations rendered as <mark> tags.
     
     Returns:
-        dict: A dictionary containing the extracted text and LLM feedback.
+        dict: A dictionary containing the extracted text, LLM feedback and highlight annotations.
     """
     try:
         resume = resume_repository.get_resume(file_id)
-        return {"extracted_text": resume.resume_text, "general_feedback": resume.general_feedback, "feedback": resume.feedback.feedback, "overall_score": resume.overall_score}
+        annotations = DataPrep.unpack_annotations(resume.feedback.annotations)
+        response = {
+            "extracted_text": resume.resume_text,
+            "annotations": annotations,
+            "general_feedback": resume.general_feedback,
+            "feedback": resume.feedback.feedback,
+            "overall_score": resume.overall_score
+        }
+        if highlight:
+            response["highlighted_text"] = DataPrep.render_html(resume.resume_text, annotations)
+        return response
     except Exception as e:
         print(str(e))
         raise HTTPException(status_code=404, detail="File not found")
@@ -72,12 +92,15 @@ def get_resume(
 # Endpoint to upload a resume
 @resume_router.post("/upload", response_model=None)
 async def upload_resume(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     model_option: str = Form("openai"),
     user_id : Optional[str] = Form(None),
-    resume_repository: ResumeRepository = Depends(get_resume_repository),
+    background: bool = Form(False),
+    review_mode: str = Form(REVIEW_SINGLE),
     file_processing: FileProcessing = Depends(get_file_processing),
-    process_llm: ProcessLLM = Depends(get_process_llm),
+    upload_pipeline: UploadPipeline = Depends(get_upload_pipeline),
+    upload_jobs: UploadJobs = Depends(get_upload_jobs),
     ):
     """
     Upload a resume and extract information from it.
@@ -86,107 +109,290 @@ async def upload_resume(
         file (UploadFile): The uploaded file.
         model_option (str): The model to use for processing the resume. Defaults to "openai".
         user_id (str, optional): The ID of the user. Defaults to None.
+        background (bool): Process the upload as a background job and return 202 with its job id. Defaults to False.
+        review_mode (str): "single" to review with one prompt, "parallel" to send one prompt per category concurrently. Background jobs always use "single".
         file_processing (FileProcessing): File processing service.
-        process_llm (ProcessLLM): LLM processing service.
-        resume_repository (ResumeRepository): Resume repository service.
+        upload_pipeline (UploadPipeline): Extract, review, embed and save pipeline.
+        upload_jobs (UploadJobs): Background upload job runner.
     
     Returns:
-        dict: A dictionary containing the extracted text and LLM feedback.
+        dict: A dictionary containing the extracted text and LLM feedback, or the job id when processing in the background.
     """
+    if review_mode not in REVIEW_MODES:
+        raise HTTPException(status_code=400, detail="Invalid review mode")
+
+    spool = None
     try:
-        # Write the uploaded file's content to a temporary path
         original_filename = file.filename
         file_ext = file.filename.split(".")[-1]
-        temp_path = f"temp.{file_ext}"
 
-        with open(temp_path, "wb") as f:
-            file_bytes = await file.read()
-            f.write(file_bytes)
-        
-        #Since file_id is a sha256 hash of the file content, we can use it to check if the file already exists
-        file_id = file_processing.generate_file_id(file_bytes)
-
-        # Extract information from file
-        txt = file_processing.extract(temp_path, file_ext)    
-        os.remove(temp_path)
-
-        if not txt or txt == "":
-            raise HTTPException(status_code=400, detail="Unsupported file type")
-
-        if user_id:
-            resume = resume_repository.get_resume(file_id)
-            if resume:
-                return {"extracted_text": resume.resume_text, "feedback": resume.feedback.feedback}
-                    
-        document = DOCUMENT_TEMPLATE.format(
-            document=txt,
-            feedback={},
-            chat_history=""
-        )
+        # Stream the upload into a per-request spool, hashing it as it is read.
+        # Since file_id is a sha256 hash of the file content, we can use it to check if the file already exists
+        file_id, spool = await file_processing.ingest(file)
 
-        llm_feedback = process_llm.process(document, model=model_option, prompt=BASE_PROMPT)
-        embedding = file_processing.generate_embeddings(txt)
-        
-        txt, llm_feedback = DataPrep.prep_output(txt, llm_feedback)
-        
-        resume_repository.save_resume_feedback(
-            user_id=user_id,
+        if background:
+            job_id = await asyncio.to_thread(
+                upload_jobs.create, user_id, file_id, original_filename, model_option, spool.read()
+            )
+            background_tasks.add_task(upload_jobs.run, job_id, upload_pipeline)
+            return JSONResponse(
+                status_code=202,
+                content={"job_id": job_id, "status": "queued"},
+                headers={"Location": f"/resumes/jobs/{job_id}"}
+            )
+
+        return await upload_pipeline.run(
+            source=spool,
             file_id=file_id,
             file_name=original_filename,
-            resume_text=txt,
-            feedback=llm_feedback,
-            embedding=embedding
+            file_ext=file_ext,
+            model_option=model_option,
+            user_id=user_id,
+            review_mode=review_mode
         )
-        
-        return {"extracted_text": txt, "feedback": llm_feedback}
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ExtractionQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ExtractionTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ReviewFailedError as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if spool:
+            spool.close()
+
+# Endpoint to upload a resume, streaming its progress and feedback
+@resume_router.post("/upload/stream", response_model=None)
+async def upload_resume_stream(
+    file: UploadFile = File(...),
+    model_option: str = Form("openai"),
+    user_id: Optional[str] = Form(None),
+    review_mode: str = Form(REVIEW_PARALLEL),
+    file_processing: FileProcessing = Depends(get_file_processing),
+    upload_pipeline: UploadPipeline = Depends(get_upload_pipeline),
+    ):
+    """
+    Upload a resume and stream its processing as Server-Sent Events. A "stage" event is sent for
+    each pipeline stage, a "feedback" event for each feedback category (and the general feedback)
+    as soon as it is reviewed, then a "done" event with the same result as /upload, or an "error" event.
+    
+    Args:
+        file (UploadFile): The uploaded file.
+        model_option (str): The model to use for processing the resume. Defaults to "openai".
+        user_id (str, optional): The ID of the user. Defaults to None.
+        review_mode (str): "parallel" to review each category with its own prompt, concurrently, or "single". Defaults to "parallel".
+        file_processing (FileProcessing): File processing service.
+        upload_pipeline (UploadPipeline): Extract, review, embed and save pipeline.
+    
+    Returns:
+        StreamingResponse: A text/event-stream of the upload's progress.
+    """
+    if review_mode not in REVIEW_MODES:
+        raise HTTPException(status_code=400, detail="Invalid review mode")
+    try:
+        file_id, spool = await file_processing.ingest(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def on_stage(stage: str):
+        await events.put(("stage", {"stage": stage}))
+
+    async def on_feedback(field: str, value: Any):
+        await events.put(("feedback", {"field": field, "value": value}))
+
+    async def run():
+        try:
+            result = await upload_pipeline.run(
+                source=spool,
+                file_id=file_id,
+                file_name=file.filename,
+                file_ext=file.filename.split(".")[-1],
+                model_option=model_option,
+                user_id=user_id,
+                on_stage=on_stage,
+                review_mode=review_mode,
+                on_feedback=on_feedback
+            )
+            await events.put(("done", result))
+        except Exception as e:
+            await events.put(("error", {"detail": str(e)}))
+
+    # Started here rather than when the stream is first read, so the spool is closed
+    # even if the client goes away before the stream starts, or it is never read
+    task = asyncio.create_task(run())
+    task.add_done_callback(lambda _: spool.close())
+
+    async def event_stream():
+        try:
+            while True:
+                event, data = await events.get()
+                yield f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+                if event in ("done", "error"):
+                    break
+        finally:
+            # Stop processing if the client goes away mid-stream
+            task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Endpoint to upload many resumes at once
+@resume_router.post("/upload-batch", response_model=None)
+async def upload_resume_batch(
+    files: List[UploadFile] = File(...),
+    user_id: str = Form(...),
+    model_option: str = Form("openai"),
+    review_mode: str = Form(REVIEW_SINGLE),
+    file_processing: FileProcessing = Depends(get_file_processing),
+    upload_pipeline: UploadPipeline = Depends(get_upload_pipeline),
+    ):
+    """
+    Upload many resumes at once, as separate files and/or zip archives of files.
+    
+    Args:
+        files (List[UploadFile]): The uploaded files. Zip archives are unpacked.
+        user_id (str): The ID of the user.
+        model_option (str): The model to use for processing the resumes. Defaults to "openai".
+        review_mode (str): "single" to review with one prompt, "parallel" to send one prompt per category concurrently.
+        file_processing (FileProcessing): File processing service.
+        upload_pipeline (UploadPipeline): Extract, review, embed and save pipeline.
+    
+    Returns:
+        StreamingResponse: Newline-delimited JSON with one result per file as it finishes, followed by a final "saved" result.
+    """
+    if review_mode not in REVIEW_MODES:
+        raise HTTPException(status_code=400, detail="Invalid review mode")
+    try:
+        batch = []
+        for file in files:
+            is_zip = file.filename.split(".")[-1] == "zip"
+            _, spool = await file_processing.ingest(file, max_bytes=MAX_BATCH_UPLOAD_BYTES if is_zip else MAX_UPLOAD_BYTES)
+            with spool:
+                if is_zip:
+                    batch.extend(file_processing.unpack_zip(spool, max_files=BATCH_MAX_FILES))
+                else:
+                    batch.append((file.filename, spool.read()))
+            if len(batch) > BATCH_MAX_FILES:
+                raise UploadTooLargeError(f"A batch can hold at most {BATCH_MAX_FILES} files")
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def ndjson_stream():
+        async for result in upload_pipeline.run_batch(batch, user_id=user_id, model_option=model_option, review_mode=review_mode):
+            yield json.dumps(jsonable_encoder(result)) + "\n"
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+# Endpoint to poll a background upload job
+@resume_router.get("/jobs/{job_id}", response_model=None)
+def get_upload_job(
+    job_id: str,
+    upload_jobs: UploadJobs = Depends(get_upload_jobs),
+):
+    """
+    Get the status of a background upload job.
+    
+    Args:
+        job_id (str): The ID of the job.
+    
+    Returns:
+        dict: The job status, its last completed stage and, once completed, the extracted text and LLM feedback.
+    """
+    try:
+        job = upload_jobs.get(job_id)
+    except Exception as e:
+        print(str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Endpoint to stream the progress of a background upload job
+@resume_router.get("/jobs/{job_id}/events", response_model=None)
+async def stream_upload_job(
+    job_id: str,
+    upload_jobs: UploadJobs = Depends(get_upload_jobs),
+):
+    """
+    Stream the progress of a background upload job as Server-Sent Events. An event is sent for
+    each stage (extracted, reviewed, embedded, saved) and the stream ends once the job completes or fails.
+    
+    Args:
+        job_id (str): The ID of the job.
+    
+    Returns:
+        StreamingResponse: A text/event-stream of job statuses.
+    """
+    if not await asyncio.to_thread(upload_jobs.get, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for job in upload_jobs.events(job_id):
+            yield f"event: {job.status}\ndata: {job.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
     
     
 @resume_router.post("/similar-resumes")
 async def get_similar_resumes(
     user_id: str = Form(...),
     query: str = Form(...),
+    top_k: int = Form(SIMILAR_RESUMES_TOP_K, ge=1, le=100),
+    min_score: Optional[float] = Form(None, ge=-1, le=1),
+    mode: str = Form(SEARCH_DOCUMENT),
     file_processing: FileProcessing = Depends(get_file_processing),
-    resume_repository: ResumeRepository = Depends(get_resume_repository)):
+    resume_repository: ResumeRepository = Depends(get_resume_repository),
+    similarity_engine: SimilarityEngine = Depends(get_similarity_engine)):
     """
     Get similar resumes for a given user and query.
     
     Args:
         user_id (str): The ID of the user.
         query (str): The query to search for similar resumes.
+        top_k (int): Maximum number of resumes to return.
+        min_score (float): Optional minimum cosine similarity of a returned resume.
+        mode (str): 'document' to rank by whole resumes, 'max_sim' by their best matching section chunk,
+            or 'aggregate' by the mean of their best chunks.
     
     Returns:
-        list: A list of similar resumes.
+        list: The most similar resumes with their scores, and their best matching chunk when ranked by chunks,
+            from the most to the least similar.
     """
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail="Invalid search mode")
+
     try:
-        query_embedding = file_processing.generate_embeddings(query)
-        query_embedding = np.array(query_embedding)
+        query_embedding = await file_processing.generate_embeddings_async(query)
         
-        user_resumes = resume_repository.get_user_resumes(user_id)
-        n = len(user_resumes)
-
-        similarities = []
-        for doc in user_resumes:
-            embedding = np.array(doc.embedding)
-
-            score = np.dot(query_embedding, embedding) / (np.linalg.norm(query_embedding) * np.linalg.norm(embedding))
-            heapq.heappush(similarities, (-score, doc))
-        results = []
-        for score, doc in [heapq.heappop(similarities) for _ in range(n)]:
-            results.append({
-                "id": doc.id,
-                "file_id": doc.file_id,
-                "file_name": doc.file_name,
-                "created_at": doc.created_at,
-                "embedding": doc.embedding,
-                "score": -score # negative score because heapq is a min heap
-            })
-        
-        return results
+        # Chunks are always ranked in Postgres. Either way the search runs off the event loop
+        if SIMILAR_RESUMES_BACKEND == SIMILARITY_MEMORY and mode == SEARCH_DOCUMENT:
+            # A cache miss loads every embedding of the user
+            results = await asyncio.to_thread(
+                similarity_engine.search,
+                user_id, query_embedding, top_k,
+                load=lambda: resume_repository.get_user_resumes(user_id),
+                min_score=min_score
+            )
+        else:
+            results = await asyncio.to_thread(
+                resume_repository.search_similar, user_id, query_embedding, top_k, min_score, mode
+            )
+        return [result.model_dump() for result in results]
 
     except Exception as e:
         print(str(e))
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -16,7 +16,107 @@ class Settings(BaseSettings):
     
     # LLM configuration
     LLAMA_SERVER: str = os.getenv("LLAMA_SERVER", "http://localhost:11434")
+    OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama3.1:latest")
+    OLLAMA_KEEP_ALIVE: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    OLLAMA_WARM_ON_STARTUP: bool = os.getenv("OLLAMA_WARM_ON_STARTUP", "true").lower() == "true"
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    # OpenAI-compatible server to use instead of the OpenAI API, e.g. benchmarks/fake_llm_server.py
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+    
+    # Prompt token budgets, per processing option, covering the system prompt and the document sent with it
+    PROMPT_TOKEN_BUDGET_OPENAI: int = int(os.getenv("PROMPT_TOKEN_BUDGET_OPENAI", "16000"))
+    PROMPT_TOKEN_BUDGET_OLLAMA: int = int(os.getenv("PROMPT_TOKEN_BUDGET_OLLAMA", "6000"))
+    # Chat turns kept verbatim, older turns are cut down to CHAT_COMPACT_TURN_TOKENS each
+    CHAT_RECENT_TURNS: int = int(os.getenv("CHAT_RECENT_TURNS", "6"))
+    CHAT_COMPACT_TURN_TOKENS: int = int(os.getenv("CHAT_COMPACT_TURN_TOKENS", "60"))
+    
+    # LLM response cache configuration
+    LLM_CACHE_MAX_BYTES: int = int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # 32 MB
+    LLM_CACHE_TTL_SECONDS: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))  # 7 days
+    LLM_CACHE_PERSISTENT: bool = os.getenv("LLM_CACHE_PERSISTENT", "true").lower() == "true"
+    
+    # Embedding cache configuration, embeddings do not expire as they only depend on the model and the text
+    EMBEDDING_CACHE_MAX_BYTES: int = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 64 MB
+    EMBEDDING_CACHE_PERSISTENT: bool = os.getenv("EMBEDDING_CACHE_PERSISTENT", "true").lower() == "true"
+    
+    # Embedding requests arriving within EMBEDDING_BATCH_WINDOW_MS are sent together, up to a size and token budget
+    EMBEDDING_BATCH_WINDOW_MS: float = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+    EMBEDDING_BATCH_MAX_SIZE: int = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "256"))
+    EMBEDDING_BATCH_MAX_TOKENS: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+    
+    # Provider rate limits (0 disables a limit). Calls beyond them wait in a queue for at most LLM_QUEUE_TIMEOUT_SECONDS
+    OPENAI_REQUESTS_PER_MINUTE: int = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+    OPENAI_TOKENS_PER_MINUTE: int = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "200000"))
+    OPENAI_MAX_IN_FLIGHT: int = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "32"))
+    OLLAMA_MAX_IN_FLIGHT: int = int(os.getenv("OLLAMA_MAX_IN_FLIGHT", "4"))
+    EMBEDDINGS_REQUESTS_PER_MINUTE: int = int(os.getenv("EMBEDDINGS_REQUESTS_PER_MINUTE", "3000"))
+    EMBEDDINGS_TOKENS_PER_MINUTE: int = int(os.getenv("EMBEDDINGS_TOKENS_PER_MINUTE", "1000000"))
+    EMBEDDINGS_MAX_IN_FLIGHT: int = int(os.getenv("EMBEDDINGS_MAX_IN_FLIGHT", "16"))
+    LLM_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "60"))
+    # Attempts of a call rejected with HTTP 429, with jittered exponential backoff between them
+    LLM_RATE_LIMIT_ATTEMPTS: int = int(os.getenv("LLM_RATE_LIMIT_ATTEMPTS", "4"))
+    
+    # "auto" model routing: calls kept per provider for latency percentiles, and hedging to the next
+    # provider once a request outlasts the p95 of its provider, measured over at least LLM_HEDGE_MIN_SAMPLES calls
+    LLM_LATENCY_WINDOW: int = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+    LLM_HEDGE_REQUESTS: bool = os.getenv("LLM_HEDGE_REQUESTS", "false").lower() == "true"
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    
+    # Provider health configuration
+    PROVIDER_HEALTH_INTERVAL: float = float(os.getenv("PROVIDER_HEALTH_INTERVAL", "30"))
+    PROVIDER_PROBE_TIMEOUT: float = float(os.getenv("PROVIDER_PROBE_TIMEOUT", "3"))
+    PROVIDER_FAILURE_THRESHOLD: int = int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "3"))
+    PROVIDER_RECOVERY_SECONDS: float = float(os.getenv("PROVIDER_RECOVERY_SECONDS", "30"))
+    
+    # Upload ingest configuration
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))  # 10 MB
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+    UPLOAD_SPOOL_MAX_MEMORY: int = int(os.getenv("UPLOAD_SPOOL_MAX_MEMORY", str(2 * 1024 * 1024)))
+    
+    # Batch upload configuration
+    MAX_BATCH_UPLOAD_BYTES: int = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(200 * 1024 * 1024)))  # 200 MB
+    BATCH_MAX_FILES: int = int(os.getenv("BATCH_MAX_FILES", "500"))
+    BATCH_EXTRACT_CONCURRENCY: int = int(os.getenv("BATCH_EXTRACT_CONCURRENCY", "4"))
+    BATCH_REVIEW_CONCURRENCY: int = int(os.getenv("BATCH_REVIEW_CONCURRENCY", "8"))
+    
+    # Extraction executor configuration (0 workers runs extraction on a thread instead of a process pool)
+    EXTRACTION_WORKERS: int = int(os.getenv("EXTRACTION_WORKERS", "2"))
+    EXTRACTION_MAX_QUEUE: int = int(os.getenv("EXTRACTION_MAX_QUEUE", "16"))
+    EXTRACTION_TIMEOUT_SECONDS: float = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "30"))
+    
+    # Background upload job configuration
+    UPLOAD_JOB_STALE_SECONDS: int = int(os.getenv("UPLOAD_JOB_STALE_SECONDS", "300"))
+    UPLOAD_JOB_RECOVERY_INTERVAL: int = int(os.getenv("UPLOAD_JOB_RECOVERY_INTERVAL", "60"))
+    UPLOAD_JOB_MAX_ATTEMPTS: int = int(os.getenv("UPLOAD_JOB_MAX_ATTEMPTS", "3"))
+    # Running jobs touch their row this often, so that a long stage is not mistaken for a stale job
+    UPLOAD_JOB_HEARTBEAT_SECONDS: int = int(os.getenv("UPLOAD_JOB_HEARTBEAT_SECONDS", "30"))
+    
+    # Maximum time an upload waits for another worker processing the same file
+    UPLOAD_LOCK_TIMEOUT_SECONDS: float = float(os.getenv("UPLOAD_LOCK_TIMEOUT_SECONDS", "120"))
+    
+    # Upload result store configuration
+    RESULT_STORE_MAX_ENTRIES: int = int(os.getenv("RESULT_STORE_MAX_ENTRIES", "256"))
+    
+    # Similar resume search: results returned by default, and the HNSW index on resume_embeddings.embedding.
+    # HNSW_EF_SEARCH is the candidate list of a search, raising it trades latency for recall
+    SIMILAR_RESUMES_TOP_K: int = int(os.getenv("SIMILAR_RESUMES_TOP_K", "10"))
+    HNSW_M: int = int(os.getenv("HNSW_M", "16"))
+    HNSW_EF_CONSTRUCTION: int = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+    HNSW_EF_SEARCH: int = int(os.getenv("HNSW_EF_SEARCH", "40"))
+    # The index is shared by every user, libraries of up to SIMILAR_EXACT_SCAN_MAX_ROWS vectors are ranked exactly instead
+    SIMILAR_EXACT_SCAN_MAX_ROWS: int = int(os.getenv("SIMILAR_EXACT_SCAN_MAX_ROWS", "5000"))
+    # Resumes are also embedded in chunks of whole lines following their sections, of CHUNK_MIN_CHARS to CHUNK_MAX_CHARS.
+    # Chunk rankings fetch SIMILAR_CHUNK_CANDIDATES nearest chunks per requested resume, "aggregate" averages the best CHUNK_AGGREGATE_TOP of a resume
+    CHUNK_MAX_CHARS: int = int(os.getenv("CHUNK_MAX_CHARS", "1500"))
+    CHUNK_MIN_CHARS: int = int(os.getenv("CHUNK_MIN_CHARS", "200"))
+    SIMILAR_CHUNK_CANDIDATES: int = int(os.getenv("SIMILAR_CHUNK_CANDIDATES", "8"))
+    CHUNK_AGGREGATE_TOP: int = int(os.getenv("CHUNK_AGGREGATE_TOP", "3"))
+    # "pgvector" ranks in Postgres, "memory" ranks in the process over cached per-user embedding matrices
+    SIMILAR_RESUMES_BACKEND: str = os.getenv("SIMILAR_RESUMES_BACKEND", "pgvector")
+    SIMILARITY_CACHE_MAX_BYTES: int = int(os.getenv("SIMILARITY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # 256 MB
+    SIMILARITY_CACHE_TTL_SECONDS: int = int(os.getenv("SIMILARITY_CACHE_TTL_SECONDS", "300"))
     
     # Application configuration
     APP_NAME: str = "ResumeAI Backend"
@@ -34,4 +134,66 @@ JWT_ALGORITHM = settings.JWT_ALGORITHM
 JWT_EXPIRATION_MINUTES = settings.JWT_EXPIRATION_MINUTES
 MONGO_URI = settings.MONGO_URI
 LLAMA_SERVER = settings.LLAMA_SERVER
+OLLAMA_MODEL = settings.OLLAMA_MODEL
+OLLAMA_KEEP_ALIVE = settings.OLLAMA_KEEP_ALIVE
+OLLAMA_WARM_ON_STARTUP = settings.OLLAMA_WARM_ON_STARTUP
 OPENAI_API_KEY = settings.OPENAI_API_KEY
+OPENAI_BASE_URL = settings.OPENAI_BASE_URL
+LLM_MAX_CONNECTIONS = settings.LLM_MAX_CONNECTIONS
+LLM_REQUEST_TIMEOUT = settings.LLM_REQUEST_TIMEOUT
+PROMPT_TOKEN_BUDGET_OPENAI = settings.PROMPT_TOKEN_BUDGET_OPENAI
+PROMPT_TOKEN_BUDGET_OLLAMA = settings.PROMPT_TOKEN_BUDGET_OLLAMA
+CHAT_RECENT_TURNS = settings.CHAT_RECENT_TURNS
+CHAT_COMPACT_TURN_TOKENS = settings.CHAT_COMPACT_TURN_TOKENS
+OPENAI_REQUESTS_PER_MINUTE = settings.OPENAI_REQUESTS_PER_MINUTE
+OPENAI_TOKENS_PER_MINUTE = settings.OPENAI_TOKENS_PER_MINUTE
+OPENAI_MAX_IN_FLIGHT = settings.OPENAI_MAX_IN_FLIGHT
+OLLAMA_MAX_IN_FLIGHT = settings.OLLAMA_MAX_IN_FLIGHT
+EMBEDDINGS_REQUESTS_PER_MINUTE = settings.EMBEDDINGS_REQUESTS_PER_MINUTE
+EMBEDDINGS_TOKENS_PER_MINUTE = settings.EMBEDDINGS_TOKENS_PER_MINUTE
+EMBEDDINGS_MAX_IN_FLIGHT = settings.EMBEDDINGS_MAX_IN_FLIGHT
+LLM_QUEUE_TIMEOUT_SECONDS = settings.LLM_QUEUE_TIMEOUT_SECONDS
+LLM_RATE_LIMIT_ATTEMPTS = settings.LLM_RATE_LIMIT_ATTEMPTS
+LLM_LATENCY_WINDOW = settings.LLM_LATENCY_WINDOW
+LLM_HEDGE_REQUESTS = settings.LLM_HEDGE_REQUESTS
+LLM_HEDGE_MIN_SAMPLES = settings.LLM_HEDGE_MIN_SAMPLES
+LLM_CACHE_MAX_BYTES = settings.LLM_CACHE_MAX_BYTES
+LLM_CACHE_TTL_SECONDS = settings.LLM_CACHE_TTL_SECONDS
+LLM_CACHE_PERSISTENT = settings.LLM_CACHE_PERSISTENT
+EMBEDDING_CACHE_MAX_BYTES = settings.EMBEDDING_CACHE_MAX_BYTES
+EMBEDDING_CACHE_PERSISTENT = settings.EMBEDDING_CACHE_PERSISTENT
+EMBEDDING_BATCH_WINDOW_MS = settings.EMBEDDING_BATCH_WINDOW_MS
+EMBEDDING_BATCH_MAX_SIZE = settings.EMBEDDING_BATCH_MAX_SIZE
+EMBEDDING_BATCH_MAX_TOKENS = settings.EMBEDDING_BATCH_MAX_TOKENS
+PROVIDER_HEALTH_INTERVAL = settings.PROVIDER_HEALTH_INTERVAL
+PROVIDER_PROBE_TIMEOUT = settings.PROVIDER_PROBE_TIMEOUT
+PROVIDER_FAILURE_THRESHOLD = settings.PROVIDER_FAILURE_THRESHOLD
+PROVIDER_RECOVERY_SECONDS = settings.PROVIDER_RECOVERY_SECONDS
+MAX_UPLOAD_BYTES = settings.MAX_UPLOAD_BYTES
+UPLOAD_CHUNK_SIZE = settings.UPLOAD_CHUNK_SIZE
+UPLOAD_SPOOL_MAX_MEMORY = settings.UPLOAD_SPOOL_MAX_MEMORY
+MAX_BATCH_UPLOAD_BYTES = settings.MAX_BATCH_UPLOAD_BYTES
+BATCH_MAX_FILES = settings.BATCH_MAX_FILES
+BATCH_EXTRACT_CONCURRENCY = settings.BATCH_EXTRACT_CONCURRENCY
+BATCH_REVIEW_CONCURRENCY = settings.BATCH_REVIEW_CONCURRENCY
+EXTRACTION_WORKERS = settings.EXTRACTION_WORKERS
+EXTRACTION_MAX_QUEUE = settings.EXTRACTION_MAX_QUEUE
+EXTRACTION_TIMEOUT_SECONDS = settings.EXTRACTION_TIMEOUT_SECONDS
+UPLOAD_JOB_STALE_SECONDS = settings.UPLOAD_JOB_STALE_SECONDS
+UPLOAD_JOB_RECOVERY_INTERVAL = settings.UPLOAD_JOB_RECOVERY_INTERVAL
+UPLOAD_JOB_MAX_ATTEMPTS = settings.UPLOAD_JOB_MAX_ATTEMPTS
+UPLOAD_JOB_HEARTBEAT_SECONDS = settings.UPLOAD_JOB_HEARTBEAT_SECONDS
+UPLOAD_LOCK_TIMEOUT_SECONDS = settings.UPLOAD_LOCK_TIMEOUT_SECONDS
+RESULT_STORE_MAX_ENTRIES = settings.RESULT_STORE_MAX_ENTRIES
+SIMILAR_RESUMES_TOP_K = settings.SIMILAR_RESUMES_TOP_K
+HNSW_M = settings.HNSW_M
+HNSW_EF_CONSTRUCTION = settings.HNSW_EF_CONSTRUCTION
+HNSW_EF_SEARCH = settings.HNSW_EF_SEARCH
+SIMILAR_EXACT_SCAN_MAX_ROWS = settings.SIMILAR_EXACT_SCAN_MAX_ROWS
+SIMILAR_RESUMES_BACKEND = settings.SIMILAR_RESUMES_BACKEND
+CHUNK_MAX_CHARS = settings.CHUNK_MAX_CHARS
+CHUNK_MIN_CHARS = settings.CHUNK_MIN_CHARS
+SIMILAR_CHUNK_CANDIDATES = settings.SIMILAR_CHUNK_CANDIDATES
+CHUNK_AGGREGATE_TOP = settings.CHUNK_AGGREGATE_TOP
+SIMILARITY_CACHE_MAX_BYTES = settings.SIMILARITY_CACHE_MAX_BYTES
+SIMILARITY_CACHE_TTL_SECONDS = settings.SIMILARITY_CACHE_TTL_SECONDS
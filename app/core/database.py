@@ -1,8 +1,21 @@
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from threading import Lock
 import os
 
+from app.core.config import HNSW_M, HNSW_EF_CONSTRUCTION
+from app.core.models.sql_models import Base
+
+# Serializes schema changes between workers starting at the same time, and lets one of them build the vector indexes
+SCHEMA_LOCK_ID = 7_204_113_901
+VECTOR_INDEX_LOCK_ID = 7_204_113_902
+# Tables with an HNSW index for cosine distance searches on their embedding column
+VECTOR_INDEX_TABLES = ("resume_embeddings", "resume_chunk_embeddings")
+# Columns added to tables that already exist in deployed databases, which create_all leaves alone
+ADDED_COLUMNS = (
+    ("resume_feedback", "annotations", "JSONB"),
+)
 
 
 class Database:
@@ -10,7 +23,10 @@ class Database:
     _lock = Lock()
     _initialized = False
     _engine = None
+    _lock_engine = None
     _sessionmaker = None
+    # Whether the vector extension can keep scanning an HNSW index until a filtered query has enough rows (pgvector 0.8+)
+    hnsw_iterative_scan = False
     
     def __new__(cls):
         with cls._lock:
@@ -40,11 +56,23 @@ class Database:
                 connect_args={"sslmode": "require"}                
             )
             
+            # Connections held for as long as a lock is, outside the pool the sessions share
+            self._lock_engine = create_engine(
+                db_url,
+                poolclass=NullPool,
+                isolation_level="AUTOCOMMIT",
+                connect_args={"sslmode": "require"}
+            )
+            
             self._sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=self._engine)
             self._initialized = True
             
             with self._engine.connect() as conn:
+                conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": SCHEMA_LOCK_ID})
                 conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+                self.__migrate(conn)
+                version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+                self.hnsw_iterative_scan = tuple(int(part) for part in version.split(".")[:2]) >= (0, 8)
                 conn.commit()
 
             
@@ -53,16 +81,61 @@ class Database:
             raise Exception(f"Failed to initialize database: {str(e)}")
         
         
+    def __migrate(self, conn):
+        """ Bring the schema up to date: create the tables that do not exist yet and add missing columns """
+        Base.metadata.create_all(conn, checkfirst=True)
+        for table, column, column_type in ADDED_COLUMNS:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+        
+    def create_vector_indexes(self):
+        """
+        Build the missing HNSW indexes on resume and chunk embeddings. They are built concurrently, so
+        inserts are not blocked while a large table is indexed, and by one worker only, the others return
+        right away. An interrupted concurrent build leaves an invalid index behind, which is built again.
+        Meant to run in the background, errors are logged.
+        """
+        try:
+            with self.get_lock_connection() as conn:
+                if not conn.execute(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": VECTOR_INDEX_LOCK_ID}).scalar():
+                    return
+                try:
+                    for table in VECTOR_INDEX_TABLES:
+                        index = f"{table}_embedding_hnsw_idx"
+                        valid = conn.execute(
+                            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:index)"),
+                            {"index": index}
+                        ).scalar()
+                        if valid:
+                            continue
+                        if valid is not None:
+                            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index}"))
+                        conn.execute(text(
+                            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} "
+                            f"ON {table} USING hnsw (embedding vector_cosine_ops) "
+                            f"WITH (m = {int(HNSW_M)}, ef_construction = {int(HNSW_EF_CONSTRUCTION)})"
+                        ))
+                finally:
+                    conn.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": VECTOR_INDEX_LOCK_ID})
+        except Exception as e:
+            print("Vector index build error: " + str(e))
+        
     def get_session(self):
         """ Get a database session """
         if not self._initialized:
             raise Exception("Database is not initialized")
         return self._sessionmaker()
+    
+    def get_lock_connection(self):
+        """ Get a dedicated autocommit connection, not taken from the session pool, for locks held across long work """
+        if not self._initialized:
+            raise Exception("Database is not initialized")
+        return self._lock_engine.connect()
         
     def close(self):
         """ Close the database connection """
         if self._engine:
             self._engine.dispose()
+            self._lock_engine.dispose()
             self._initialized = False
             
 database = Database()
\ No newline at end of file
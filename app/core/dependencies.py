@@ -1,8 +1,15 @@
 from app.core.database import Database, database    
 from app.services.file_processing import FileProcessing
+from app.services.job_repository import JobRepository
 from app.services.process_llm import ProcessLLM
+from app.services.prompt_assembler import PromptAssembler, prompt_assembler
 from app.services.resume_repository import ResumeRepository
+from app.services.result_store import ResultStore
 from app.services.security_repository import SecurityRepository
+from app.services.similarity_engine import SimilarityEngine, similarity_engine
+from app.services.upload_jobs import UploadJobs
+from app.services.upload_pipeline import UploadPipeline
+from fastapi import Depends
 from functools import lru_cache
 
 
@@ -21,11 +28,46 @@ def get_security_repository():
     db = get_database()
     return SecurityRepository(db)
 
+def get_result_store(resume_repository: ResumeRepository = Depends(get_resume_repository)) -> ResultStore:
+    """Get the upload result store instance"""
+    return ResultStore(resume_repository)
+
 def get_process_llm() -> ProcessLLM:
     """Get the LLM processing instance"""
     return ProcessLLM()
 
+def get_prompt_assembler() -> PromptAssembler:
+    """Get the prompt assembler instance"""
+    return prompt_assembler
+
+def get_similarity_engine() -> SimilarityEngine:
+    """Get the in-process similarity engine instance"""
+    return similarity_engine
+
 def get_file_processing() -> FileProcessing:
     """Get the file processing instance"""
     return FileProcessing()
 
+def get_upload_pipeline(
+    resume_repository: ResumeRepository = Depends(get_resume_repository),
+    file_processing: FileProcessing = Depends(get_file_processing),
+    process_llm: ProcessLLM = Depends(get_process_llm),
+    result_store: ResultStore = Depends(get_result_store)
+) -> UploadPipeline:
+    """Get the upload pipeline instance"""
+    return UploadPipeline(resume_repository, file_processing, process_llm, result_store)
+
+def build_upload_pipeline() -> UploadPipeline:
+    """Build an upload pipeline outside of a request, e.g. to resume upload jobs"""
+    resume_repository = get_resume_repository()
+    return UploadPipeline(resume_repository, get_file_processing(), get_process_llm(), ResultStore(resume_repository))
+
+def get_job_repository() -> JobRepository:
+    """Get the upload job repository instance"""
+    db = get_database()
+    return JobRepository(db)
+
+@lru_cache()
+def get_upload_jobs() -> UploadJobs:
+    """Get the upload job runner shared by the whole process"""
+    return UploadJobs(get_job_repository())
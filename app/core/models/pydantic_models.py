@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional, Any
 from datetime import datetime
 from pydantic import BaseModel, ConfigDict
 
@@ -23,6 +23,75 @@ class Feedback(BaseModel):
     overall_score: float
     general_feedback: str
 
+@config
+class Annotation(BaseModel):
+    start: int
+    end: int
+    category: str
+    suggestion_index: int
+
+@config
+class StoredReview(BaseModel):
+    extracted_text: str
+    annotations: List[Annotation]
+    feedback: Feedback
+    embedding: List[float]
+
+@config
+class UploadJobStatus(BaseModel):
+    job_id: str
+    file_id: str
+    file_name: str
+    status: str
+    stage: Optional[str] = None
+    error: Optional[str] = None
+    result: Optional[Any] = None
+
+@config
+class PromptUsage(BaseModel):
+    budget: int
+    total: int
+    system: int
+    document: int
+    feedback: int = 0
+    history: int = 0
+    message: int = 0
+    document_truncated: bool = False
+    compacted_turns: int = 0
+    dropped_turns: int = 0
+
+@config
+class ProviderHealthStatus(BaseModel):
+    provider: str
+    state: str
+    healthy: Optional[bool] = None
+    consecutive_failures: int = 0
+    latency_ms: Optional[float] = None
+    last_checked: Optional[float] = None
+    last_error: Optional[str] = None
+
+@config
+class RateLimitStats(BaseModel):
+    provider: str
+    in_flight: int
+    queued: int
+    max_in_flight: int
+    requests_per_minute: int
+    tokens_per_minute: int
+    admitted: int = 0
+    timeouts: int = 0
+    rate_limited: int = 0
+    mean_wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+
+@config
+class BackendLatency(BaseModel):
+    provider: str
+    samples: int
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    error_rate: float = 0.0
+
 # Chat Models
 @config
 class Message(BaseModel):
@@ -54,6 +123,23 @@ class SimpleResume(BaseModel):
     file_name: str
     created_at: datetime
     embedding: List[float]
+
+@config
+class ResumeChunk(BaseModel):
+    # Header the chunk falls under, and its span over the resume text
+    section: str
+    start: int
+    end: int
+
+@config
+class SimilarResume(BaseModel):
+    id: str
+    file_id: str
+    file_name: str
+    created_at: datetime
+    score: float
+    # Best matching chunk, when ranked by chunks
+    match: Optional[ResumeChunk] = None
     
 @config
 class UserPreferences(BaseModel):
@@ -1,6 +1,6 @@
 import os
 import uuid
-from sqlalchemy import Column, String, DateTime, text, Text, Float, ForeignKey, UUID
+from sqlalchemy import Column, String, DateTime, text, Text, Float, ForeignKey, UUID, Integer, LargeBinary
 from sqlalchemy import create_engine
 from sqlalchemy.dialects.postgresql import JSONB
 # from sqlalchemy.dialects.sqlite import JSON
@@ -54,12 +54,18 @@ class Resume(Base):
                             uselist=False,
                             cascade="all, delete-orphan",
                             single_parent=True)
+    chunk_embeddings = relationship("ResumeChunkEmbedding",
+                            back_populates="resume",
+                            cascade="all, delete-orphan",
+                            order_by="ResumeChunkEmbedding.chunk_index")
     
 class ResumeFeedback(Base):
     __tablename__ = 'resume_feedback'
     
     id = Column(UUID, ForeignKey('resumes.id', ondelete='CASCADE'), primary_key=True)
     feedback = Column(JSONB)
+    # Highlight spans over resumes.resume_text, as [start, end, category, suggestion_index] lists
+    annotations = Column(JSONB)
 
     resume = relationship("Resume",
                             back_populates="feedback",
@@ -91,6 +97,71 @@ class ResumeEmbedding(Base):
                             cascade="all, delete-orphan",
                             single_parent=True)
 
+class ResumeChunkEmbedding(Base):
+    __tablename__ = 'resume_chunk_embeddings'
+    
+    resume_id = Column(UUID, ForeignKey('resumes.id', ondelete='CASCADE'), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    # Header the chunk falls under, and its span over resumes.resume_text
+    section = Column(Text)
+    start_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    embedding = Column(Vector(1536))
+
+    resume = relationship("Resume", back_populates="chunk_embeddings")
+
+class ReviewResult(Base):
+    __tablename__ = 'review_results'
+    
+    file_id = Column(UUID(as_uuid=True), primary_key=True)
+    model_option = Column(String, primary_key=True)
+    prompt_version = Column(String, primary_key=True)
+    extracted_text = Column(Text)
+    annotations = Column(JSONB)
+    feedback = Column(JSONB)
+    embedding = Column(Vector(1536))
+    created_at = Column(DateTime(timezone=True), server_default=text('CURRENT_TIMESTAMP'))
+
+class UploadJob(Base):
+    __tablename__ = 'upload_jobs'
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('auth_users.user_id'), nullable=True)
+    file_id = Column(UUID(as_uuid=True), nullable=False)
+    file_name = Column(Text, nullable=False)
+    model_option = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    stage = Column(String)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Raw upload, kept until the job finishes so that it can be resumed after a restart
+    payload = Column(LargeBinary)
+    result = Column(JSONB)
+    created_at = Column(DateTime(timezone=True), server_default=text('CURRENT_TIMESTAMP'))
+    updated_at = Column(DateTime(timezone=True), server_default=text('CURRENT_TIMESTAMP'))
+
+class LLMResponse(Base):
+    __tablename__ = 'llm_responses'
+    
+    # SHA-256 of the model, prompt, document and generation settings
+    key = Column(String(64), primary_key=True)
+    model = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=text('CURRENT_TIMESTAMP'))
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+class CachedEmbedding(Base):
+    __tablename__ = 'embedding_cache'
+    
+    # SHA-256 of the embedding model and the normalized text
+    key = Column(String(64), primary_key=True)
+    model = Column(String, nullable=False)
+    # float32 values, little-endian
+    embedding = Column(LargeBinary, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=text('CURRENT_TIMESTAMP'))
+
 
 # engine = create_engine(DATABASE_URL)
 # Base.metadata.create_all(bind=engine)
@@ -0,0 +1,79 @@
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.services.llm_prompts import CATEGORY_PROMPTS
+from app.services.process_llm import ProcessLLM
+from app.services.prompt_assembler import PromptAssembler, prompt_assembler
+
+# Review modes: one prompt for the whole review, or one prompt per category sent concurrently
+REVIEW_SINGLE = "single"
+REVIEW_PARALLEL = "parallel"
+REVIEW_MODES = (REVIEW_SINGLE, REVIEW_PARALLEL)
+
+
+class CategoryReview:
+    """
+    Reviews a resume with one smaller prompt per Feedback field, all sent at once.
+
+    The parts are merged into the same raw feedback BASE_PROMPT produces, so the result goes
+    through DataPrep.prep_review unchanged. Each prompt repeats the resume, so this costs more
+    input tokens, but the wait is the slowest part instead of the whole review.
+    """
+
+    def __init__(self,
+        process_llm: ProcessLLM,
+        assembler: PromptAssembler = prompt_assembler,
+        prompts: Dict[str, str] = CATEGORY_PROMPTS
+    ):
+        self.process_llm = process_llm
+        self.assembler = assembler
+        self.prompts = prompts
+
+    async def stream(self, resume_text: str, model: str) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Review every part concurrently, yielding them in the order they complete
+        Args:
+            resume_text: The extracted resume text
+            model: 'ollama' or 'openai'
+        Returns:
+            AsyncIterator[Tuple[str, Any]]: (Feedback field, raw LLM response) pairs
+        """
+        async def review(part: str, prompt: str):
+            document, _ = self.assembler.review(resume_text, model, prompt)
+            return part, await self.process_llm.process(document, model=model, prompt=prompt)
+
+        tasks = [asyncio.create_task(review(part, prompt)) for part, prompt in self.prompts.items()]
+        try:
+            for next_part in asyncio.as_completed(tasks):
+                yield await next_part
+        finally:
+            # Stop the other parts if the caller stops early, e.g. after a failed part
+            for task in tasks:
+                task.cancel()
+
+    async def review(self,
+        resume_text: str,
+        model: str,
+        on_part: Optional[Callable[[str, Any], Awaitable[None]]] = None
+    ) -> dict:
+        """
+        Review every part concurrently and merge them
+        Args:
+            resume_text: The extracted resume text
+            model: 'ollama' or 'openai'
+            on_part: Optional coroutine called with each Feedback field and its raw feedback as soon as it completes
+        Returns:
+            dict: Raw feedback in the shape BASE_PROMPT asks for, or the error of the first part that failed
+        """
+        feedback = {}
+        async with aclosing(self.stream(resume_text, model)) as parts:
+            async for part, result in parts:
+                if not isinstance(result, dict) or "error" in result:
+                    return result if isinstance(result, dict) else {"error": f"Unexpected {part} response"}
+
+                value = result.get(part, "") if part == "general_feedback" else result
+                feedback[part] = value
+                if on_part:
+                    await on_part(part, value)
+        return feedback
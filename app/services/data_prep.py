@@ -1,60 +1,163 @@
 
 import re
-from typing import Tuple
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.config import CHUNK_MAX_CHARS, CHUNK_MIN_CHARS
+from app.core.models.pydantic_models import Annotation, Feedback, FeedbackCategory, ResumeChunk
+
+# Line classification patterns used by clean_text
+BULLET_POINT = re.compile(r"^\s*[\*\+\-\•]\s+")
+SENTENCE_END = re.compile(r"[.:!?…\"\')\]]\s*$")
+POSSIBLE_HEADER = re.compile(r"^[A-Z][\w\s,&\-()]{0,40}$")
+
+# Feedback categories, in the order their suggestions take priority when highlights overlap
+CATEGORIES = ["structure_organization", "clarity_conciseness", "grammar_spelling", "impact_accomplishments", "ats_readability"]
+HTML_COLORS = {
+    "structure_organization": "bg-green-300", 
+    "clarity_conciseness": "bg-yellow-400", 
+    "grammar_spelling": "bg-red-300", 
+    "impact_accomplishments": "bg-blue-300", 
+    "ats_readability": "bg-purple-300"
+}
+
+
+class MatchAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of patterns, used to find every occurrence of
+    every pattern in a single pass over the text.
+    Patterns are identified by their position in the list they were built from.
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for index, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(index)
+
+        # Breadth-first so that the failure state of every node is finished before its children
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """
+        Yield (start, end, pattern index) for every occurrence of every pattern in the text,
+        ordered by end position
+        """
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in out[state]:
+                yield position + 1 - len(patterns[index]), position + 1, index
 
-from app.core.models.pydantic_models import Feedback, FeedbackCategory
 
 class DataPrep:
-    def clean_text(text:str) -> str:
-        """ Clean text after being extracted from the file """
-        lines = text.split("\n")
-        cleaned = []
-        buffer = ""
+    def clean_lines(lines: Iterable[str]) -> Iterator[str]:
+        """ Clean a stream of extracted lines in a single pass, yielding one cleaned line at a time """
+        buffer: List[str] = []
         
-        bullet_point = re.compile(r"^\s*[\*\+\-\•]\s+")
-        sentence_end = re.compile(r"[.:!?…\"\')\]]\s*$")
-        possible_headers = re.compile(r"^[A-Z][\w\s,&\-()]{0,40}$")
-        print(lines)
-        for i, line in enumerate(lines):
-            print(line, end=" ")
-            
+        for line in lines:
             line = line.strip()
             if not line:
                 continue
                 
-            if bullet_point.match(line):
-                print("bullet point")
+            if BULLET_POINT.match(line):
                 if buffer:
-                    cleaned.append(buffer.strip())
-                buffer = "*" + line[1:]
+                    yield " ".join(buffer).strip()
+                buffer = ["*" + line[1:]]
                 continue
                 
-            if sentence_end.search(line):
-                print("sentence end")
-                buffer += " " + line
-                cleaned.append(buffer.strip())
-                buffer = ""
+            if SENTENCE_END.search(line):
+                buffer.append(line)
+                yield " ".join(buffer).strip()
+                buffer = []
                 continue
             
-            if possible_headers.match(line):
-                print("header")
+            if POSSIBLE_HEADER.match(line):
                 if buffer:
-                    cleaned.append(buffer.strip())
-                cleaned.append(line)
-                buffer = ""
+                    yield " ".join(buffer).strip()
+                yield line
+                buffer = []
                 continue
             
-            if not buffer:
-                print("buffer")
-                buffer = line
-                continue
-            
-            buffer += " " + line
+            buffer.append(line)
             
         if buffer:
-            cleaned.append(buffer.strip())
-        
-        return "\n".join(cleaned)
+            yield " ".join(buffer).strip()
+
+    def clean_text(text:str) -> str:
+        """ Clean text after being extracted from the file """
+        return "\n".join(DataPrep.clean_lines(text.split("\n")))
+
+    def is_header(line: str) -> bool:
+        """ Whether a stripped line is a header, as clean_lines classifies it """
+        return not BULLET_POINT.match(line) and not SENTENCE_END.search(line) and bool(POSSIBLE_HEADER.match(line))
+
+    def chunk_sections(text: str, max_chars: int = CHUNK_MAX_CHARS, min_chars: int = CHUNK_MIN_CHARS) -> List[ResumeChunk]:
+        """
+        Split a resume into chunks of whole lines following its sections, as spans over the text.
+        A header starts a new chunk once the current one holds min_chars, so that short headers stay
+        with what follows them, and a chunk ends before it would grow past max_chars. A single line
+        longer than max_chars is cut between words.
+        """
+        chunks: List[ResumeChunk] = []
+        section = ""
+        start: Optional[int] = None
+        end = 0
+        position = 0
+
+        for line in text.split("\n"):
+            line_start = position + len(line) - len(line.lstrip())
+            line_end = position + len(line.rstrip())
+            position += len(line) + 1
+            if line_start >= line_end:
+                continue
+
+            header = DataPrep.is_header(text[line_start:line_end])
+            if start is not None and ((header and end - start >= min_chars) or line_end - start > max_chars):
+                chunks.append(ResumeChunk(section=section, start=start, end=end))
+                start = None
+            if start is None:
+                start = line_start
+                if header:
+                    section = text[line_start:line_end]
+
+            while line_end - start > max_chars:
+                cut = text.rfind(" ", start + 1, start + max_chars)
+                cut = cut if cut > start else start + max_chars
+                chunks.append(ResumeChunk(section=section, start=start, end=cut))
+                start = cut + 1 if text[cut] == " " else cut
+            end = line_end
+
+        if start is not None:
+            chunks.append(ResumeChunk(section=section, start=start, end=end))
+        return chunks
     
     def highlight_text(text: str, match: str, color: str) -> str:
         """ Highlight text in the document """
@@ -62,47 +165,142 @@ class DataPrep:
             return text
         
         return text.replace(match, "<mark class='" + color + "'>" + match + "</mark>")
-    
-    
-    def prep_output(text: str, feedback: dict) -> Tuple[str, Feedback]:
-        """ Prepare output package to be delivered to frontend """
-        categories = ["structure_organization", "clarity_conciseness", "grammar_spelling", "impact_accomplishments", "ats_readability"]
-        html_colors = {
-            "structure_organization": "bg-green-300", 
-            "clarity_conciseness": "bg-yellow-400", 
-            "grammar_spelling": "bg-red-300", 
-            "impact_accomplishments": "bg-blue-300", 
-            "ats_readability": "bg-purple-300"
-        }
+
+    def select_matches(text: str, patterns: List[str]) -> List[Tuple[int, int, int]]:
+        """
+        Find the non-overlapping occurrences of many patterns in the document in a single pass.
+        Overlaps are resolved deterministically: the leftmost match wins, then the longest,
+        then the pattern listed first.
+        Args:
+            text: The document text
+            patterns: Patterns to look for, in priority order
+        Returns:
+            List[Tuple[int, int, int]]: (start, end, pattern index) of every selected match, in text order
+        """
+        occurrences = sorted(
+            MatchAutomaton(patterns).find_all(text),
+            key=lambda occurrence: (occurrence[0], -(occurrence[1] - occurrence[0]), occurrence[2])
+        )
+
+        selected = []
+        position = 0
+        for start, end, index in occurrences:
+            if start < position:
+                continue
+            selected.append((start, end, index))
+            position = end
+        return selected
+
+    def render_marks(text: str, spans: Iterable[Tuple[int, int, str]]) -> str:
+        """ Wrap each non-overlapping (start, end, color) span of the text, in text order, in a <mark> tag """
+        parts = []
+        position = 0
+        for start, end, color in spans:
+            parts.append(text[position:start])
+            parts.append("<mark class='" + color + "'>" + text[start:end] + "</mark>")
+            position = end
+        parts.append(text[position:])
+
+        return "".join(parts)
+
+    def highlight_matches(text: str, matches: List[Tuple[str, str]]) -> str:
+        """
+        Highlight many matches in the document in a single pass.
+        Overlapping matches never nest, see select_matches for how they are resolved.
+        Args:
+            text: The document text
+            matches: List of (match, color) tuples, in priority order
+        Returns:
+            str: The text with every selected match wrapped in a <mark> tag
+        """
+        # The first listed color wins for a match string listed more than once
+        colors: Dict[str, str] = {}
+        for match, color in matches:
+            if match and match not in colors:
+                colors[match] = color
+        if not colors:
+            return text
+
+        patterns = list(colors)
+        return DataPrep.render_marks(text, (
+            (start, end, colors[patterns[index]]) for start, end, index in DataPrep.select_matches(text, patterns)
+        ))
+
+    def annotate(text: str, feedback: dict) -> List[Annotation]:
+        """
+        Locate the match of every suggestion in the document
+        Args:
+            text: The document text
+            feedback: Raw LLM feedback, with a "match" for each suggestion
+        Returns:
+            List[Annotation]: One span per highlighted occurrence, in text order
+        """
+        patterns = []
+        owners = []
+        for category in CATEGORIES:
+            for suggestion_index, suggestion in enumerate(feedback[category]["suggestions"]):
+                # The first suggestion with a given match owns it
+                if suggestion["match"] and suggestion["match"] not in patterns:
+                    patterns.append(suggestion["match"])
+                    owners.append((category, suggestion_index))
+
+        return [
+            Annotation(start=start, end=end, category=owners[index][0], suggestion_index=owners[index][1])
+            for start, end, index in DataPrep.select_matches(text, patterns)
+        ]
+
+    def render_html(text: str, annotations: List[Annotation]) -> str:
+        """ Render annotations as <mark> tags colored by category """
+        return DataPrep.render_marks(text, (
+            (annotation.start, annotation.end, HTML_COLORS[annotation.category]) for annotation in annotations
+        ))
+
+    def pack_annotations(annotations: List[Annotation]) -> List[list]:
+        """ Compact form of annotations for storage: [start, end, category, suggestion_index] lists """
+        return [[annotation.start, annotation.end, annotation.category, annotation.suggestion_index] for annotation in annotations]
+
+    def unpack_annotations(packed: Optional[List[list]]) -> List[Annotation]:
+        """ Inverse of pack_annotations, rows stored before annotations existed have none """
+        return [
+            Annotation(start=start, end=end, category=category, suggestion_index=suggestion_index)
+            for start, end, category, suggestion_index in packed or []
+        ]
+
+    def prep_category(category: dict) -> FeedbackCategory:
+        """ Turn the raw LLM feedback of one category into a FeedbackCategory, keeping only the suggestion texts """
+        return FeedbackCategory(
+            score=float(category.get("score")),
+            strengths=category.get("strengths"),
+            weaknesses=category.get("weaknesses"),
+            suggestions=[suggestion["text"] for suggestion in category["suggestions"]]
+        )
+
+    def prep_review(text: str, feedback: dict) -> Tuple[Optional[Feedback], List[Annotation]]:
+        """
+        Turn raw LLM feedback into the Feedback delivered to the frontend and the highlight
+        annotations over the unmodified text
+        Returns:
+            Tuple[Optional[Feedback], List[Annotation]]: The feedback and annotations, or (None, []) if the feedback is malformed
+        """
         formatted_feedback = {}
         overall_score = 0
         try:
-            for category in categories:
-                suggestions = []
-                for suggestion in feedback[category]["suggestions"]:
-
-                    suggestions.append(suggestion["text"])
-                    text = DataPrep.highlight_text(
-                        text = text,
-                        match = suggestion["match"],
-                        color = html_colors[category],
-                    )
-                score = float(feedback[category].get("score"))
-                formatted_feedback[category] = FeedbackCategory(
-                    score=score,
-                    strengths=feedback[category].get("strengths"),
-                    weaknesses=feedback[category].get("weaknesses"),
-                    suggestions=suggestions
-                )
-
-                overall_score += score
-            
-            formatted_feedback["overall_score"] = round(overall_score / len(categories), 2)
+            for category in CATEGORIES:
+                formatted_feedback[category] = DataPrep.prep_category(feedback[category])
+                overall_score += formatted_feedback[category].score
+
+            formatted_feedback["overall_score"] = round(overall_score / len(CATEGORIES), 2)
             formatted_feedback["general_feedback"] = feedback.get("general_feedback")
-            formatted_feedback = Feedback(**formatted_feedback)
 
-            return text, formatted_feedback
+            return Feedback(**formatted_feedback), DataPrep.annotate(text, feedback)
         except Exception as e:
             print("Error preparing output: " + str(e))
+            return None, []
+
+    def prep_output(text: str, feedback: dict) -> Tuple[str, Feedback]:
+        """ Prepare output package to be delivered to frontend, with the highlights rendered into the text """
+        formatted_feedback, annotations = DataPrep.prep_review(text, feedback)
+        if formatted_feedback is None:
             return text, None
-            
+
+        return DataPrep.render_html(text, annotations), formatted_feedback
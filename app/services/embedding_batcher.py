@@ -0,0 +1,125 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from app.core.config import EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_BATCH_MAX_TOKENS
+
+# Sends the texts of a batch, with their total tokens, in one embeddings call
+Flush = Callable[[List[str], int], Awaitable[List[List[float]]]]
+
+
+class PendingBatch:
+    """ Texts waiting to be embedded together, with the future of each distinct text """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, flush: Flush):
+        self.loop = loop
+        self.flush = flush
+        self.futures: Dict[str, asyncio.Future] = {}
+        self.tokens = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces the embedding requests of concurrent callers into batched embeddings calls.
+
+    The first request for a model opens a batch that is sent window_ms later, or as soon as
+    it holds max_batch texts. A request that would take the batch past max_tokens sends it
+    first and opens the next one. The same text requested twice within a batch is embedded
+    once. Every caller gets its own embedding, or the error of the whole batch.
+    """
+
+    def __init__(self,
+        window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+        max_batch: int = EMBEDDING_BATCH_MAX_SIZE,
+        max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS
+    ):
+        self.window = window_ms / 1000
+        self.max_batch = max(max_batch, 1)
+        self.max_tokens = max_tokens
+        self._pending: Dict[str, PendingBatch] = {}
+        self._sending: Set[asyncio.Task] = set()
+        self._requests = 0
+        self._batches = 0
+        self._texts = 0
+        self._largest = 0
+
+    async def embed(self, model: str, text: str, tokens: int, flush: Flush) -> List[float]:
+        """
+        Embed a text as part of the next batch for its model
+        Args:
+            model: Name of the embedding model, requests are only batched with the same model
+            text: Text to embed
+            tokens: Estimated tokens of the text, counted against max_tokens
+            flush: Sends a batch, taken from the request that opens it
+        Returns:
+            The embedding of the text
+        """
+        loop = asyncio.get_running_loop()
+        self._requests += 1
+
+        batch = self._pending.get(model)
+        if batch is not None and batch.loop is not loop:
+            # Left behind by another event loop, it will never be sent from this one
+            batch = None
+        if batch is not None and text not in batch.futures and self.max_tokens and batch.tokens + tokens > self.max_tokens:
+            self.__send(model, batch)
+            batch = None
+        if batch is None:
+            batch = PendingBatch(loop, flush)
+            self._pending[model] = batch
+            batch.timer = loop.call_later(self.window, self.__send, model, batch)
+
+        future = batch.futures.get(text)
+        if future is None:
+            future = loop.create_future()
+            batch.futures[text] = future
+            batch.tokens += tokens
+            if len(batch.futures) >= self.max_batch:
+                self.__send(model, batch)
+
+        # A cancelled caller must not cancel the result other callers of the same text wait for
+        return await asyncio.shield(future)
+
+    def __send(self, model: str, batch: PendingBatch):
+        if self._pending.get(model) is batch:
+            del self._pending[model]
+        if batch.timer is not None:
+            batch.timer.cancel()
+            batch.timer = None
+        if not batch.futures or all(future.done() for future in batch.futures.values()):
+            return
+        task = batch.loop.create_task(self.__flush(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def __flush(self, batch: PendingBatch):
+        texts = list(batch.futures)
+        self._batches += 1
+        self._texts += len(texts)
+        self._largest = max(self._largest, len(texts))
+        try:
+            embeddings = await batch.flush(texts, batch.tokens)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        except Exception as e:
+            for future in batch.futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for text, embedding in zip(texts, embeddings):
+            future = batch.futures[text]
+            if not future.done():
+                future.set_result(embedding)
+
+    def stats(self) -> Dict[str, float]:
+        """ Requests, batches sent and batch sizes, for monitoring """
+        return {
+            "requests": self._requests,
+            "batches": self._batches,
+            "mean_batch_size": round(self._texts / self._batches, 2) if self._batches else 0.0,
+            "max_batch_size": self._largest
+        }
+
+
+embedding_batcher = EmbeddingBatcher()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import EMBEDDING_CACHE_MAX_BYTES, EMBEDDING_CACHE_PERSISTENT
+from app.core.database import database
+from app.services.embedding_cache_repository import EmbeddingCacheRepository
+
+
+class EmbeddingCache:
+    """
+    Cache of embeddings, keyed by the embedding model and the normalized text.
+
+    Lookups go through an in-process LRU bounded by the total size of the cached embeddings,
+    then fall back to an optional persistent store shared by every worker. Both tiers hold
+    embeddings as float32, a quarter of the size of a list of floats in memory. Embeddings
+    do not expire, since they only depend on the model and the text. A failing store is
+    treated as a miss, since the cache is only an optimization.
+    """
+
+    def __init__(self,
+        store: Optional[EmbeddingCacheRepository] = None,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES
+    ):
+        self.store = store
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """ The text that is embedded: Unicode NFKC with runs of whitespace collapsed to a single space """
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        """ Hash of the embedding model and the normalized text """
+        payload = json.dumps([model, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def __remember(self, key: str, embedding: np.ndarray):
+        """ Insert an embedding into the in-memory tier, evicting the least recently used until it fits """
+        if embedding.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._memory[key] = embedding
+            self._bytes += embedding.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def get_many(self, model: str, texts: Sequence[str], memory_only: bool = False) -> Dict[str, List[float]]:
+        """
+        Look up the embeddings of normalized texts
+        Args:
+            model: Name of the embedding model
+            texts: Normalized texts, see normalize()
+            memory_only: Only look in the in-memory tier, without counting misses, e.g. on the event loop
+        Returns:
+            Dict[str, List[float]]: Embeddings of the texts that are cached, by text
+        """
+        keys = {self.key(model, text): text for text in dict.fromkeys(texts)}
+        found = {}
+        with self._lock:
+            for key, text in keys.items():
+                embedding = self._memory.get(key)
+                if embedding is not None:
+                    self._memory.move_to_end(key)
+                    found[text] = embedding.tolist()
+            self.memory_hits += len(found)
+        if memory_only:
+            return found
+
+        missing = [key for key, text in keys.items() if text not in found]
+        stored = {}
+        if missing and self.store is not None:
+            try:
+                stored = self.store.get_embeddings(missing)
+            except Exception as e:
+                print("Embedding cache lookup error: " + str(e))
+
+        for key, blob in stored.items():
+            embedding = np.frombuffer(blob, dtype="<f4").astype(np.float32)
+            self.__remember(key, embedding)
+            found[keys[key]] = embedding.tolist()
+        self.store_hits += len(stored)
+        self.misses += len(missing) - len(stored)
+        return found
+
+    def put_many(self, model: str, embeddings: Dict[str, Sequence[float]]) -> Dict[str, List[float]]:
+        """
+        Cache the embeddings of normalized texts in both tiers
+        Returns:
+            Dict[str, List[float]]: The embeddings as cached, rounded to float32, by text
+        """
+        cached = {}
+        rows = []
+        for text, values in embeddings.items():
+            key = self.key(model, text)
+            embedding = np.asarray(values, dtype=np.float32)
+            self.__remember(key, embedding)
+            cached[text] = embedding.tolist()
+            rows.append((key, embedding.astype("<f4").tobytes()))
+
+        if self.store is not None:
+            try:
+                self.store.save_embeddings(model, rows)
+            except Exception as e:
+                print("Embedding cache save error: " + str(e))
+        return cached
+
+    def clear(self):
+        """ Drop every embedding held in the in-memory tier """
+        with self._lock:
+            self._memory.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """ Size, hit/miss counters and hit rate of the cache, for monitoring """
+        lookups = self.memory_hits + self.store_hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.store_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+embedding_cache = EmbeddingCache(EmbeddingCacheRepository(database) if EMBEDDING_CACHE_PERSISTENT else None)
@@ -0,0 +1,50 @@
+from typing import Dict, List, Tuple
+
+from app.core.database import Database
+from app.core.models.sql_models import CachedEmbedding
+
+
+class EmbeddingCacheRepository:
+    def __init__(self, db: Database):
+        self.db = db
+
+    def get_embeddings(self, keys: List[str]) -> Dict[str, bytes]:
+        """ Get the cached float32 embedding blobs of the keys that are stored, counting the hits """
+        if not keys:
+            return {}
+
+        session = self.db.get_session()
+        try:
+            cached = session.query(
+                CachedEmbedding
+            ).filter(
+                CachedEmbedding.key.in_(keys)
+            ).all()
+
+            embeddings = {}
+            for entry in cached:
+                embeddings[entry.key] = entry.embedding
+                entry.hits = CachedEmbedding.hits + 1
+            session.commit()
+            return embeddings
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def save_embeddings(self, model: str, embeddings: List[Tuple[str, bytes]]):
+        """ Save (or replace) float32 embedding blobs by key """
+        if not embeddings:
+            return
+
+        session = self.db.get_session()
+        try:
+            for key, blob in embeddings:
+                session.merge(CachedEmbedding(key=key, model=model, embedding=blob, hits=0))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
@@ -0,0 +1,112 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.config import EXTRACTION_WORKERS, EXTRACTION_MAX_QUEUE, EXTRACTION_TIMEOUT_SECONDS
+
+
+class ExtractionQueueFullError(RuntimeError):
+    """Raised when too many extraction jobs are already queued or running"""
+    pass
+
+
+class ExtractionTimeoutError(TimeoutError):
+    """Raised when an extraction job does not finish within its timeout"""
+    pass
+
+
+class ExtractionExecutor:
+    """
+    Bounded executor that keeps CPU-heavy text extraction off the event loop.
+
+    Jobs run in a process pool once start() has been called (from the app lifespan), so a
+    long PDF does not stall other requests on the same worker. Before that, or with zero
+    workers configured, jobs run on a thread instead. Callers are released after the
+    per-job timeout, although a job that is already running cannot be stopped: it keeps its
+    worker busy, and keeps counting against max_queue, until it really finishes.
+    """
+
+    def __init__(self,
+        max_workers: int = EXTRACTION_WORKERS,
+        max_queue: int = EXTRACTION_MAX_QUEUE,
+        timeout: float = EXTRACTION_TIMEOUT_SECONDS
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    @property
+    def running(self) -> bool:
+        """Whether jobs are being sent to the process pool"""
+        return self._pool is not None
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs currently queued or running"""
+        return self._pending
+
+    def start(self):
+        """Start the process pool"""
+        if self._pool is not None or self.max_workers <= 0:
+            return
+        # spawn avoids forking a process that already runs an event loop and open connections
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def shutdown(self):
+        """Stop the process pool, cancelling jobs that have not started yet"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """
+        Run a job off the event loop
+        Args:
+            fn: The function to run. Must be picklable (a module-level function or static method) while the pool is running
+            args: Arguments for the function, which must also be picklable while the pool is running
+        Returns:
+            The result of the function
+        Raises:
+            ExtractionQueueFullError: If max_queue jobs are already queued or running
+            ExtractionTimeoutError: If the job does not finish within the timeout
+        """
+        if self._pending >= self.max_queue:
+            raise ExtractionQueueFullError("Too many files are being processed, please try again shortly")
+
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        if self._pool is not None:
+            job = self._pool.submit(fn, *args)
+            # Also called when a job that has not started yet is cancelled
+            job.add_done_callback(lambda _: self.__release(loop))
+            future = asyncio.wrap_future(job)
+        else:
+            def job():
+                try:
+                    return fn(*args)
+                finally:
+                    self.__release(loop)
+            # A thread cannot be cancelled, shielded the job still starts and releases its slot
+            future = asyncio.shield(asyncio.to_thread(job))
+        try:
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise ExtractionTimeoutError(f"Extraction did not finish within {self.timeout} seconds")
+
+    def __release(self, loop: asyncio.AbstractEventLoop):
+        """ Free the slot of a finished job, from whichever thread it finished on """
+        def release():
+            self._pending -= 1
+        try:
+            loop.call_soon_threadsafe(release)
+        except RuntimeError:
+            # The event loop is closed, nothing is waiting for slots anymore
+            pass
+
+extraction_executor = ExtractionExecutor()
@@ -1,57 +1,207 @@
 from docx import Document
-import pdfminer.high_level
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.utils import open_filename
 from langchain_openai import OpenAIEmbeddings
-from typing import List
+from fastapi import UploadFile
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterator, List, Optional, Tuple, Union, BinaryIO
+import asyncio
 import hashlib
+import io
+import os
 import uuid
+import zipfile
 
+from app.core.config import MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, UPLOAD_SPOOL_MAX_MEMORY, OPENAI_BASE_URL
 from app.services.data_prep import DataPrep
+from app.services.embedding_batcher import EmbeddingBatcher, embedding_batcher
+from app.services.embedding_cache import EmbeddingCache, embedding_cache
+from app.services.extraction_executor import extraction_executor
+from app.services.prompt_assembler import prompt_assembler
+from app.services.rate_limits import RateLimits, rate_limits
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured maximum size"""
+    pass
+
 
 class FileProcessing:
-    def __init__(self):
-        self.embedding_model = OpenAIEmbeddings()
-        pass
-        
+    def __init__(self,
+        limits: RateLimits = rate_limits,
+        cache: Optional[EmbeddingCache] = embedding_cache,
+        batcher: EmbeddingBatcher = embedding_batcher
+    ):
+        self.embedding_model = OpenAIEmbeddings(
+            base_url=OPENAI_BASE_URL or None,
+            # OpenAI-compatible servers take the text itself rather than tiktoken token ids
+            check_embedding_ctx_length=not OPENAI_BASE_URL
+        )
+        self.limits = limits
+        self.cache = cache
+        self.batcher = batcher
+
 
-    def __from_pdf(self, fp) -> str:
+    @staticmethod
+    def __iter_pdf_lines(fp) -> Iterator[str]:
+        """Yield the text lines of a PDF one page at a time, as laid out by pdfminer's extract_text"""
+        with open_filename(fp, "rb") as fp, io.StringIO() as output:
+            resource_manager = PDFResourceManager(caching=True)
+            device = TextConverter(resource_manager, output, laparams=LAParams())
+            interpreter = PDFPageInterpreter(resource_manager, device)
+
+            # Lines can only be split once a page is done, the last piece may continue on the next page
+            partial = ""
+            for page in PDFPage.get_pages(fp, caching=True):
+                interpreter.process_page(page)
+                lines = (partial + output.getvalue()).split("\n")
+                output.seek(0)
+                output.truncate()
+                partial = lines.pop()
+                yield from lines
+            yield partial
+
+    @staticmethod
+    def __from_pdf(fp) -> str:
         """Extract text from a PDF file"""
         try:
-            text = pdfminer.high_level.extract_text(fp)
-            text = DataPrep.clean_text(text)
-            return text
+            return "\n".join(DataPrep.clean_lines(FileProcessing.__iter_pdf_lines(fp)))
         except Exception as e:
             print("OCR Error: " + str(e))
             return ""
 
-    def __from_docx(self, fp) -> str:
+    @staticmethod
+    def __from_docx(fp) -> str:
         """Extract text from a DOCX file"""
         try:
             doc = Document(fp)
-            return DataPrep.clean_text("\n".join([p.text for p in doc.paragraphs]))
+            return "\n".join(DataPrep.clean_lines(
+                line for p in doc.paragraphs for line in p.text.split("\n")
+            ))
         except Exception as e:
             print("Docx Error: " + str(e))
             return ""
 
-    def extract(self, file_path: str, file_ext: str) -> str:
+    @staticmethod
+    def extract_text(source: Union[str, bytes, BinaryIO], file_ext: str) -> str:
         """
-        Extract text from a file based on its extension
+        Extract text from a file based on its extension. Static so that it can run in the extraction process pool
         Args:
-            file_path: Path to the file
+            source: Path to the file, the raw file bytes or a binary file-like object
             file_ext: File extension (pdf or docx)
         Returns:
             Extracted text or empty string if unsupported format
         """
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        elif not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+
         if file_ext == "pdf":
-            return self.__from_pdf(file_path)
+            return FileProcessing.__from_pdf(source)
         elif file_ext == "docx":
-            return self.__from_docx(file_path)
+            return FileProcessing.__from_docx(source)
         return ""
-    
+
+    def extract(self, source: Union[str, bytes, BinaryIO], file_ext: str) -> str:
+        """
+        Extract text from a file based on its extension
+        Args:
+            source: Path to the file, the raw file bytes or a binary file-like object
+            file_ext: File extension (pdf or docx)
+        Returns:
+            Extracted text or empty string if unsupported format
+        """
+        return FileProcessing.extract_text(source, file_ext)
+
+    async def extract_async(self, source: Union[str, bytes, BinaryIO], file_ext: str) -> str:
+        """
+        Extract text off the event loop, in the extraction process pool when it is running
+        Args:
+            source: Path to the file, the raw file bytes or a binary file-like object
+            file_ext: File extension (pdf or docx)
+        Returns:
+            Extracted text or empty string if unsupported format
+        Raises:
+            ExtractionQueueFullError: If the extraction queue is full
+            ExtractionTimeoutError: If extraction takes longer than the configured timeout
+        """
+        if not extraction_executor.running:
+            return await extraction_executor.run(self.extract, source, file_ext)
+
+        # File objects cannot be sent to another process, so ship the content instead
+        if not isinstance(source, (str, os.PathLike, bytes, bytearray)):
+            source.seek(0)
+            source = source.read()
+        return await extraction_executor.run(FileProcessing.extract_text, source, file_ext)
+
+    async def ingest(self, file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[uuid.UUID, SpooledTemporaryFile]:
+        """
+        Stream an upload into a per-request spool, hashing it as it is read
+        Args:
+            file: The uploaded file
+            max_bytes: Maximum accepted size of the upload in bytes
+        Returns:
+            The file ID and the spooled file content, rewound to the start. The caller owns the spool and must close it
+        Raises:
+            UploadTooLargeError: If the upload is larger than max_bytes
+        """
+        sha256 = hashlib.sha256()
+        spool = SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+        size = 0
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"File exceeds the maximum upload size of {max_bytes} bytes")
+                sha256.update(chunk)
+                spool.write(chunk)
+        except Exception:
+            spool.close()
+            raise
+
+        spool.seek(0)
+        return self.file_id_from_digest(sha256.digest()), spool
+
+    def unpack_zip(self, source: BinaryIO, max_files: int, max_bytes: int = MAX_UPLOAD_BYTES) -> List[Tuple[str, bytes]]:
+        """
+        Read the files out of a zip archive
+        Args:
+            source: Binary file-like object holding the archive
+            max_files: Maximum number of files accepted in the archive
+            max_bytes: Maximum uncompressed size of each file in the archive
+        Returns:
+            List of (file name, file content) tuples, skipping directories
+        Raises:
+            UploadTooLargeError: If the archive holds too many files or a file larger than max_bytes
+        """
+        source.seek(0)
+        files = []
+        with zipfile.ZipFile(source) as archive:
+            members = [member for member in archive.infolist() if not member.is_dir()]
+            if len(members) > max_files:
+                raise UploadTooLargeError(f"Archive holds more than {max_files} files")
+            for member in members:
+                # Check the declared size first so that a zip bomb is never decompressed
+                if member.file_size > max_bytes:
+                    raise UploadTooLargeError(f"{member.filename} exceeds the maximum upload size of {max_bytes} bytes")
+                with archive.open(member) as fp:
+                    content = fp.read(max_bytes + 1)
+                if len(content) > max_bytes:
+                    raise UploadTooLargeError(f"{member.filename} exceeds the maximum upload size of {max_bytes} bytes")
+                files.append((os.path.basename(member.filename), content))
+        return files
+
     def generate_file_id(self, file_content: bytes) -> uuid.UUID:
         """Generate a unique file ID based on file content using SHA-256"""
-        sha256 = hashlib.sha256(file_content).hexdigest()
-        file_uuid = uuid.UUID(bytes=bytes.fromhex(sha256)[:16])
-        return file_uuid
+        return self.file_id_from_digest(hashlib.sha256(file_content).digest())
+
+    def file_id_from_digest(self, sha256_digest: bytes) -> uuid.UUID:
+        """Build the file ID from an already computed SHA-256 digest of the file content"""
+        return uuid.UUID(bytes=sha256_digest[:16])
 
     def generate_embeddings(self, text: str) -> List[List[float]]:
         """
@@ -61,4 +211,79 @@ class FileProcessing:
         Returns:
             List of embeddings
         """
-        return self.embedding_model.embed_documents([text])[0]
+        return self.generate_embeddings_batch([text])[0]
+
+    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for many texts with a single embeddings request, for the texts that are not cached
+        Args:
+            texts: Texts to generate embeddings for
+        Returns:
+            One embedding per text, in the same order
+        """
+        if not texts:
+            return []
+        texts = [EmbeddingCache.normalize(text) for text in texts]
+        embeddings = self.cache.get_many(self.embedding_model.model, texts) if self.cache else {}
+
+        missing = [text for text in dict.fromkeys(texts) if text not in embeddings]
+        if missing:
+            generated = dict(zip(missing, self.embedding_model.embed_documents(missing)))
+            embeddings.update(self.cache.put_many(self.embedding_model.model, generated) if self.cache else generated)
+        return [embeddings[text] for text in texts]
+
+    def __memory_cached(self, texts: List[str]) -> Dict[str, List[float]]:
+        """ Embeddings of normalized texts found in the in-memory cache tier, without blocking the event loop """
+        if not self.cache:
+            return {}
+        return self.cache.get_many(self.embedding_model.model, texts, memory_only=True)
+
+    async def __embed_batch(self, texts: List[str], tokens: int) -> List[List[float]]:
+        """ Send a batch of the embedding batcher, off the event loop and within the embeddings rate limits """
+        return await self.limits["embeddings"].run(
+            lambda: asyncio.to_thread(self.generate_embeddings_batch, texts),
+            tokens=tokens
+        )
+
+    async def generate_embeddings_async(self, text: str) -> List[float]:
+        """
+        Generate embeddings off the event loop, within the embeddings rate limits, unless they are cached in memory.
+        Concurrent requests are sent together, see EmbeddingBatcher
+        Args:
+            text: Text to generate embeddings for
+        Returns:
+            The embedding of the text
+        Raises:
+            QueueTimeoutError: If the request waited too long for the rate limits
+        """
+        text = EmbeddingCache.normalize(text)
+        cached = self.__memory_cached([text])
+        if text in cached:
+            return cached[text]
+        return await self.batcher.embed(
+            self.embedding_model.model,
+            text,
+            prompt_assembler.count(text, "openai"),
+            self.__embed_batch
+        )
+
+    async def generate_embeddings_batch_async(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for many texts with a single request, off the event loop and within the embeddings rate limits
+        Args:
+            texts: Texts to generate embeddings for
+        Returns:
+            One embedding per text, in the same order
+        Raises:
+            QueueTimeoutError: If the request waited too long for the rate limits
+        """
+        if not texts:
+            return []
+        texts = [EmbeddingCache.normalize(text) for text in texts]
+        cached = self.__memory_cached(texts)
+        if all(text in cached for text in texts):
+            return [cached[text] for text in texts]
+        return await self.limits["embeddings"].run(
+            lambda: asyncio.to_thread(self.generate_embeddings_batch, texts),
+            tokens=sum(prompt_assembler.count(text, "openai") for text in dict.fromkeys(texts) if text not in cached)
+        )
@@ -0,0 +1,199 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from app.core.database import Database
+from app.core.models.sql_models import UploadJob
+from app.core.models.pydantic_models import UploadJobStatus
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+UNFINISHED_STATES = (QUEUED, RUNNING)
+
+
+class JobRepository:
+    def __init__(self, db: Database):
+        self.db = db
+
+    def __to_status(self, job: UploadJob) -> UploadJobStatus:
+        return UploadJobStatus(
+            job_id=str(job.id),
+            file_id=str(job.file_id),
+            file_name=job.file_name,
+            status=job.status,
+            stage=job.stage,
+            error=job.error,
+            result=job.result
+        )
+
+    def create_job(self,
+        user_id: Optional[str],
+        file_id: str,
+        file_name: str,
+        model_option: str,
+        payload: bytes
+    ) -> str:
+        """ Create a queued upload job and return its id """
+        session = self.db.get_session()
+        try:
+            job = UploadJob(
+                user_id=user_id,
+                file_id=file_id,
+                file_name=file_name,
+                model_option=model_option,
+                status=QUEUED,
+                attempts=1,
+                payload=payload
+            )
+            session.add(job)
+            session.commit()
+
+            return str(job.id)
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def get_job(self, job_id: str) -> Optional[UploadJobStatus]:
+        """ Get the status of an upload job """
+        session = self.db.get_session()
+        try:
+            job = session.query(
+                UploadJob
+            ).filter(
+                UploadJob.id == job_id
+            ).first()
+
+            if not job:
+                return None
+            return self.__to_status(job)
+        except Exception as e:
+            raise e
+        finally:
+            session.close()
+
+    def get_job_input(self, job_id: str) -> Optional[UploadJob]:
+        """ Get an upload job including its raw upload """
+        session = self.db.get_session()
+        try:
+            job = session.query(
+                UploadJob
+            ).filter(
+                UploadJob.id == job_id
+            ).first()
+
+            return job
+        except Exception as e:
+            raise e
+        finally:
+            session.close()
+
+    def update_job(self,
+        job_id: str,
+        status: Optional[str] = None,
+        stage: Optional[str] = None,
+        error: Optional[str] = None,
+        result: Optional[Any] = None
+    ):
+        """ Record the progress of an upload job. Finished jobs drop their raw upload """
+        session = self.db.get_session()
+        try:
+            job = session.query(
+                UploadJob
+            ).filter(
+                UploadJob.id == job_id
+            ).first()
+
+            if not job:
+                raise ValueError(f"No upload job found with id {job_id}")
+
+            if status is not None:
+                job.status = status
+            if stage is not None:
+                job.stage = stage
+            if error is not None:
+                job.error = error
+            if result is not None:
+                job.result = result
+            if job.status not in UNFINISHED_STATES:
+                job.payload = None
+            job.updated_at = datetime.now(tz=timezone.utc)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def touch_job(self, job_id: str):
+        """ Mark an unfinished job as still making progress """
+        session = self.db.get_session()
+        try:
+            session.query(
+                UploadJob
+            ).filter(
+                UploadJob.id == job_id,
+                UploadJob.status.in_(UNFINISHED_STATES)
+            ).update({
+                UploadJob.updated_at: datetime.now(tz=timezone.utc)
+            }, synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def claim_stale_job(self, stale_after: int, max_attempts: int) -> Optional[str]:
+        """
+        Claim one unfinished job that has not made progress for stale_after seconds, e.g. because
+        the worker running it was restarted. Jobs that were already tried max_attempts times are failed.
+        Returns the id of the claimed job, or None if there is nothing to resume.
+        """
+        session = self.db.get_session()
+        try:
+            now = datetime.now(tz=timezone.utc)
+            cutoff = now - timedelta(seconds=stale_after)
+
+            # Give up on jobs that keep getting interrupted
+            session.query(
+                UploadJob
+            ).filter(
+                UploadJob.status.in_(UNFINISHED_STATES),
+                UploadJob.updated_at < cutoff,
+                UploadJob.attempts >= max_attempts
+            ).update({
+                UploadJob.status: FAILED,
+                UploadJob.error: "Upload job was interrupted too many times",
+                UploadJob.payload: None,
+                UploadJob.updated_at: now
+            }, synchronize_session=False)
+
+            # SKIP LOCKED lets several workers recover jobs at the same time without claiming the same one
+            job = session.query(
+                UploadJob
+            ).filter(
+                UploadJob.status.in_(UNFINISHED_STATES),
+                UploadJob.updated_at < cutoff
+            ).with_for_update(
+                skip_locked=True
+            ).first()
+
+            if not job:
+                session.commit()
+                return None
+
+            job.status = QUEUED
+            job.attempts += 1
+            job.updated_at = now
+            session.commit()
+
+            return str(job.id)
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
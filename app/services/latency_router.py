@@ -0,0 +1,96 @@
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence
+
+from app.core.config import LLM_LATENCY_WINDOW, LLM_HEDGE_REQUESTS, LLM_HEDGE_MIN_SAMPLES
+from app.core.models.pydantic_models import BackendLatency
+from app.services.provider_health import ProviderHealth, provider_health
+
+
+class LatencyWindow:
+    """ Latencies of the last successful calls to a provider and outcomes of the last calls """
+
+    def __init__(self, size: int):
+        self.latencies: Deque[float] = deque(maxlen=size)
+        self.outcomes: Deque[bool] = deque(maxlen=size)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """ Nearest-rank percentile of the latencies in seconds, None before the first success """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class LatencyRouter:
+    """
+    Picks the provider of the "auto" processing option from their recent latencies and errors.
+
+    Every call to a provider is recorded in a moving window. Providers are ranked available
+    first (see ProviderHealth), then by error rate in steps of 10%, then by median latency.
+    A provider without any success yet ranks as fastest so that it gets tried. With hedging
+    enabled, a request that has not been answered within the p95 of its provider is also sent
+    to the next one, once that p95 is based on at least min_samples calls.
+    """
+
+    def __init__(self,
+        providers: Sequence[str],
+        health: ProviderHealth = provider_health,
+        window: int = LLM_LATENCY_WINDOW,
+        hedge: bool = LLM_HEDGE_REQUESTS,
+        min_samples: int = LLM_HEDGE_MIN_SAMPLES
+    ):
+        self.health = health
+        self.hedge = hedge
+        self.min_samples = min_samples
+        self._windows: Dict[str, LatencyWindow] = {provider: LatencyWindow(window) for provider in providers}
+
+    def record(self, provider: str, seconds: float, ok: bool = True):
+        """ Record a call to a provider, its latency only counts when it succeeded """
+        window = self._windows.get(provider)
+        if window is None:
+            return
+        window.outcomes.append(ok)
+        if ok:
+            window.latencies.append(seconds)
+
+    def rank(self) -> List[str]:
+        """ Providers from the most to the least preferred """
+        def score(provider: str):
+            window = self._windows[provider]
+            return (
+                not self.health.available(provider, admit=False),
+                round(window.error_rate, 1),
+                window.percentile(0.5) or 0.0
+            )
+        return sorted(self._windows, key=score)
+
+    def hedge_delay(self, provider: str) -> Optional[float]:
+        """ Seconds to wait for a provider before hedging, or None to not hedge """
+        window = self._windows[provider]
+        if not self.hedge or len(window.latencies) < self.min_samples:
+            return None
+        return window.percentile(0.95)
+
+    def stats(self) -> Dict[str, BackendLatency]:
+        def ms(seconds: Optional[float]) -> Optional[float]:
+            return round(seconds * 1000, 2) if seconds is not None else None
+
+        return {
+            provider: BackendLatency(
+                provider=provider,
+                samples=len(window.latencies),
+                p50_ms=ms(window.percentile(0.5)),
+                p95_ms=ms(window.percentile(0.95)),
+                error_rate=round(window.error_rate, 4)
+            )
+            for provider, window in self._windows.items()
+        }
+
+
+latency_router = LatencyRouter(("openai", "ollama"))
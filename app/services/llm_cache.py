@@ -0,0 +1,122 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from app.core.config import LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL_SECONDS, LLM_CACHE_PERSISTENT
+from app.core.database import database
+from app.services.llm_cache_repository import LLMCacheRepository
+
+
+class LLMCache:
+    """
+    Cache of raw LLM responses, keyed by everything that determines the response.
+
+    Lookups go through an in-process LRU bounded by the total size of the cached responses,
+    then fall back to an optional persistent store shared by every worker. Entries expire
+    after ttl seconds in both tiers. A failing store is treated as a miss, since the cache
+    is only an optimization.
+    """
+
+    def __init__(self,
+        store: Optional[LLMCacheRepository] = None,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        ttl: int = LLM_CACHE_TTL_SECONDS
+    ):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, prompt: str, text: str, temperature: float, max_tokens: int) -> str:
+        """ Hash of the model name, prompt template, rendered document and generation settings """
+        payload = json.dumps([model, prompt, text, temperature, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def __remember(self, key: str, response: str, expires_at: float):
+        """ Insert a response into the in-memory tier, evicting the least recently used until it fits """
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0].encode("utf-8"))
+            self._memory[key] = (response, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._memory.popitem(last=False)
+                self._bytes -= len(evicted.encode("utf-8"))
+
+    def get(self, key: str, memory_only: bool = False) -> Optional[str]:
+        """
+        Look up a cached response, or None on a miss
+        Args:
+            key: See key()
+            memory_only: Only look in the in-memory tier, without counting misses, e.g. on the event loop
+        """
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                response, expires_at = cached
+                if expires_at > time.monotonic():
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return response
+                del self._memory[key]
+                self._bytes -= len(response.encode("utf-8"))
+        if memory_only:
+            return None
+
+        response = None
+        if self.store is not None:
+            try:
+                response = self.store.get_response(key)
+            except Exception as e:
+                print("LLM cache lookup error: " + str(e))
+
+        if response is None:
+            self.misses += 1
+            return None
+
+        self.store_hits += 1
+        # The remaining lifetime of the stored entry is not known here, a full ttl is close enough
+        self.__remember(key, response, time.monotonic() + self.ttl)
+        return response
+
+    def put(self, key: str, model: str, response: str):
+        """ Cache a response in both tiers """
+        self.__remember(key, response, time.monotonic() + self.ttl)
+        if self.store is not None:
+            try:
+                self.store.save_response(key, model, response, self.ttl)
+            except Exception as e:
+                print("LLM cache save error: " + str(e))
+
+    def clear(self):
+        """ Drop every response held in the in-memory tier """
+        with self._lock:
+            self._memory.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """ Size and hit/miss counters of the cache, for monitoring """
+        return {
+            "entries": len(self._memory),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses
+        }
+
+
+llm_cache = LLMCache(LLMCacheRepository(database) if LLM_CACHE_PERSISTENT else None)
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.core.database import Database
+from app.core.models.sql_models import LLMResponse
+
+
+class LLMCacheRepository:
+    def __init__(self, db: Database):
+        self.db = db
+
+    def get_response(self, key: str) -> Optional[str]:
+        """ Get an unexpired cached LLM response by key, counting the hit """
+        session = self.db.get_session()
+        try:
+            cached = session.query(
+                LLMResponse
+            ).filter(
+                LLMResponse.key == key,
+                LLMResponse.expires_at > datetime.now(timezone.utc)
+            ).first()
+
+            if not cached:
+                return None
+
+            response = cached.response
+            cached.hits = LLMResponse.hits + 1
+            session.commit()
+            return response
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def save_response(self, key: str, model: str, response: str, ttl_seconds: int):
+        """ Save (or replace) a cached LLM response that expires after ttl_seconds """
+        session = self.db.get_session()
+        try:
+            session.merge(LLMResponse(
+                key=key,
+                model=model,
+                response=response,
+                hits=0,
+                expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+            ))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
@@ -0,0 +1,64 @@
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.core.config import LLAMA_SERVER, OPENAI_API_KEY, OPENAI_BASE_URL, LLM_MAX_CONNECTIONS, LLM_REQUEST_TIMEOUT
+
+
+class LLMClients:
+    """
+    Long-lived async clients for the LLM providers.
+
+    Both clients keep a pool of keep-alive connections, so they are created once per process
+    by start() (from the app lifespan) and shared by every request instead of being rebuilt
+    for each one. A client that is used before start() is created on first use.
+    """
+
+    def __init__(self,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        timeout: float = LLM_REQUEST_TIMEOUT
+    ):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._openai: Optional[AsyncOpenAI] = None
+        self._ollama: Optional[httpx.AsyncClient] = None
+
+    @property
+    def openai(self) -> AsyncOpenAI:
+        """Client for the OpenAI API"""
+        if self._openai is None:
+            self.start()
+        return self._openai
+
+    @property
+    def ollama(self) -> httpx.AsyncClient:
+        """Client for the LLAMA server, with requests relative to LLAMA_SERVER"""
+        if self._ollama is None:
+            self.start()
+        return self._ollama
+
+    def start(self):
+        """Create the clients and their connection pools"""
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        if self._openai is None:
+            self._openai = AsyncOpenAI(
+                api_key=OPENAI_API_KEY,
+                base_url=OPENAI_BASE_URL or None,
+                timeout=self.timeout,
+                http_client=httpx.AsyncClient(limits=limits, timeout=self.timeout)
+            )
+        if self._ollama is None:
+            self._ollama = httpx.AsyncClient(base_url=LLAMA_SERVER, limits=limits, timeout=self.timeout)
+
+    async def close(self):
+        """Close the clients and their pooled connections"""
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = None
+        if self._ollama is not None:
+            await self._ollama.aclose()
+            self._ollama = None
+
+
+llm_clients = LLMClients()
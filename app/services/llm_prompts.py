@@ -1,3 +1,5 @@
+import hashlib
+
 
 DOCUMENT_TEMPLATE = r"""Here is the resume document text, delimited with triple dashes. Your answer should be based strictly on the following text, and nothing else: ---{document}---
 # Optional Feedback Section
@@ -49,6 +51,70 @@ Format:
 }
 """
 
+# Version of the review prompt, stored alongside cached review results so that
+# editing BASE_PROMPT invalidates them
+PROMPT_VERSION = hashlib.sha256(BASE_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+# Per-category review prompts, sent concurrently in the parallel review mode
+CATEGORY_PROMPT = r"""
+You are a professional resume reviewer. Evaluate only the {title} of the resume below – {description} – and return structured feedback in JSON format.
+
+- Give a score (0.0–10.0), list real strengths, weaknesses, and suggestions.
+- Only include suggestions for real issues—do not invent problems.
+- If there are no issues give a score of 10 and leave weaknesses and suggestions lists empty.
+
+Note:
+- Ignore OCR artifacts where lowercase “l” appears as uppercase “I” (e.g., “OpenAI” → “OpenAl”).
+- Do not flag common abbreviations (e.g., "AI", "CI/CD", "ML", "SQL", "API").
+- Only flag inconsistent formats (e.g., dates or locations) if they **deviate** from the dominant style in the document.
+- Avoid repeated or redundant suggestions for similar terms or formats.
+- Do not comment on other aspects of the resume, they are reviewed separately.
+
+Format:
+```json
+{{
+  "score": 0.0,
+  "strengths": [],
+  "weaknesses": [],
+  "suggestions": [
+    {{
+      "text": "Explanation of issue",
+      "match": "exact substring"
+    }}
+  ]
+}}
+"""
+
+CATEGORY_DESCRIPTIONS = {
+    "structure_organization": ("Structure/Organization", "section layout and logical grouping"),
+    "clarity_conciseness": ("Clarity/Conciseness", "brief, clear bullet points"),
+    "grammar_spelling": ("Grammar/Spelling", "real grammar or spelling issues only"),
+    "impact_accomplishments": ("Impact/Accomplishments", "action verbs, measurable results"),
+    "ats_readability": ("ATS Readability", "standard formatting, keywords, parsability"),
+}
+
+GENERAL_FEEDBACK_PROMPT = r"""
+You are a professional resume reviewer. Give a short overall assessment of the resume below: its main strengths and the few changes that would improve it the most.
+
+Format:
+```json
+{
+  "general_feedback": ""
+}
+"""
+
+# Prompt of each part of a parallel review, keyed by the Feedback field it fills
+CATEGORY_PROMPTS = {
+    **{
+        category: CATEGORY_PROMPT.format(title=title, description=description)
+        for category, (title, description) in CATEGORY_DESCRIPTIONS.items()
+    },
+    "general_feedback": GENERAL_FEEDBACK_PROMPT,
+}
+
+CATEGORY_PROMPT_VERSION = hashlib.sha256("".join(CATEGORY_PROMPTS.values()).encode("utf-8")).hexdigest()[:12]
+
 
 # Chat Prompts
 CHAT_PROMPT = r"""
@@ -76,4 +142,9 @@ Output Format:
     "response": "Your response following all rules above, using markdown bullet points and formatting"
 }
 ```
-"""
\ No newline at end of file
+"""
+
+# Chat prompt for streamed responses, which are sent to the client as plain markdown while they are generated
+CHAT_STREAM_PROMPT = CHAT_PROMPT.split("Output Format:")[0] + r"""Output Format:
+Respond with the markdown text only, do not wrap it in JSON or a code block.
+"""
@@ -1,63 +1,140 @@
-from openai import OpenAI
-import requests
-from app.core.config import LLAMA_SERVER, OPENAI_API_KEY
-from typing import Dict
+from openai import APIConnectionError, InternalServerError, RateLimitError
+import asyncio
+import httpx
+import time
+from typing import AsyncIterator, Optional
+from app.core.config import OLLAMA_MODEL, OLLAMA_KEEP_ALIVE
 from app.core.models.pydantic_models import Feedback
+from app.services.llm_cache import LLMCache, llm_cache
+from app.services.latency_router import LatencyRouter, latency_router
+from app.services.llm_clients import LLMClients, llm_clients
 from app.services.llm_prompts import BASE_PROMPT
+from app.services.prompt_assembler import prompt_assembler
+from app.services.provider_health import ProviderHealth, provider_health
+from app.services.rate_limits import QueueTimeoutError, RateLimits, rate_limits
 import json
 
+
+# Model used by each processing option
+MODEL_NAMES = {
+    "openai": "gpt-4o-mini",
+    "ollama": OLLAMA_MODEL,
+}
+# Processing option routed to whichever provider is currently doing best
+AUTO = "auto"
+UNAVAILABLE_ERRORS = {
+    "openai": "Unable to connect to OpenAI server.",
+    "ollama": "Unable to connect to llama server.",
+}
+
+
+class ProviderUnavailableError(RuntimeError):
+    """Raised when a provider's circuit is open or it cannot be reached"""
+    pass
+
+
 class ProcessLLM:
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self,
+        clients: LLMClients = llm_clients,
+        health: ProviderHealth = provider_health,
+        cache: Optional[LLMCache] = llm_cache,
+        limits: RateLimits = rate_limits,
+        router: LatencyRouter = latency_router
+    ):
+        self.clients = clients
+        self.health = health
+        self.cache = cache
+        self.limits = limits
+        self.router = router
         self.base_prompt = BASE_PROMPT
         
         self.temperature = 0.2
         self.max_tokens = 2000
 
-    def __test_llama_connection(self) -> bool:
-        """Test connection to the LLAMA server"""
-        try:
-            response = requests.get(f"{LLAMA_SERVER}/api/tags", timeout=3)
-            return response.status_code == 200
-        except requests.RequestException:
-            return False
+    async def __generate_with_llama(self, text: str, prompt: str, format: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Generate a response with the LLAMA server, yielding its pieces as the NDJSON stream is parsed
+        Raises:
+            ProviderUnavailableError: If the server cannot be reached or fails
+            QueueTimeoutError: If the request waited too long for a free slot
+            ValueError: If the server rejects the request, e.g. for an unknown model
+        """
+        payload = {
+            "model": MODEL_NAMES["ollama"],
+            "system": prompt,
+            "prompt": text,
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {
+                "temperature": self.temperature,
+                "num_predict": self.max_tokens
+            }
+        }
+        if format:
+            payload["format"] = format
 
-    def __test_openai_connection(self) -> bool:
-        """Test connection to the OpenAI API"""
         try:
-            response = self.openai_client.models.list()
-            return bool(response)
-        except Exception:
-            return False
+            async with self.limits["ollama"].slot(), \
+                    self.clients.ollama.stream("POST", "/api/generate", json=payload) as response:
+                if response.status_code >= 500:
+                    self.health.record_failure("ollama", f"HTTP {response.status_code}")
+                    raise ProviderUnavailableError(UNAVAILABLE_ERRORS["ollama"])
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise ValueError(f"Llama server rejected the request: {response.text}")
+                self.health.record_success("ollama")
+
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise ValueError(chunk["error"])
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        break
+        except httpx.HTTPError as e:
+            self.health.record_failure("ollama", str(e))
+            raise ProviderUnavailableError(UNAVAILABLE_ERRORS["ollama"]) from e
 
-    def __process_with_llama(self, text: str, prompt: str) -> Dict:
-        """Process resume text using the LLAMA server"""
-        if not self.__test_llama_connection():
-            return {"error": "Unable to connect to llama server."} 
+    async def __complete_with_llama(self, text: str, prompt: str) -> str:
+        """Get a whole JSON response from the LLAMA server"""
+        return "".join([chunk async for chunk in self.__generate_with_llama(text, prompt, format="json")])
 
+    async def warm_ollama(self):
+        """Load the LLAMA model into memory ahead of the first request"""
         try:
-            response = requests.post(f"{LLAMA_SERVER}/api/generate", json={
-                "model": "llama3.1:latest",
-                "prompt": text,
-                "temperature": self.temperature,
-                "max_tokens": self.max_tokens
-        
+            response = await self.clients.ollama.post("/api/generate", json={
+                "model": MODEL_NAMES["ollama"],
+                "keep_alive": OLLAMA_KEEP_ALIVE
             })
-            return response.json().get("response", "No response from llama.")
-        
-        except json.JSONDecodeError:
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print("Failed to warm up llama model: " + str(e))
+
+    @staticmethod
+    def __parse_response(content: str) -> Feedback:
+        """Parse a JSON response into Feedback, or return it as is when it is not a review"""
+        try:
+            json_response = json.loads(content)
+        except json.JSONDecodeError as e:
             return {"error": f"Failed to parse JSON response: {str(e)}"}
-        except Exception as e:
-            return {"error": f"Error processing resume: {str(e)}"}
+        try:
+            return Feedback(**json_response)
+        except Exception:
+            # feedback is not a review, e.g. a chat response
+            return json_response
 
-    def __process_with_openai(self, text: str, prompt: str) -> Feedback:
-        """Process resume text using the OpenAI API"""
-        if not self.__test_openai_connection():
-            return {"error": "Unable to connect to OpenAI server."}
+    def __openai_tokens(self, text: str, prompt: str) -> int:
+        """Tokens a request counts against the OpenAI rate limit: the input and the most it may generate"""
+        return prompt_assembler.count(prompt, "openai") + prompt_assembler.count(text, "openai") + self.max_tokens
 
+    async def __complete_with_openai(self, text: str, prompt: str) -> str:
+        """Get a whole JSON response from the OpenAI API, within its rate limits"""
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",
+            response = await self.limits["openai"].run(lambda: self.clients.openai.chat.completions.create(
+                model=MODEL_NAMES["openai"],
                 messages=[
                     {"role": "system", "content": prompt},
                     {"role": "user", "content": text}
@@ -65,35 +142,147 @@ class ProcessLLM:
                 temperature=self.temperature,
                 max_tokens=self.max_tokens,
                 response_format={"type": "json_object"}
-            )
-            try:
-                json_response = json.loads(response.choices[0].message.content)
-                # print(json.dumps(json_response, indent=2))
-                try:
-                    feedback = Feedback(**json_response)
-                    return feedback
-                except Exception as e:
-                    # feedback is not a json object so return regular string
-                    return json_response
-            except json.JSONDecodeError as e:
-                return {"error": f"Failed to parse JSON response: {str(e)}"}
-        except Exception as e:
-            return {"error": f"Error processing resume: {str(e)}"}
+            ), tokens=self.__openai_tokens(text, prompt))
+        except (APIConnectionError, InternalServerError) as e:
+            self.health.record_failure("openai", str(e))
+            raise ProviderUnavailableError(UNAVAILABLE_ERRORS["openai"]) from e
+        self.health.record_success("openai")
+
+        return response.choices[0].message.content
 
-    def process(self, text: str, model: str, prompt: str) -> dict:
+    async def process(self, text: str, model: str, prompt: str) -> dict:
         """
-        Process resume text using either LLAMA or OpenAI
+        Process resume text using either LLAMA or OpenAI. Responses are cached, so an identical
+        request with the same model, prompt and settings does not reach the provider again.
         Args:
             text: The resume text to process - already formatted with document template
-            model: 'ollama' or 'openai'
+            model: 'ollama', 'openai' or 'auto'
             prompt: custom prompt
         Returns:
             Processed feedback
         """
+        if model == AUTO:
+            return await self.__process_auto(text, prompt)
         if model == "ollama":
-            return self.__process_with_llama(text, prompt)
+            complete = self.__complete_with_llama
         elif model == "openai":
-            return self.__process_with_openai(text, prompt)
-        return {"error": "Invalid processing option"}
-    
-    
+            complete = self.__complete_with_openai
+        else:
+            return {"error": "Invalid processing option"}
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(MODEL_NAMES[model], prompt, text, self.temperature, self.max_tokens)
+            content = self.cache.get(key, memory_only=True)
+            if content is None:
+                # The persistent tier is a database round trip, kept off the event loop
+                content = await asyncio.to_thread(self.cache.get, key)
+            if content is not None:
+                return self.__parse_response(content)
+
+        if not self.health.available(model):
+            return {"error": UNAVAILABLE_ERRORS[model]}
+
+        start = time.monotonic()
+        try:
+            content = await complete(text, prompt)
+        except (ProviderUnavailableError, QueueTimeoutError) as e:
+            self.router.record(model, time.monotonic() - start, ok=False)
+            return {"error": str(e)}
+        except Exception as e:
+            self.router.record(model, time.monotonic() - start, ok=False)
+            return {"error": f"Error processing resume: {str(e)}"}
+        self.router.record(model, time.monotonic() - start)
+
+        result = self.__parse_response(content)
+        if key is not None and not (isinstance(result, dict) and "error" in result):
+            await asyncio.to_thread(self.cache.put, key, MODEL_NAMES[model], content)
+        return result
+
+    async def __process_auto(self, text: str, prompt: str) -> dict:
+        """
+        Process with the provider the router prefers. If it fails, or (with hedging) has not answered
+        within its p95 latency, the next provider is asked too and the first good answer wins
+        """
+        primary, *others = self.router.rank()
+        pending = {asyncio.create_task(self.process(text, primary, prompt))}
+        delay = self.router.hedge_delay(primary)
+        result = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=delay if others else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    result = task.result()
+                    if not (isinstance(result, dict) and "error" in result):
+                        return result
+                # Timed out waiting or failed, hand the request to the next provider as well
+                if others:
+                    pending.add(asyncio.create_task(self.process(text, others.pop(0), prompt)))
+                    delay = None
+            return result
+        finally:
+            # The slower request is not needed anymore
+            for task in pending:
+                task.cancel()
+
+    async def __stream_with_llama(self, text: str, prompt: str) -> AsyncIterator[str]:
+        """Stream a response from the LLAMA server"""
+        async for chunk in self.__generate_with_llama(text, prompt):
+            yield chunk
+
+    async def __stream_with_openai(self, text: str, prompt: str) -> AsyncIterator[str]:
+        """Stream a response from the OpenAI API, holding a rate limited slot until it ends"""
+        async with self.limits["openai"].slot(self.__openai_tokens(text, prompt)):
+            try:
+                stream = await self.clients.openai.chat.completions.create(
+                    model=MODEL_NAMES["openai"],
+                    messages=[
+                        {"role": "system", "content": prompt},
+                        {"role": "user", "content": text}
+                    ],
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=True
+                )
+            except (APIConnectionError, InternalServerError) as e:
+                self.health.record_failure("openai", str(e))
+                raise ProviderUnavailableError(UNAVAILABLE_ERRORS["openai"]) from e
+            except RateLimitError:
+                self.limits["openai"].rate_limited()
+                raise
+            self.health.record_success("openai")
+
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    async def stream(self, text: str, model: str, prompt: str) -> AsyncIterator[str]:
+        """
+        Stream a plain text response from either LLAMA or OpenAI as it is generated
+        Args:
+            text: The text to process - already formatted with document template
+            model: 'ollama', 'openai' or 'auto', which streams from the provider the router prefers
+            prompt: custom prompt, which should ask for plain text rather than JSON
+        Returns:
+            AsyncIterator[str]: The pieces of the response, in order
+        Raises:
+            ProviderUnavailableError: If the provider's circuit is open or it cannot be reached
+            QueueTimeoutError: If the request waited too long for the provider's rate limits
+            ValueError: If the model is not a valid processing option
+        """
+        if model == AUTO:
+            model = self.router.rank()[0]
+        if model == "ollama":
+            chunks = self.__stream_with_llama
+        elif model == "openai":
+            chunks = self.__stream_with_openai
+        else:
+            raise ValueError("Invalid processing option")
+
+        if not self.health.available(model):
+            raise ProviderUnavailableError(UNAVAILABLE_ERRORS[model])
+
+        async for chunk in chunks(text, prompt):
+            yield chunk
@@ -0,0 +1,185 @@
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import tiktoken
+from pydantic import BaseModel
+
+from app.core.config import (
+    PROMPT_TOKEN_BUDGET_OPENAI,
+    PROMPT_TOKEN_BUDGET_OLLAMA,
+    CHAT_RECENT_TURNS,
+    CHAT_COMPACT_TURN_TOKENS,
+)
+from app.core.models.pydantic_models import Message, PromptUsage
+from app.services.llm_prompts import BASE_PROMPT, CHAT_PROMPT, DOCUMENT_TEMPLATE
+
+# Encoding used to count tokens for each processing option. Llama 3's tokenizer does not
+# ship with tiktoken, cl100k_base is close enough for budgeting
+ENCODINGS = {
+    "openai": "o200k_base",
+    "ollama": "cl100k_base",
+}
+# Characters per token assumed when an encoding cannot be loaded, e.g. without network access on first use
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARK = " …"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str) -> Optional[tiktoken.Encoding]:
+    """ Load a tiktoken encoding once, or None if it is not available """
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"Failed to load {name} encoding, approximating token counts: {e}")
+        return None
+
+
+class PromptAssembler:
+    """
+    Builds the documents sent to the LLM within a per-model token budget.
+
+    The budget covers the system prompt and the rendered DOCUMENT_TEMPLATE. For chats the
+    system prompt, the new message and the feedback are always sent whole, then the resume
+    and the most recent turns verbatim. Older turns are cut down to a few tokens each and,
+    once the budget runs out, the oldest are left out altogether. The resume is only
+    truncated when it does not fit next to the recent turns.
+    """
+
+    def __init__(self,
+        budgets: Optional[Dict[str, int]] = None,
+        recent_turns: int = CHAT_RECENT_TURNS,
+        compact_turn_tokens: int = CHAT_COMPACT_TURN_TOKENS
+    ):
+        self.budgets = budgets or {"openai": PROMPT_TOKEN_BUDGET_OPENAI, "ollama": PROMPT_TOKEN_BUDGET_OLLAMA}
+        self.recent_turns = recent_turns
+        self.compact_turn_tokens = compact_turn_tokens
+
+    def budget(self, model: str) -> int:
+        """ Token budget of a processing option, the smallest one for unknown options """
+        return self.budgets.get(model, min(self.budgets.values()))
+
+    def count(self, text: str, model: str) -> int:
+        """ Number of tokens in text for a processing option """
+        encoding = get_encoding(ENCODINGS.get(model, "cl100k_base"))
+        if encoding is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int, model: str) -> str:
+        """ Cut text down to at most max_tokens, marking the cut """
+        if self.count(text, model) <= max_tokens:
+            return text
+        keep = max_tokens - self.count(TRUNCATION_MARK, model)
+        if keep <= 0:
+            return ""
+
+        encoding = get_encoding(ENCODINGS.get(model, "cl100k_base"))
+        if encoding is None:
+            return text[:keep * CHARS_PER_TOKEN] + TRUNCATION_MARK
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:keep]) + TRUNCATION_MARK
+
+    @staticmethod
+    def serialize_feedback(feedback: Any) -> str:
+        """ Compact JSON of a Feedback (or raw feedback dict) """
+        if isinstance(feedback, BaseModel):
+            return feedback.model_dump_json()
+        return json.dumps(feedback, separators=(",", ":"), default=str)
+
+    def review(self, resume_text: str, model: str, prompt: str = BASE_PROMPT) -> Tuple[str, PromptUsage]:
+        """
+        Render the document for a resume review
+        Args:
+            resume_text: The extracted resume text
+            model: 'ollama' or 'openai'
+            prompt: The system prompt the document is sent with
+        Returns:
+            Tuple[str, PromptUsage]: The rendered document and the tokens it uses
+        """
+        budget = self.budget(model)
+        feedback = self.serialize_feedback({})
+        system = self.count(prompt, model)
+        overhead = self.count(DOCUMENT_TEMPLATE.format(document="", feedback=feedback, chat_history=""), model)
+
+        document = self.truncate(resume_text, budget - system - overhead, model)
+        rendered = DOCUMENT_TEMPLATE.format(document=document, feedback=feedback, chat_history="")
+
+        return rendered, PromptUsage(
+            budget=budget,
+            total=system + self.count(rendered, model),
+            system=system,
+            document=self.count(document, model),
+            document_truncated=document != resume_text
+        )
+
+    def chat(self,
+        resume_text: str,
+        feedback: Any,
+        messages: List[Message],
+        message: str,
+        model: str,
+        prompt: str = CHAT_PROMPT
+    ) -> Tuple[str, PromptUsage]:
+        """
+        Render the document for a new chat message
+        Args:
+            resume_text: The resume text
+            feedback: The resume's Feedback
+            messages: The chat history, oldest first
+            message: The new user message
+            model: 'ollama' or 'openai'
+            prompt: The system prompt the document is sent with
+        Returns:
+            Tuple[str, PromptUsage]: The rendered document and the tokens it uses
+        """
+        budget = self.budget(model)
+        feedback_json = self.serialize_feedback(feedback)
+        current = f"user: {message}"
+        system = self.count(prompt, model)
+        feedback_tokens = self.count(feedback_json, model)
+        message_tokens = self.count(current, model)
+        overhead = self.count(DOCUMENT_TEMPLATE.format(document="", feedback="", chat_history=""), model)
+        fixed = system + overhead + feedback_tokens + message_tokens
+
+        # Each turn costs its own tokens plus the newline joining it to the next
+        lines = [f"{msg.type}: {msg.text}" for msg in messages]
+        recent = lines[-self.recent_turns:] if self.recent_turns > 0 else []
+        recent_tokens = sum(self.count(line, model) + 1 for line in recent)
+
+        document = self.truncate(resume_text, max(budget - fixed - recent_tokens, 0), model)
+        remaining = budget - fixed - self.count(document, model)
+
+        # Walk back from the newest turn until the budget runs out
+        history = []
+        compacted = 0
+        for age, line in enumerate(reversed(lines)):
+            short = line if age < self.recent_turns else self.truncate(line, self.compact_turn_tokens, model)
+            cost = self.count(short, model) + 1
+            if cost > remaining:
+                break
+            history.append(short)
+            compacted += short != line
+            remaining -= cost
+        dropped = len(lines) - len(history)
+        history.reverse()
+        if dropped:
+            history.insert(0, f"[{dropped} earlier messages omitted]")
+
+        chat_history = "\n".join(history) + f"\n{current}"
+        rendered = DOCUMENT_TEMPLATE.format(document=document, feedback=feedback_json, chat_history=chat_history)
+
+        return rendered, PromptUsage(
+            budget=budget,
+            total=system + self.count(rendered, model),
+            system=system,
+            document=self.count(document, model),
+            feedback=feedback_tokens,
+            history=self.count("\n".join(history), model),
+            message=message_tokens,
+            document_truncated=document != resume_text,
+            compacted_turns=compacted,
+            dropped_turns=dropped
+        )
+
+
+prompt_assembler = PromptAssembler()
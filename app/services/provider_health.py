@@ -0,0 +1,181 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.core.config import (
+    PROVIDER_HEALTH_INTERVAL,
+    PROVIDER_PROBE_TIMEOUT,
+    PROVIDER_FAILURE_THRESHOLD,
+    PROVIDER_RECOVERY_SECONDS,
+)
+from app.core.models.pydantic_models import ProviderHealthStatus
+from app.services.llm_clients import llm_clients
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+async def probe_openai() -> bool:
+    """Test connection to the OpenAI API"""
+    client = llm_clients.openai.with_options(timeout=PROVIDER_PROBE_TIMEOUT, max_retries=0)
+    return bool(await client.models.list())
+
+
+async def probe_ollama() -> bool:
+    """Test connection to the LLAMA server"""
+    response = await llm_clients.ollama.get("/api/tags", timeout=PROVIDER_PROBE_TIMEOUT)
+    return response.status_code == 200
+
+
+class ProviderCircuit:
+    """ Health of a single provider, as last probed, and its circuit breaker """
+
+    def __init__(self, name: str, probe: Callable[[], Awaitable[bool]]):
+        self.name = name
+        self.probe = probe
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        # When the one request let through a half open circuit was sent, if it has not finished
+        self.trial_started_at: Optional[float] = None
+        self.healthy: Optional[bool] = None
+        self.latency_ms: Optional[float] = None
+        self.last_checked: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def status(self) -> ProviderHealthStatus:
+        return ProviderHealthStatus(
+            provider=self.name,
+            state=self.state,
+            healthy=self.healthy,
+            consecutive_failures=self.consecutive_failures,
+            latency_ms=self.latency_ms,
+            last_checked=self.last_checked,
+            last_error=self.last_error
+        )
+
+
+class ProviderHealth:
+    """
+    Cached health of the LLM providers with a circuit breaker per provider.
+
+    A loop started from the app lifespan probes every provider in the background, so
+    requests never pay for a probe themselves. Failed probes and failed requests both
+    count towards the breaker: after failure_threshold consecutive failures the circuit
+    opens and requests to that provider fail fast. Once recovery_seconds have passed the
+    circuit is half open and lets one trial request or probe through, rejecting the rest
+    until it finishes, closing again on success and reopening on failure. A trial that
+    never reports back is given up on after another recovery_seconds.
+    """
+
+    def __init__(self,
+        probes: Dict[str, Callable[[], Awaitable[bool]]],
+        interval: float = PROVIDER_HEALTH_INTERVAL,
+        failure_threshold: int = PROVIDER_FAILURE_THRESHOLD,
+        recovery_seconds: float = PROVIDER_RECOVERY_SECONDS
+    ):
+        self.interval = interval
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._circuits = {name: ProviderCircuit(name, probe) for name, probe in probes.items()}
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def available(self, provider: str, admit: bool = True) -> bool:
+        """
+        Whether a request may be sent to the provider, without contacting it
+        Args:
+            provider: Name of the provider
+            admit: Whether the caller is about to send the request, so a half open circuit
+                lets it through as its trial. Pass False to only ask
+        Returns:
+            True if the request may be sent
+        """
+        circuit = self._circuits.get(provider)
+        if circuit is None or circuit.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if circuit.state == OPEN and now - circuit.opened_at >= self.recovery_seconds:
+            circuit.state = HALF_OPEN
+            circuit.trial_started_at = None
+        if circuit.state != HALF_OPEN:
+            return False
+        if circuit.trial_started_at is not None and now - circuit.trial_started_at < self.recovery_seconds:
+            return False
+        if admit:
+            circuit.trial_started_at = now
+        return True
+
+    def record_success(self, provider: str):
+        """ Record a successful call to the provider, closing its circuit """
+        circuit = self._circuits.get(provider)
+        if circuit is None:
+            return
+        circuit.healthy = True
+        circuit.consecutive_failures = 0
+        circuit.state = CLOSED
+        circuit.opened_at = None
+        circuit.trial_started_at = None
+        circuit.last_error = None
+
+    def record_failure(self, provider: str, error: Optional[str] = None):
+        """ Record a failed call to the provider, opening its circuit after too many in a row """
+        circuit = self._circuits.get(provider)
+        if circuit is None:
+            return
+        circuit.healthy = False
+        circuit.consecutive_failures += 1
+        circuit.last_error = error
+        circuit.trial_started_at = None
+        if circuit.state == HALF_OPEN or circuit.consecutive_failures >= self.failure_threshold:
+            circuit.state = OPEN
+            circuit.opened_at = time.monotonic()
+
+    def status(self) -> Dict[str, ProviderHealthStatus]:
+        """ Current health of every provider, for monitoring """
+        return {name: circuit.status() for name, circuit in self._circuits.items()}
+
+    async def check(self, provider: str):
+        """ Probe a provider once and record the outcome """
+        circuit = self._circuits[provider]
+        if circuit.state != CLOSED and not self.available(provider):
+            return
+
+        started = time.perf_counter()
+        try:
+            healthy = await asyncio.wait_for(circuit.probe(), timeout=PROVIDER_PROBE_TIMEOUT * 2)
+            error = None if healthy else "Probe returned an unhealthy response"
+        except Exception as e:
+            healthy = False
+            error = str(e) or type(e).__name__
+        circuit.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        circuit.last_checked = time.time()
+
+        if healthy:
+            self.record_success(provider)
+        else:
+            self.record_failure(provider, error)
+
+    def start(self):
+        """ Start probing the providers in the background """
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self.__probe_loop())
+
+    async def stop(self):
+        """ Stop the background probes """
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    async def __probe_loop(self):
+        while True:
+            await asyncio.gather(*(self.check(provider) for provider in self._circuits))
+            await asyncio.sleep(self.interval)
+
+
+provider_health = ProviderHealth({"openai": probe_openai, "ollama": probe_ollama})
@@ -0,0 +1,228 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from openai import RateLimitError
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+from app.core.config import (
+    OPENAI_REQUESTS_PER_MINUTE,
+    OPENAI_TOKENS_PER_MINUTE,
+    OPENAI_MAX_IN_FLIGHT,
+    OLLAMA_MAX_IN_FLIGHT,
+    EMBEDDINGS_REQUESTS_PER_MINUTE,
+    EMBEDDINGS_TOKENS_PER_MINUTE,
+    EMBEDDINGS_MAX_IN_FLIGHT,
+    LLM_QUEUE_TIMEOUT_SECONDS,
+    LLM_RATE_LIMIT_ATTEMPTS,
+)
+from app.core.models.pydantic_models import RateLimitStats
+
+T = TypeVar("T")
+
+
+class QueueTimeoutError(TimeoutError):
+    """Raised when a call is not admitted before its queue deadline"""
+    pass
+
+
+class TokenBucket:
+    """
+    Allows per_minute units a minute, refilled continuously, so a whole minute's worth can be
+    spent in a burst. A per_minute of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: int) -> float:
+        """ Seconds until amount units are available. Larger amounts than the bucket holds wait for a full bucket """
+        if self.per_minute <= 0:
+            return 0.0
+        self.__refill()
+        missing = min(amount, self.per_minute) - self.level
+        return max(missing, 0) * 60 / self.per_minute
+
+    def take(self, amount: int):
+        if self.per_minute <= 0:
+            return
+        self.__refill()
+        self.level -= min(amount, self.per_minute)
+
+    def drain(self):
+        """ Empty the bucket, e.g. after the provider rejected a call for its own rate limit """
+        if self.per_minute <= 0:
+            return
+        self.__refill()
+        self.level = min(self.level, 0)
+
+
+class ProviderLimiter:
+    """
+    Admits calls to one provider within its request rate, token rate and in-flight limit.
+
+    Calls wait their turn first come, first served: the call at the head of the queue waits
+    for a free slot and for its request and tokens to be available, the others wait behind
+    it. A call that is not admitted within queue_timeout gives up with QueueTimeoutError, so
+    bursts are spread out rather than failed. run() also retries calls the provider rejects
+    with HTTP 429, with jittered exponential backoff, and holds back the calls behind them.
+    """
+
+    def __init__(self,
+        provider: str,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_in_flight: int = 0,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS,
+        attempts: int = LLM_RATE_LIMIT_ATTEMPTS
+    ):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.attempts = attempts
+        self._queue: Deque[asyncio.Future] = deque()
+        self._slot_freed: Optional[asyncio.Future] = None
+        self._in_flight = 0
+        self._admitted = 0
+        self._timeouts = 0
+        self._rate_limited = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0) -> AsyncIterator[None]:
+        """
+        Hold an in-flight slot for the body, after waiting for it in the queue
+        Args:
+            tokens: Estimated tokens of the call, counted against the token rate
+        Raises:
+            QueueTimeoutError: If the call is not admitted within queue_timeout
+        """
+        start = time.monotonic()
+        try:
+            async with asyncio.timeout(self.queue_timeout or None):
+                await self.__admit(tokens)
+        except TimeoutError:
+            self._timeouts += 1
+            raise QueueTimeoutError(f"Too many requests to {self.provider}, try again later.") from None
+
+        wait = time.monotonic() - start
+        self._admitted += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            if self._slot_freed is not None and not self._slot_freed.done():
+                self._slot_freed.set_result(None)
+
+    async def __admit(self, tokens: int):
+        loop = asyncio.get_running_loop()
+        turn = loop.create_future()
+        self._queue.append(turn)
+        try:
+            # Calls left behind by a closed event loop will never take their turn
+            while self._queue[0] is not turn and self._queue[0].get_loop().is_closed():
+                self._queue.popleft()
+            if self._queue[0] is not turn:
+                await turn
+
+            while True:
+                if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                    self._slot_freed = loop.create_future()
+                    await self._slot_freed
+                    continue
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                self._in_flight += 1
+                return
+        finally:
+            # Hand the head of the queue on, also when this call gave up waiting
+            was_head = self._queue[0] is turn
+            self._queue.remove(turn)
+            if was_head and self._queue and not self._queue[0].done():
+                self._queue[0].set_result(None)
+
+    async def run(self, fn: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """
+        Call fn within the limits, retrying it while the provider rejects it for its rate limit
+        Args:
+            fn: Makes the call, once per attempt
+            tokens: Estimated tokens of the call, counted against the token rate
+        Returns:
+            The result of fn
+        Raises:
+            QueueTimeoutError: If an attempt is not admitted within queue_timeout
+            RateLimitError: If the last attempt is still rejected
+        """
+        retrying = AsyncRetrying(
+            retry=retry_if_exception_type(RateLimitError),
+            wait=wait_random_exponential(multiplier=0.5, max=20),
+            stop=stop_after_attempt(max(self.attempts, 1)),
+            reraise=True
+        )
+        async for attempt in retrying:
+            with attempt:
+                async with self.slot(tokens):
+                    try:
+                        return await fn()
+                    except RateLimitError:
+                        self.rate_limited()
+                        raise
+
+    def rate_limited(self):
+        """ Record a call rejected by the provider and hold back the next ones until the request rate refills """
+        self._rate_limited += 1
+        self.requests.drain()
+
+    def stats(self) -> RateLimitStats:
+        return RateLimitStats(
+            provider=self.provider,
+            in_flight=self._in_flight,
+            queued=len(self._queue),
+            max_in_flight=self.max_in_flight,
+            requests_per_minute=self.requests.per_minute,
+            tokens_per_minute=self.tokens.per_minute,
+            admitted=self._admitted,
+            timeouts=self._timeouts,
+            rate_limited=self._rate_limited,
+            mean_wait_ms=round(self._total_wait / self._admitted * 1000, 2) if self._admitted else 0.0,
+            max_wait_ms=round(self._max_wait * 1000, 2)
+        )
+
+
+class RateLimits:
+    """ The limiter of every provider, by name """
+
+    def __init__(self, limiters: Dict[str, ProviderLimiter]):
+        self._limiters = limiters
+
+    def __getitem__(self, provider: str) -> ProviderLimiter:
+        return self._limiters[provider]
+
+    def stats(self) -> Dict[str, RateLimitStats]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+rate_limits = RateLimits({
+    "openai": ProviderLimiter("openai", OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE, OPENAI_MAX_IN_FLIGHT),
+    "ollama": ProviderLimiter("ollama", max_in_flight=OLLAMA_MAX_IN_FLIGHT),
+    "embeddings": ProviderLimiter("embeddings", EMBEDDINGS_REQUESTS_PER_MINUTE, EMBEDDINGS_TOKENS_PER_MINUTE, EMBEDDINGS_MAX_IN_FLIGHT),
+})
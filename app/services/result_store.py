@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Tuple
+
+from app.core.config import RESULT_STORE_MAX_ENTRIES
+from app.core.models.pydantic_models import StoredReview
+from app.services.resume_repository import ResumeRepository
+
+
+class ResultStore:
+    """
+    Content-addressed store of finished upload reviews.
+
+    Results are keyed by (file_id, model option, prompt version). Since file_id is a
+    SHA-256 of the uploaded bytes, a hit means the exact same document has already been
+    extracted, reviewed and embedded. Lookups go through a process-wide LRU first and
+    fall back to the review_results table, so hits are shared across workers.
+    """
+    _memory: "OrderedDict[Tuple[str, str, str], StoredReview]" = OrderedDict()
+    _lock = Lock()
+
+    def __init__(self, resume_repository: ResumeRepository, max_entries: int = RESULT_STORE_MAX_ENTRIES):
+        self.resume_repository = resume_repository
+        self.max_entries = max_entries
+
+    @classmethod
+    def clear_memory(cls):
+        """Drop every review held in the in-memory tier"""
+        with cls._lock:
+            cls._memory.clear()
+
+    def __remember(self, key: Tuple[str, str, str], review: StoredReview):
+        """Insert a review into the in-memory tier, evicting the least recently used"""
+        with self._lock:
+            self._memory[key] = review
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, file_id: str, model_option: str, prompt_version: str) -> Optional[StoredReview]:
+        """
+        Look up a stored review
+        Args:
+            file_id: Content hash of the uploaded file
+            model_option: Model used for the review
+            prompt_version: Version of the review prompt
+        Returns:
+            The stored review, or None on a miss
+        """
+        key = (str(file_id), model_option, prompt_version)
+        with self._lock:
+            review = self._memory.get(key)
+            if review is not None:
+                self._memory.move_to_end(key)
+                return review
+
+        try:
+            review = self.resume_repository.get_review_result(file_id, model_option, prompt_version)
+        except Exception as e:
+            # The store is only an optimization, a failing lookup is treated as a miss
+            print("Result store lookup error: " + str(e))
+            return None
+
+        if review is not None:
+            self.__remember(key, review)
+        return review
+
+    def put(self, file_id: str, model_option: str, prompt_version: str, review: StoredReview):
+        """
+        Store a finished review
+        Args:
+            file_id: Content hash of the uploaded file
+            model_option: Model used for the review
+            prompt_version: Version of the review prompt
+            review: Extracted text, highlight annotations, feedback and embedding
+        """
+        self.__remember((str(file_id), model_option, prompt_version), review)
+        try:
+            self.resume_repository.save_review_result(file_id, model_option, prompt_version, review)
+        except Exception as e:
+            print("Result store save error: " + str(e))
@@ -1,20 +1,38 @@
-from typing import List, Optional, Tuple, Any
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple, Any
+import asyncio
 import hashlib
+import time
 
+from sqlalchemy import func, text
 from sqlalchemy.orm import joinedload
 
+from app.core.config import (
+    UPLOAD_LOCK_TIMEOUT_SECONDS, HNSW_EF_SEARCH, SIMILAR_EXACT_SCAN_MAX_ROWS, SIMILAR_CHUNK_CANDIDATES, CHUNK_AGGREGATE_TOP
+)
 from app.core.database import Database
 from app.core.models.sql_models import (
     Resume,
     ResumeFeedback,
     ResumeEmbedding,
-    ChatSession
+    ResumeChunkEmbedding,
+    ChatSession,
+    ReviewResult
 )
-from app.core.models.pydantic_models import Feedback, SimpleResume
+from app.core.models.pydantic_models import Annotation, Feedback, ResumeChunk, SimilarResume, SimpleResume, StoredReview
+from app.services.data_prep import DataPrep
+from app.services.similarity_engine import SimilarityEngine, similarity_engine
+
+# Similar resume rankings: by whole-resume embedding, by best chunk, or by the mean of the best chunks
+SEARCH_DOCUMENT = "document"
+SEARCH_MAX_SIM = "max_sim"
+SEARCH_AGGREGATE = "aggregate"
+SEARCH_MODES = (SEARCH_DOCUMENT, SEARCH_MAX_SIM, SEARCH_AGGREGATE)
 
 class ResumeRepository:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, similarity: SimilarityEngine = similarity_engine):
         self.db = db
+        self.similarity = similarity
 
     def get_user_resumes(self, user_id: str):
         """Get all resumes for a user"""
@@ -49,21 +67,187 @@ class ResumeRepository:
         finally:
             session.close()
 
+    def search_similar(self,
+        user_id: str,
+        query_vector: List[float],
+        k: int,
+        min_score: Optional[float] = None,
+        mode: str = SEARCH_DOCUMENT
+    ) -> List[SimilarResume]:
+        """
+        Get the k resumes of a user most similar to a query embedding, ranked in Postgres
+        Args:
+            user_id: The ID of the user
+            query_vector: Embedding of the query
+            k: Maximum number of resumes to return
+            min_score: Optional minimum cosine similarity of a returned resume
+            mode: 'document' to rank by whole-resume embeddings, 'max_sim' or 'aggregate' to rank by chunks
+        Returns:
+            List[SimilarResume]: The resumes from the most to the least similar, without their embeddings
+        """
+        if mode != SEARCH_DOCUMENT:
+            return self.__search_chunks(user_id, query_vector, k, min_score, mode)
+
+        session = self.db.get_session()
+        try:
+            user_rows = session.query(
+                func.count(ResumeEmbedding.id)
+            ).join(
+                Resume,
+                ResumeEmbedding.id == Resume.id
+            ).filter(
+                Resume.user_id == user_id
+            ).scalar()
+            self.__scan_user_vectors(session, k, user_rows)
+            distance = ResumeEmbedding.embedding.cosine_distance(query_vector)
+            resumes = session.query(
+                Resume.id,
+                Resume.file_id,
+                Resume.file_name,
+                Resume.created_at,
+                distance.label("distance")
+            ).join(
+                ResumeEmbedding,
+                ResumeEmbedding.id == Resume.id
+            ).filter(
+                Resume.user_id == user_id
+            ).order_by(
+                distance
+            ).limit(k).all()
+
+            # Rows are ordered by distance, so the threshold is applied to the k nearest ones
+            results = [
+                SimilarResume(
+                    id=str(resume.id),
+                    file_id=str(resume.file_id),
+                    file_name=resume.file_name,
+                    created_at=resume.created_at,
+                    score=1 - resume.distance
+                ) for resume in resumes
+            ]
+            if min_score is not None:
+                results = [result for result in results if result.score >= min_score]
+            return results
+        except Exception as e:
+            raise e
+        finally:
+            session.close()
+
+    def __scan_user_vectors(self, session, candidates: int, user_rows: int):
+        """
+        Set up the nearest neighbour query that follows, in the same transaction, to find the nearest
+        candidates of one user. The HNSW index holds the vectors of every user and is filtered by user
+        afterwards, so a plain index scan can run out of its ef_search candidates on other users' rows.
+        Libraries of up to SIMILAR_EXACT_SCAN_MAX_ROWS vectors are scanned exactly, larger ones with an
+        iterative index scan that goes on until enough rows of the user are found. Without iterative
+        scans, before pgvector 0.8, every library is scanned exactly.
+        """
+        if user_rows <= SIMILAR_EXACT_SCAN_MAX_ROWS or not self.db.hnsw_iterative_scan:
+            session.execute(text("SELECT set_config('enable_indexscan', 'off', true)"))
+            return
+        session.execute(
+            text(
+                "SELECT set_config('hnsw.ef_search', :ef_search, true), "
+                "set_config('hnsw.iterative_scan', 'strict_order', true)"
+            ),
+            {"ef_search": str(max(HNSW_EF_SEARCH, candidates))}
+        )
+
+    def __search_chunks(self,
+        user_id: str,
+        query_vector: List[float],
+        k: int,
+        min_score: Optional[float],
+        mode: str
+    ) -> List[SimilarResume]:
+        """
+        Rank resumes by their chunks nearest to the query, SIMILAR_CHUNK_CANDIDATES per requested resume.
+        'max_sim' scores a resume by its best chunk, 'aggregate' by the mean of its best CHUNK_AGGREGATE_TOP,
+        counting chunks beyond the candidates at the score of the furthest candidate, which bounds them.
+        """
+        candidates = k * SIMILAR_CHUNK_CANDIDATES
+        session = self.db.get_session()
+        try:
+            user_rows = session.query(
+                func.count(ResumeChunkEmbedding.resume_id)
+            ).join(
+                Resume,
+                ResumeChunkEmbedding.resume_id == Resume.id
+            ).filter(
+                Resume.user_id == user_id
+            ).scalar()
+            self.__scan_user_vectors(session, candidates, user_rows)
+            distance = ResumeChunkEmbedding.embedding.cosine_distance(query_vector)
+            rows = session.query(
+                Resume.id,
+                Resume.file_id,
+                Resume.file_name,
+                Resume.created_at,
+                ResumeChunkEmbedding.section,
+                ResumeChunkEmbedding.start_offset,
+                ResumeChunkEmbedding.end_offset,
+                distance.label("distance")
+            ).join(
+                ResumeChunkEmbedding,
+                ResumeChunkEmbedding.resume_id == Resume.id
+            ).filter(
+                Resume.user_id == user_id
+            ).order_by(
+                distance
+            ).limit(candidates).all()
+        except Exception as e:
+            raise e
+        finally:
+            session.close()
+
+        # Rows are ordered by distance, so the first row of a resume is its best chunk
+        results: Dict[str, SimilarResume] = {}
+        scores: Dict[str, List[float]] = {}
+        for row in rows:
+            resume_id = str(row.id)
+            if resume_id not in results:
+                results[resume_id] = SimilarResume(
+                    id=resume_id,
+                    file_id=str(row.file_id),
+                    file_name=row.file_name,
+                    created_at=row.created_at,
+                    score=0.0,
+                    match=ResumeChunk(section=row.section or "", start=row.start_offset, end=row.end_offset)
+                )
+                scores[resume_id] = []
+            scores[resume_id].append(1 - row.distance)
+
+        floor = 1 - rows[-1].distance if rows else 0.0
+        for resume_id, result in results.items():
+            if mode == SEARCH_AGGREGATE:
+                best = scores[resume_id][:CHUNK_AGGREGATE_TOP]
+                best += [floor] * (CHUNK_AGGREGATE_TOP - len(best))
+                result.score = sum(best) / len(best)
+            else:
+                result.score = scores[resume_id][0]
+
+        ranked = sorted(results.values(), key=lambda result: -result.score)
+        if min_score is not None:
+            ranked = [result for result in ranked if result.score >= min_score]
+        return ranked[:k]
 
     def get_resume(self,
-        file_id: str
+        file_id: str,
+        user_id: Optional[str] = None
     ) -> Optional[Resume]:
-        """ Get resume by file_id """
+        """ Get resume by file_id, only among the resumes of user_id when it is given """
         session = self.db.get_session()
 
         try:
-            # Get resume by user_id, original_filename, and resume_text
+            filters = [Resume.file_id == file_id]
+            if user_id:
+                filters.append(Resume.user_id == user_id)
             query = session.query(Resume).options(
                 joinedload(Resume.feedback),
                 joinedload(Resume.chatsession),
                 joinedload(Resume.embedding)
             ).filter(
-                Resume.file_id == file_id
+                *filters
             ).first()
             
             return query
@@ -72,47 +256,73 @@ class ResumeRepository:
         finally:
             session.close()
 
+    def __build_resume(self,
+        user_id: str,
+        file_id: str,
+        file_name: str,
+        resume_text: str,
+        feedback: Feedback,
+        embedding: List[float],
+        annotations: List[Annotation],
+        chunks: Optional[List[Tuple[ResumeChunk, List[float]]]] = None
+    ) -> Resume:
+        """ Build a resume row together with its feedback, chat session, embedding and chunk embedding rows """
+        # Create Query items to be inserted
+        feedback_obj = ResumeFeedback(
+            id=file_id,
+            feedback=feedback.model_dump(),
+            annotations=DataPrep.pack_annotations(annotations)
+        )
+        
+        embedding_obj = ResumeEmbedding(
+            id=file_id,
+            embedding=embedding
+        )
+        chat_session_obj = ChatSession(
+            id=file_id,
+            chat_history={}
+        )
+        
+        return Resume(
+            user_id=user_id,
+            file_id=file_id,
+            file_name=file_name,
+            resume_text=resume_text,
+            general_feedback=feedback.general_feedback,
+            overall_score=feedback.overall_score,
+            feedback=feedback_obj,
+            chatsession=chat_session_obj,
+            embedding=embedding_obj,
+            chunk_embeddings=[
+                ResumeChunkEmbedding(
+                    chunk_index=index,
+                    section=chunk.section,
+                    start_offset=chunk.start,
+                    end_offset=chunk.end,
+                    embedding=chunk_embedding
+                ) for index, (chunk, chunk_embedding) in enumerate(chunks or [])
+            ],
+        )
+
     def save_resume_feedback(self,
         user_id: str,
         file_id: str,
         file_name: str,
         resume_text: str,
         feedback: Feedback,
-        embedding: List[float]
+        embedding: List[float],
+        annotations: Optional[List[Annotation]] = None,
+        chunks: Optional[List[Tuple[ResumeChunk, List[float]]]] = None
     ) -> str:
-        """ Save resume feedback and return the file_id """
+        """ Save resume feedback, with the highlight annotations and embedded chunks over resume_text, and return the file_id """
         session = self.db.get_session()
         try:
-            # Create Query items to be inserted
-            feedback_obj = ResumeFeedback(
-                id=file_id,
-                feedback=feedback.model_dump()
-            )
-            
-            embedding_obj = ResumeEmbedding(
-                id=file_id,
-                embedding=embedding
-            )
-            chat_session_obj = ChatSession(
-                id=file_id,
-                chat_history={}
-            )
-            
-            resume = Resume(
-                user_id=user_id,
-                file_id=file_id,
-                file_name=file_name,
-                resume_text=resume_text,
-                general_feedback=feedback.general_feedback,
-                overall_score=feedback.overall_score,
-                feedback=feedback_obj,
-                chatsession=chat_session_obj,
-                embedding=embedding_obj,
-            )
+            resume = self.__build_resume(user_id, file_id, file_name, resume_text, feedback, embedding, annotations or [], chunks)
             
             # Add resume and commit since it is required for the other tables
             session.add(resume)
             session.commit()
+            self.similarity.invalidate(user_id)
 
             return str(file_id)
         except Exception as e:
@@ -123,6 +333,53 @@ class ResumeRepository:
         finally:
             session.close()
 
+    def save_resume_feedback_batch(self,
+        user_id: str,
+        resumes: List[dict]
+    ) -> List[str]:
+        """
+        Save the feedback of many resumes in one transaction and return their file_ids.
+        Each item holds the file_id, file_name, resume_text, feedback, embedding, annotations and optionally chunks arguments of save_resume_feedback.
+        """
+        if not resumes:
+            return []
+        
+        session = self.db.get_session()
+        try:
+            session.add_all([
+                self.__build_resume(user_id=user_id, **resume) for resume in resumes
+            ])
+            session.commit()
+            self.similarity.invalidate(user_id)
+
+            return [str(resume["file_id"]) for resume in resumes]
+        except Exception as e:
+            print(e)
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def get_existing_file_ids(self, user_id: str, file_ids: List[str]) -> Set[str]:
+        """ Get which of the given file_ids the user already has a resume for """
+        if not file_ids:
+            return set()
+        
+        session = self.db.get_session()
+        try:
+            rows = session.query(
+                Resume.file_id
+            ).filter(
+                Resume.user_id == user_id,
+                Resume.file_id.in_(file_ids)
+            ).all()
+            
+            return {str(row.file_id) for row in rows}
+        except Exception as e:
+            raise e
+        finally:
+            session.close()
+
     def save_resume_chat_history(self,
         file_id: str,
         chat_history: List[dict]
@@ -200,4 +457,110 @@ class ResumeRepository:
         except Exception as e:
             raise e
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+
+    def get_review_result(self,
+        file_id: str,
+        model_option: str,
+        prompt_version: str
+    ) -> Optional[StoredReview]:
+        """ Get a stored review result by file_id, model option and prompt version """
+        session = self.db.get_session()
+        
+        try:
+            result = session.query(
+                ReviewResult
+            ).filter(
+                ReviewResult.file_id == file_id,
+                ReviewResult.model_option == model_option,
+                ReviewResult.prompt_version == prompt_version
+            ).first()
+            
+            if not result:
+                return None
+            
+            return StoredReview(
+                extracted_text=result.extracted_text,
+                annotations=DataPrep.unpack_annotations(result.annotations),
+                feedback=Feedback(**result.feedback),
+                embedding=list(result.embedding)
+            )
+        except Exception as e:
+            raise e
+        finally:
+            session.close()
+
+    def save_review_result(self,
+        file_id: str,
+        model_option: str,
+        prompt_version: str,
+        review: StoredReview
+    ):
+        """ Save (or replace) the review result for a file_id, model option and prompt version """
+        session = self.db.get_session()
+        
+        try:
+            session.merge(ReviewResult(
+                file_id=file_id,
+                model_option=model_option,
+                prompt_version=prompt_version,
+                extracted_text=review.extracted_text,
+                annotations=DataPrep.pack_annotations(review.annotations),
+                feedback=review.feedback.model_dump(),
+                embedding=review.embedding
+            ))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    @asynccontextmanager
+    async def advisory_lock(self,
+        name: str,
+        timeout: float = UPLOAD_LOCK_TIMEOUT_SECONDS,
+        poll_interval: float = 0.2
+    ) -> AsyncIterator[bool]:
+        """
+        Hold a Postgres advisory lock, shared by every worker, while the block runs.
+        The lock is polled for rather than waited on, so no thread is blocked while another
+        worker holds it. If it cannot be taken within the timeout, or the database is
+        unavailable, the block runs anyway.
+        Yields:
+            bool: Whether the lock was taken
+        """
+        lock_id = int.from_bytes(hashlib.sha256(name.encode("utf-8")).digest()[:8], "big", signed=True)
+        acquired = False
+        connection = None
+        try:
+            # Session-level advisory locks belong to a connection. It is a dedicated one in autocommit
+            # mode, so a long upload neither holds a pooled connection nor stays idle in a transaction
+            connection = await asyncio.to_thread(self.db.get_lock_connection)
+            deadline = time.monotonic() + timeout
+            while True:
+                acquired = bool(await asyncio.to_thread(lambda: connection.execute(
+                    text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": lock_id}
+                ).scalar()))
+                if acquired or time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(poll_interval)
+        except Exception as e:
+            print("Advisory lock error: " + str(e))
+
+        try:
+            yield acquired
+        finally:
+            if connection is not None:
+                await asyncio.to_thread(self.__release_lock, connection, lock_id if acquired else None)
+
+    @staticmethod
+    def __release_lock(connection, lock_id: Optional[int]):
+        """ Release an advisory lock, if it was taken, and close its connection """
+        try:
+            if lock_id is not None:
+                connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": lock_id})
+        except Exception as e:
+            print("Advisory unlock error: " + str(e))
+        finally:
+            connection.close()
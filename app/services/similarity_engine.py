@@ -0,0 +1,165 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import SIMILARITY_CACHE_MAX_BYTES, SIMILARITY_CACHE_TTL_SECONDS
+from app.core.models.pydantic_models import SimilarResume, SimpleResume
+
+# Where similar resumes are ranked: by pgvector in Postgres, or by SimilarityEngine in the process
+SIMILARITY_PGVECTOR = "pgvector"
+SIMILARITY_MEMORY = "memory"
+
+
+class UserMatrix:
+    """ The resumes of a user, with their embeddings as the unit-length rows of one float32 matrix """
+
+    def __init__(self, resumes: Sequence[SimpleResume]):
+        self.resumes = [
+            SimilarResume(
+                id=resume.id,
+                file_id=resume.file_id,
+                file_name=resume.file_name,
+                created_at=resume.created_at,
+                score=0.0
+            ) for resume in resumes
+        ]
+        if resumes:
+            matrix = np.array([resume.embedding for resume in resumes], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            matrix /= norms
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        self.matrix = np.ascontiguousarray(matrix)
+        self.expires_at = 0.0
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+
+class SimilarityEngine:
+    """
+    Ranks the resumes of a user by cosine similarity to a query embedding, in the process.
+
+    The embeddings of a user are normalized once into a contiguous float32 matrix, so a query
+    is a single matrix-vector product followed by an argpartition of the top k. Matrices are
+    kept in an LRU bounded by their total size and rebuilt after ttl seconds, or as soon as
+    invalidate() is called for the user, which ResumeRepository does whenever it saves a
+    resume. Saves from other workers are only seen after ttl.
+    """
+
+    def __init__(self,
+        max_bytes: int = SIMILARITY_CACHE_MAX_BYTES,
+        ttl: int = SIMILARITY_CACHE_TTL_SECONDS
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._matrices: "OrderedDict[str, UserMatrix]" = OrderedDict()
+        self._bytes = 0
+        self._invalidations = 0
+        self._lock = Lock()
+
+    def __remember(self, user_id: str, entry: UserMatrix, invalidations: int):
+        """ Cache the matrix of a user, evicting the least recently used until it fits """
+        if entry.nbytes > self.max_bytes:
+            return
+        entry.expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            # A resume saved while the matrix was loaded may be missing from it
+            if self._invalidations != invalidations:
+                return
+            previous = self._matrices.pop(user_id, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._matrices[user_id] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._matrices.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def matrix(self, user_id: str, load: Callable[[], List[SimpleResume]]) -> UserMatrix:
+        """ The matrix of a user, built from load() when it is not cached """
+        with self._lock:
+            entry = self._matrices.get(user_id)
+            if entry is not None:
+                if entry.expires_at > time.monotonic():
+                    self._matrices.move_to_end(user_id)
+                    return entry
+                del self._matrices[user_id]
+                self._bytes -= entry.nbytes
+            invalidations = self._invalidations
+
+        entry = UserMatrix(load())
+        self.__remember(user_id, entry, invalidations)
+        return entry
+
+    def invalidate(self, user_id: str):
+        """ Drop the matrix of a user, e.g. after one of their resumes was saved """
+        with self._lock:
+            self._invalidations += 1
+            entry = self._matrices.pop(str(user_id), None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._matrices.clear()
+            self._bytes = 0
+
+    @staticmethod
+    def top_k(matrix: np.ndarray, query_vector: Sequence[float], k: int) -> tuple:
+        """
+        Rows of matrix most similar to a query
+        Args:
+            matrix: Unit-length embeddings, one per row
+            query_vector: Embedding of the query, of any length
+            k: Maximum number of rows to return
+        Returns:
+            tuple: (row indices, cosine similarities), from the most to the least similar.
+                Equal scores are ordered by row.
+        """
+        n = matrix.shape[0]
+        k = min(k, n)
+        if k <= 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = matrix @ (query / norm if norm else query)
+
+        candidates = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return order, scores[order]
+
+    def search(self,
+        user_id: str,
+        query_vector: Sequence[float],
+        k: int,
+        load: Callable[[], List[SimpleResume]],
+        min_score: Optional[float] = None
+    ) -> List[SimilarResume]:
+        """
+        Get the k resumes of a user most similar to a query embedding
+        Args:
+            user_id: The ID of the user
+            query_vector: Embedding of the query
+            k: Maximum number of resumes to return
+            load: Loads the resumes of the user with their embeddings, on a cache miss
+            min_score: Optional minimum cosine similarity of a returned resume
+        Returns:
+            List[SimilarResume]: The resumes from the most to the least similar
+        """
+        entry = self.matrix(str(user_id), load)
+        rows, scores = self.top_k(entry.matrix, query_vector, k)
+        return [
+            entry.resumes[row].model_copy(update={"score": float(score)})
+            for row, score in zip(rows, scores)
+            if min_score is None or score >= min_score
+        ]
+
+
+similarity_engine = SimilarityEngine()
@@ -0,0 +1,61 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one.
+
+    The first caller for a key starts the work, callers that arrive while it is still
+    running wait for the same result (or exception) instead of starting their own. A
+    caller that goes away does not cancel the work for the others, it is only cancelled
+    once every caller has gone away. Nothing is remembered once the work finishes, later
+    calls start afresh.
+    """
+
+    def __init__(self):
+        # key -> [running task, number of callers waiting for it]
+        self._flights: Dict[Hashable, List] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        """ Whether work for the key is currently running """
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn, or wait for the run already in flight for the same key
+        Args:
+            key: Identifies calls that produce the same result
+            fn: Starts the work, only called by the first caller for the key
+        Returns:
+            The result of the shared run
+        """
+        flight = self._flights.get(key)
+        # A run left behind by another event loop, e.g. one that was closed mid-flight, cannot be awaited here
+        if flight is None or flight[0].get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            flight = [task, 0]
+            self._flights[key] = flight
+            task.add_done_callback(lambda done: self.__land(key, done))
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                task.cancel()
+
+    def __land(self, key: Hashable, task: asyncio.Task):
+        flight = self._flights.get(key)
+        if flight is not None and flight[0] is task:
+            del self._flights[key]
+        # Mark the exception as retrieved, every caller may have gone away already
+        if not task.cancelled():
+            task.exception()
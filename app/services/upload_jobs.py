@@ -0,0 +1,173 @@
+import asyncio
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+
+from app.core.config import (
+    UPLOAD_JOB_STALE_SECONDS, UPLOAD_JOB_RECOVERY_INTERVAL, UPLOAD_JOB_MAX_ATTEMPTS, UPLOAD_JOB_HEARTBEAT_SECONDS
+)
+from app.core.models.pydantic_models import UploadJobStatus
+from app.services.job_repository import JobRepository, RUNNING, COMPLETED, FAILED, UNFINISHED_STATES
+from app.services.upload_pipeline import UploadPipeline
+
+
+class UploadJobs:
+    """
+    Runs resume uploads as background jobs.
+
+    Job state lives in the upload_jobs table so that it can be polled from any worker and
+    survives restarts: a recovery loop started from the app lifespan claims jobs that stopped
+    making progress and runs them again. A running job sends a heartbeat every heartbeat_interval
+    seconds, so a single long stage, e.g. a slow review with retries, is not taken for one. Progress is also pushed to in-process listeners so
+    that event streams served by the worker running the job see every stage.
+    """
+
+    def __init__(self,
+        job_repository: JobRepository,
+        stale_after: int = UPLOAD_JOB_STALE_SECONDS,
+        recovery_interval: int = UPLOAD_JOB_RECOVERY_INTERVAL,
+        max_attempts: int = UPLOAD_JOB_MAX_ATTEMPTS,
+        heartbeat_interval: float = UPLOAD_JOB_HEARTBEAT_SECONDS
+    ):
+        self.job_repository = job_repository
+        self.stale_after = stale_after
+        self.recovery_interval = recovery_interval
+        self.max_attempts = max_attempts
+        self.heartbeat_interval = heartbeat_interval
+        self._listeners: Dict[str, Set[asyncio.Queue]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._recovery_task: Optional[asyncio.Task] = None
+
+    def create(self,
+        user_id: Optional[str],
+        file_id: str,
+        file_name: str,
+        model_option: str,
+        payload: bytes
+    ) -> str:
+        """ Persist a new queued job and return its id """
+        return self.job_repository.create_job(user_id, file_id, file_name, model_option, payload)
+
+    def get(self, job_id: str) -> Optional[UploadJobStatus]:
+        """ Get the current status of a job """
+        return self.job_repository.get_job(job_id)
+
+    def __publish(self, status: UploadJobStatus):
+        for queue in self._listeners.get(status.job_id, ()):
+            queue.put_nowait(status)
+
+    async def __update(self, job: UploadJobStatus, **fields) -> UploadJobStatus:
+        """ Persist a job update, off the event loop, and push the new status to listeners """
+        await asyncio.to_thread(self.job_repository.update_job, job.job_id, **fields)
+        job = job.model_copy(update=fields)
+        self.__publish(job)
+        return job
+
+    async def __heartbeat(self, job_id: str):
+        """ Keep touching a running job until cancelled """
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await asyncio.to_thread(self.job_repository.touch_job, job_id)
+            except Exception as e:
+                print(f"Upload job {job_id} heartbeat error: {e}")
+
+    async def run(self, job_id: str, pipeline: UploadPipeline):
+        """
+        Run a queued job through the upload pipeline
+        Args:
+            job_id: The ID of the job
+            pipeline: The pipeline to run the job with
+        """
+        job = await asyncio.to_thread(self.job_repository.get_job_input, job_id)
+        if not job or job.status not in UNFINISHED_STATES:
+            return
+
+        current = UploadJobStatus(
+            job_id=str(job.id),
+            file_id=str(job.file_id),
+            file_name=job.file_name,
+            status=job.status,
+            stage=job.stage
+        )
+        heartbeat = asyncio.create_task(self.__heartbeat(current.job_id))
+        try:
+            current = await self.__update(current, status=RUNNING)
+
+            async def on_stage(stage: str):
+                nonlocal current
+                current = await self.__update(current, stage=stage)
+
+            result = await pipeline.run(
+                source=job.payload,
+                file_id=str(job.file_id),
+                file_name=job.file_name,
+                file_ext=job.file_name.split(".")[-1],
+                model_option=job.model_option,
+                user_id=str(job.user_id) if job.user_id else None,
+                on_stage=on_stage
+            )
+            await self.__update(current, status=COMPLETED, result=jsonable_encoder(result))
+        except Exception as e:
+            print(f"Upload job {job_id} failed: {e}")
+            try:
+                await self.__update(current, status=FAILED, error=str(e))
+            except Exception as update_error:
+                print(f"Failed to record failure of upload job {job_id}: {update_error}")
+        finally:
+            heartbeat.cancel()
+
+    async def events(self, job_id: str, poll_interval: float = 1.0) -> AsyncIterator[UploadJobStatus]:
+        """
+        Yield the status of a job every time it changes, until it completes or fails.
+        Updates are pushed by this worker when it runs the job, and polled from the
+        database otherwise.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(job_id, set()).add(queue)
+        try:
+            last = await asyncio.to_thread(self.get, job_id)
+            if last is None:
+                return
+            yield last
+
+            while last.status in UNFINISHED_STATES:
+                try:
+                    status = await asyncio.wait_for(queue.get(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    # The job may be running on another worker
+                    status = await asyncio.to_thread(self.get, job_id)
+                if status is not None and status != last:
+                    last = status
+                    yield status
+        finally:
+            self._listeners[job_id].discard(queue)
+            if not self._listeners[job_id]:
+                del self._listeners[job_id]
+
+    def start_recovery(self, pipeline_factory: Callable[[], UploadPipeline]):
+        """ Start periodically resuming jobs that were interrupted, e.g. by a worker restart """
+        if self._recovery_task is None:
+            self._recovery_task = asyncio.create_task(self.__recover(pipeline_factory))
+
+    async def stop_recovery(self):
+        """ Stop the recovery loop """
+        if self._recovery_task is not None:
+            self._recovery_task.cancel()
+            try:
+                await self._recovery_task
+            except asyncio.CancelledError:
+                pass
+            self._recovery_task = None
+
+    async def __recover(self, pipeline_factory: Callable[[], UploadPipeline]):
+        while True:
+            try:
+                while job_id := await asyncio.to_thread(self.job_repository.claim_stale_job, self.stale_after, self.max_attempts):
+                    print(f"Resuming upload job {job_id}")
+                    task = asyncio.create_task(self.run(job_id, pipeline_factory()))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            except Exception as e:
+                print("Upload job recovery error: " + str(e))
+            await asyncio.sleep(self.recovery_interval)
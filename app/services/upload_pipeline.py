@@ -0,0 +1,448 @@
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+from app.core.config import BATCH_EXTRACT_CONCURRENCY, BATCH_REVIEW_CONCURRENCY
+
+from app.core.models.pydantic_models import ResumeChunk, StoredReview
+from app.services.category_review import CategoryReview, REVIEW_MODES, REVIEW_PARALLEL, REVIEW_SINGLE
+from app.services.data_prep import DataPrep
+from app.services.file_processing import FileProcessing
+from app.services.process_llm import ProcessLLM
+from app.services.prompt_assembler import PromptAssembler, prompt_assembler
+from app.services.resume_repository import ResumeRepository
+from app.services.result_store import ResultStore
+from app.services.singleflight import SingleFlight
+from app.services.llm_prompts import BASE_PROMPT, PROMPT_VERSION, CATEGORY_PROMPT_VERSION
+
+# Pipeline stages. The review and the embedding run concurrently, so REVIEWED and EMBEDDED may be reported in either order
+EXTRACTED = "extracted"
+REVIEWED = "reviewed"
+EMBEDDED = "embedded"
+SAVED = "saved"
+STAGES = (EXTRACTED, REVIEWED, EMBEDDED, SAVED)
+
+
+# Per-file statuses reported by batch uploads
+BATCH_COMPLETED = "completed"
+BATCH_DUPLICATE = "duplicate"
+BATCH_EXISTS = "exists"
+BATCH_FAILED = "failed"
+BATCH_SAVED = "saved"
+
+
+# Uploads of the same file and model, and embeddings of the same text, in flight in this worker
+upload_flights = SingleFlight()
+embedding_flights = SingleFlight()
+
+
+class UnsupportedFileTypeError(ValueError):
+    """Raised when no text can be extracted from an upload"""
+    pass
+
+
+class ReviewFailedError(RuntimeError):
+    """Raised when the LLM provider returns an error, or feedback that cannot be used, instead of a review"""
+
+    @staticmethod
+    def of(llm_feedback: Any) -> "ReviewFailedError":
+        """ The error of a review that prep_review rejected, with the provider's error when there is one """
+        if isinstance(llm_feedback, dict) and llm_feedback.get("error"):
+            return ReviewFailedError(str(llm_feedback["error"]))
+        return ReviewFailedError("Failed to process resume feedback")
+
+
+class UploadPipeline:
+    """ Extract -> review -> embed -> save pipeline behind resume uploads """
+
+    def __init__(self,
+        resume_repository: ResumeRepository,
+        file_processing: FileProcessing,
+        process_llm: ProcessLLM,
+        result_store: ResultStore,
+        flights: SingleFlight = upload_flights,
+        embeddings: SingleFlight = embedding_flights,
+        assembler: PromptAssembler = prompt_assembler,
+        category_review: Optional[CategoryReview] = None
+    ):
+        self.resume_repository = resume_repository
+        self.file_processing = file_processing
+        self.process_llm = process_llm
+        self.result_store = result_store
+        self.flights = flights
+        self.embeddings = embeddings
+        self.assembler = assembler
+        self.category_review = category_review or CategoryReview(process_llm, assembler)
+
+    async def run(self,
+        source: Union[bytes, BinaryIO],
+        file_id: str,
+        file_name: str,
+        file_ext: str,
+        model_option: str = "openai",
+        user_id: Optional[str] = None,
+        on_stage: Optional[Callable[[str], Awaitable[None]]] = None,
+        review_mode: str = REVIEW_SINGLE,
+        on_feedback: Optional[Callable[[str, Any], Awaitable[None]]] = None
+    ) -> dict:
+        """
+        Run the upload pipeline for one file.
+        Duplicate uploads of the same file and model share one run: within this worker they
+        wait for the run already in flight, and across workers an advisory lock lets only one
+        of them process the file while the others pick up its stored result.
+        Args:
+            source: The raw file bytes or a binary file-like object
+            file_id: Content hash of the file
+            file_name: Original file name
+            file_ext: File extension (pdf or docx)
+            model_option: The model to use for the review
+            user_id: The ID of the user, if any
+            on_stage: Optional coroutine called with the name of each stage as it completes
+            review_mode: 'single' for one review prompt, 'parallel' for one prompt per category sent concurrently
+            on_feedback: Optional coroutine called with each Feedback field and its value as soon as a
+                parallel review completes it. Not called for results that were already stored
+        Returns:
+            dict: A dictionary containing the extracted text, LLM feedback and highlight annotations.
+        Raises:
+            UnsupportedFileTypeError: If no text could be extracted from the file
+            ReviewFailedError: If the LLM provider failed to review the file
+            ValueError: If the review mode is not valid
+        """
+        if review_mode not in REVIEW_MODES:
+            raise ValueError("Invalid review mode")
+
+        async def report(*stages: str):
+            if on_stage:
+                for stage in stages:
+                    await on_stage(stage)
+
+        # Each user saves its own resume, so only the uploads of the same user share a run
+        key = (str(file_id), model_option, review_mode, user_id)
+        shared = key in self.flights
+        # The run outlives the caller that started it, so it must not read from the caller's file,
+        # which is closed as soon as that caller goes away
+        if not shared and not isinstance(source, (bytes, bytearray)):
+            source.seek(0)
+            source = source.read()
+        result = await self.flights.do(key, lambda: self.__run(
+            source, file_id, file_name, file_ext, model_option, user_id, report, review_mode, on_feedback
+        ))
+        if shared:
+            await report(*STAGES)
+        return result
+
+    async def __run(self,
+        source: Union[bytes, BinaryIO],
+        file_id: str,
+        file_name: str,
+        file_ext: str,
+        model_option: str,
+        user_id: Optional[str],
+        report: Callable[..., Awaitable[None]],
+        review_mode: str,
+        on_feedback: Optional[Callable[[str, Any], Awaitable[None]]]
+    ) -> dict:
+        async with self.resume_repository.advisory_lock(f"upload:{file_id}:{model_option}"):
+            return await self.__process(
+                source, file_id, file_name, file_ext, model_option, user_id, report, review_mode, on_feedback
+            )
+
+    async def __process(self,
+        source: Union[bytes, BinaryIO],
+        file_id: str,
+        file_name: str,
+        file_ext: str,
+        model_option: str,
+        user_id: Optional[str],
+        report: Callable[..., Awaitable[None]],
+        review_mode: str,
+        on_feedback: Optional[Callable[[str, Any], Awaitable[None]]]
+    ) -> dict:
+        """
+        Extract, review, embed and save one file, unless it was already done, e.g. by another worker.
+        Database calls run off the event loop, like the extraction and the embeddings
+        """
+        if user_id:
+            # Another user's resume of the same content is not this user's, it is saved again below
+            resume = await asyncio.to_thread(self.resume_repository.get_resume, file_id, user_id)
+            if resume:
+                await report(*STAGES)
+                return {
+                    "extracted_text": resume.resume_text,
+                    "feedback": resume.feedback.feedback,
+                    "annotations": DataPrep.unpack_annotations(resume.feedback.annotations)
+                }
+
+        # Reuse a finished review of the same content before any extraction or LLM work
+        prompt_version = self.__prompt_version(review_mode)
+        stored = await asyncio.to_thread(self.result_store.get, file_id, model_option, prompt_version)
+        if stored:
+            await report(EXTRACTED, REVIEWED, EMBEDDED)
+            if user_id:
+                # Chunk embeddings are not stored with the review, they are usually in the embedding cache
+                chunks = await self.__embed_chunks(stored.extracted_text)
+                await asyncio.to_thread(
+                    self.resume_repository.save_resume_feedback,
+                    user_id=user_id,
+                    file_id=file_id,
+                    file_name=file_name,
+                    resume_text=stored.extracted_text,
+                    feedback=stored.feedback,
+                    embedding=stored.embedding,
+                    annotations=stored.annotations,
+                    chunks=chunks
+                )
+            await report(SAVED)
+            return {"extracted_text": stored.extracted_text, "feedback": stored.feedback, "annotations": stored.annotations}
+
+        # Extract information from the file, off the event loop
+        txt = await self.file_processing.extract_async(source, file_ext)
+        if not txt or txt == "":
+            raise UnsupportedFileTypeError("Unsupported file type")
+        await report(EXTRACTED)
+
+        llm_feedback, (embedding, chunks) = await self.__review_and_embed(txt, model_option, review_mode, report, on_feedback)
+
+        # The text is stored as extracted, highlights are kept as spans over it
+        feedback, annotations = DataPrep.prep_review(txt, llm_feedback)
+        if feedback is None:
+            raise ReviewFailedError.of(llm_feedback)
+
+        await asyncio.to_thread(self.result_store.put, file_id, model_option, prompt_version, StoredReview(
+            extracted_text=txt,
+            annotations=annotations,
+            feedback=feedback,
+            embedding=embedding
+        ))
+
+        await asyncio.to_thread(
+            self.resume_repository.save_resume_feedback,
+            user_id=user_id,
+            file_id=file_id,
+            file_name=file_name,
+            resume_text=txt,
+            feedback=feedback,
+            embedding=embedding,
+            annotations=annotations,
+            chunks=chunks
+        )
+        await report(SAVED)
+
+        return {"extracted_text": txt, "feedback": feedback, "annotations": annotations}
+
+    async def run_batch(self,
+        files: List[Tuple[str, bytes]],
+        user_id: str,
+        model_option: str = "openai",
+        review_mode: str = REVIEW_SINGLE,
+        extract_concurrency: int = BATCH_EXTRACT_CONCURRENCY,
+        review_concurrency: int = BATCH_REVIEW_CONCURRENCY
+    ) -> AsyncIterator[dict]:
+        """
+        Run the upload pipeline for many files at once, yielding one result per file as soon as it is known.
+        Files are deduplicated by content, extracted in parallel, embedded with a single embeddings request
+        (their section chunks with as few as the embedding batcher allows) and reviewed concurrently.
+        Everything is saved with one bulk insert, reported by a final "saved" result.
+        Args:
+            files: List of (file name, file content) tuples
+            user_id: The ID of the user
+            model_option: The model to use for the reviews
+            review_mode: 'single' for one review prompt, 'parallel' for one prompt per category sent concurrently
+            extract_concurrency: Maximum number of files extracted at the same time
+            review_concurrency: Maximum number of LLM reviews running at the same time
+        Returns:
+            AsyncIterator[dict]: Per-file results with file_name, file_id, status and either the extracted text, feedback and annotations or an error
+        """
+        prompt_version = self.__prompt_version(review_mode)
+
+        # Deduplicate by content hash
+        unique = {}
+        for file_name, content in files:
+            file_id = str(self.file_processing.generate_file_id(content))
+            if file_id in unique:
+                yield {"file_name": file_name, "file_id": file_id, "status": BATCH_DUPLICATE}
+                continue
+            unique[file_id] = (file_name, content)
+
+        existing = await asyncio.to_thread(self.resume_repository.get_existing_file_ids, user_id, list(unique))
+        to_save = []
+        to_extract = []
+        for file_id, (file_name, content) in unique.items():
+            if file_id in existing:
+                yield {"file_name": file_name, "file_id": file_id, "status": BATCH_EXISTS}
+                continue
+
+            stored = await asyncio.to_thread(self.result_store.get, file_id, model_option, prompt_version)
+            if stored:
+                to_save.append({
+                    "file_id": file_id,
+                    "file_name": file_name,
+                    "resume_text": stored.extracted_text,
+                    "feedback": stored.feedback,
+                    "embedding": stored.embedding,
+                    "annotations": stored.annotations
+                })
+                yield {"file_name": file_name, "file_id": file_id, "status": BATCH_COMPLETED,
+                       "extracted_text": stored.extracted_text, "feedback": stored.feedback, "annotations": stored.annotations}
+                continue
+
+            to_extract.append((file_id, file_name, content))
+
+        # Extract in parallel, bounded so that a large batch does not overflow the extraction queue
+        extract_limit = asyncio.Semaphore(extract_concurrency)
+
+        async def extract(file_name: str, content: bytes):
+            async with extract_limit:
+                try:
+                    return await self.file_processing.extract_async(content, file_name.split(".")[-1])
+                except Exception as e:
+                    return e
+
+        texts = await asyncio.gather(*(extract(file_name, content) for _, file_name, content in to_extract))
+        extracted = []
+        for (file_id, file_name, _), txt in zip(to_extract, texts):
+            if isinstance(txt, Exception) or not txt:
+                error = str(txt) if isinstance(txt, Exception) else "Unsupported file type"
+                yield {"file_name": file_name, "file_id": file_id, "status": BATCH_FAILED, "error": error}
+                continue
+            extracted.append((file_id, file_name, txt))
+
+        # One embeddings request for the whole batch, and the chunks of every resume to save, running alongside the reviews
+        embed_task = asyncio.create_task(
+            self.file_processing.generate_embeddings_batch_async([txt for _, _, txt in extracted])
+        )
+        chunk_texts = {item["file_id"]: item["resume_text"] for item in to_save}
+        chunk_texts.update((file_id, txt) for file_id, _, txt in extracted)
+        chunk_task = asyncio.create_task(self.__embed_chunks_batch(chunk_texts))
+        review_limit = asyncio.Semaphore(review_concurrency)
+
+        async def review(index: int, file_id: str, file_name: str, txt: str):
+            try:
+                async with review_limit:
+                    llm_feedback = await self.__review(txt, model_option, review_mode)
+                embedding = (await asyncio.shield(embed_task))[index]
+
+                feedback, annotations = DataPrep.prep_review(txt, llm_feedback)
+                if feedback is None:
+                    raise ReviewFailedError.of(llm_feedback)
+
+                await asyncio.to_thread(self.result_store.put, file_id, model_option, prompt_version, StoredReview(
+                    extracted_text=txt,
+                    annotations=annotations,
+                    feedback=feedback,
+                    embedding=embedding
+                ))
+                return file_id, file_name, {
+                    "file_id": file_id,
+                    "file_name": file_name,
+                    "resume_text": txt,
+                    "feedback": feedback,
+                    "embedding": embedding,
+                    "annotations": annotations
+                }
+            except Exception as e:
+                return file_id, file_name, e
+
+        tasks = [asyncio.create_task(review(index, *item)) for index, item in enumerate(extracted)]
+        try:
+            for next_review in asyncio.as_completed(tasks):
+                file_id, file_name, outcome = await next_review
+                if isinstance(outcome, Exception):
+                    yield {"file_name": file_name, "file_id": file_id, "status": BATCH_FAILED, "error": str(outcome)}
+                    continue
+
+                to_save.append(outcome)
+                yield {"file_name": file_name, "file_id": file_id, "status": BATCH_COMPLETED,
+                       "extracted_text": outcome["resume_text"], "feedback": outcome["feedback"],
+                       "annotations": outcome["annotations"]}
+            await asyncio.wait([chunk_task])
+        finally:
+            # Stop outstanding work if the client goes away mid-stream
+            for task in tasks:
+                task.cancel()
+            embed_task.cancel()
+            chunk_task.cancel()
+
+        try:
+            chunks = chunk_task.result()
+            for item in to_save:
+                item["chunks"] = chunks[item["file_id"]]
+            saved = await asyncio.to_thread(self.resume_repository.save_resume_feedback_batch, user_id, to_save)
+            yield {"status": BATCH_SAVED, "file_ids": saved}
+        except Exception as e:
+            yield {"status": BATCH_FAILED, "error": f"Failed to save batch: {e}"}
+
+    @staticmethod
+    def __prompt_version(review_mode: str) -> str:
+        """ Version stored with review results, the review modes use different prompts """
+        return CATEGORY_PROMPT_VERSION if review_mode == REVIEW_PARALLEL else PROMPT_VERSION
+
+    async def __review(self,
+        txt: str,
+        model_option: str,
+        review_mode: str,
+        on_feedback: Optional[Callable[[str, Any], Awaitable[None]]] = None
+    ) -> Any:
+        """ Get the raw LLM review of a resume, with one prompt or one prompt per category """
+        if review_mode == REVIEW_PARALLEL:
+            async def on_part(part: str, value: Any):
+                if not on_feedback:
+                    return
+                try:
+                    await on_feedback(part, value if part == "general_feedback" else DataPrep.prep_category(value))
+                except (KeyError, TypeError, ValueError) as e:
+                    # Left to prep_review to reject once the review is merged
+                    print(f"Error preparing {part} feedback: {e}")
+
+            return await self.category_review.review(txt, model_option, on_part)
+
+        # Long resumes are cut down to the model's prompt budget
+        document, _ = self.assembler.review(txt, model_option, BASE_PROMPT)
+        return await self.process_llm.process(document, model=model_option, prompt=BASE_PROMPT)
+
+    async def __embed_chunks(self, txt: str) -> List[Tuple[ResumeChunk, List[float]]]:
+        """ Split a resume into section chunks and embed them, the embedding batcher sends them together """
+        chunks = DataPrep.chunk_sections(txt)
+        embeddings = await asyncio.gather(*(
+            self.file_processing.generate_embeddings_async(txt[chunk.start:chunk.end]) for chunk in chunks
+        ))
+        return list(zip(chunks, embeddings))
+
+    async def __embed_chunks_batch(self, texts: Dict[str, str]) -> Dict[str, List[Tuple[ResumeChunk, List[float]]]]:
+        """ Embed the chunks of many resumes at once, by file_id """
+        chunks = await asyncio.gather(*(self.__embed_chunks(txt) for txt in texts.values()))
+        return dict(zip(texts, chunks))
+
+    async def __review_and_embed(self,
+        txt: str,
+        model_option: str,
+        review_mode: str,
+        report: Callable[..., Awaitable[None]],
+        on_feedback: Optional[Callable[[str, Any], Awaitable[None]]] = None
+    ) -> Tuple[Any, Tuple[List[float], List[Tuple[ResumeChunk, List[float]]]]]:
+        """
+        Run the LLM review and the embedding concurrently, since they are independent network calls.
+        The resume is embedded whole and in section chunks, see DataPrep.chunk_sections.
+        If either one fails the other is cancelled and the original error is raised.
+        """
+        async def review():
+            llm_feedback = await self.__review(txt, model_option, review_mode, on_feedback)
+            await report(REVIEWED)
+            return llm_feedback
+
+        async def embed_all():
+            return await asyncio.gather(self.file_processing.generate_embeddings_async(txt), self.__embed_chunks(txt))
+
+        async def embed():
+            embedding, chunks = await self.embeddings.do(hashlib.sha256(txt.encode("utf-8")).hexdigest(), embed_all)
+            await report(EMBEDDED)
+            return embedding, chunks
+
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                review_task = task_group.create_task(review())
+                embed_task = task_group.create_task(embed())
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
+
+        return review_task.result(), embed_task.result()
@@ -0,0 +1,120 @@
+"""
+Microbenchmark for DataPrep.clean_text.
+
+Runs the streaming normalizer and the previous implementation over the sample resumes in
+benchmarks/corpus, plus the whole corpus repeated to simulate a long multi-page PDF. It checks
+that both produce exactly the same output and exits with a non-zero status if they differ or
+if the current implementation is slower than --max-ratio times the previous one.
+
+Usage:
+    python benchmarks/bench_clean_text.py [--repeat 200] [--max-ratio 1.0]
+"""
+import argparse
+import contextlib
+import os
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.data_prep import DataPrep
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+
+
+def legacy_clean_text(text: str) -> str:
+    """ DataPrep.clean_text before the single-pass rewrite, kept as the reference implementation """
+    lines = text.split("\n")
+    cleaned = []
+    buffer = ""
+
+    bullet_point = re.compile(r"^\s*[\*\+\-\•]\s+")
+    sentence_end = re.compile(r"[.:!?…\"\')\]]\s*$")
+    possible_headers = re.compile(r"^[A-Z][\w\s,&\-()]{0,40}$")
+    print(lines)
+    for i, line in enumerate(lines):
+        print(line, end=" ")
+
+        line = line.strip()
+        if not line:
+            continue
+
+        if bullet_point.match(line):
+            print("bullet point")
+            if buffer:
+                cleaned.append(buffer.strip())
+            buffer = "*" + line[1:]
+            continue
+
+        if sentence_end.search(line):
+            print("sentence end")
+            buffer += " " + line
+            cleaned.append(buffer.strip())
+            buffer = ""
+            continue
+
+        if possible_headers.match(line):
+            print("header")
+            if buffer:
+                cleaned.append(buffer.strip())
+            cleaned.append(line)
+            buffer = ""
+            continue
+
+        if not buffer:
+            print("buffer")
+            buffer = line
+            continue
+
+        buffer += " " + line
+
+    if buffer:
+        cleaned.append(buffer.strip())
+
+    return "\n".join(cleaned)
+
+
+def load_corpus() -> dict:
+    corpus = {path.name: path.read_text(encoding="utf-8") for path in sorted(CORPUS_DIR.glob("*.txt"))}
+    # Simulate a long multi-page PDF
+    corpus["all_x25"] = "\f\n".join(corpus.values()) * 25
+    return corpus
+
+
+def time_per_call(fn, text: str, repeat: int) -> float:
+    # The legacy implementation prints every line, send that to /dev/null as a log sink would
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return min(timeit.repeat(lambda: fn(text), number=repeat, repeat=3)) / repeat
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="calls per timing run")
+    parser.add_argument("--max-ratio", type=float, default=1.0, help="fail if current / legacy time exceeds this")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'document':<24}{'chars':>8}{'legacy (us)':>14}{'current (us)':>14}{'ratio':>8}")
+    for name, text in load_corpus().items():
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            expected = legacy_clean_text(text)
+        if DataPrep.clean_text(text) != expected:
+            print(f"{name}: output differs from the legacy implementation")
+            failed = True
+            continue
+
+        legacy = time_per_call(legacy_clean_text, text, args.repeat)
+        current = time_per_call(DataPrep.clean_text, text, args.repeat)
+        ratio = current / legacy
+        print(f"{name:<24}{len(text):>8}{legacy * 1e6:>14.1f}{current * 1e6:>14.1f}{ratio:>8.2f}")
+        if ratio > args.max_ratio:
+            print(f"{name}: current implementation is {ratio:.2f}x the legacy time (max {args.max_ratio})")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Microbenchmark for ranking similar resumes in the process.
+
+Compares SimilarityEngine with the previous loop of /resumes/similar-resumes, for libraries of
+random embeddings of 10, 1k and 100k resumes. The engine is timed on a cached matrix, and the
+time to build that matrix on a cache miss is reported separately. It checks that both return
+the same top k and exits with a non-zero status if they differ or if the engine is slower than
+--max-ratio times the previous loop.
+
+The 100k library holds about 600 MB of float32 embeddings, twice while the matrix is built.
+
+Usage:
+    python benchmarks/bench_similar_resumes.py [--sizes 10,1000,100000] [--k 10] [--dimensions 1536] [--max-ratio 1.0]
+"""
+import argparse
+import heapq
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.similarity_engine import SimilarityEngine, UserMatrix
+
+
+def legacy_similar_resumes(query_embedding, user_resumes, k: int) -> list:
+    """ The ranking loop of get_similar_resumes before the similarity engine, kept as the reference implementation """
+    query_embedding = np.array(query_embedding)
+    n = len(user_resumes)
+
+    similarities = []
+    for doc in user_resumes:
+        embedding = np.array(doc.embedding)
+
+        score = np.dot(query_embedding, embedding) / (np.linalg.norm(query_embedding) * np.linalg.norm(embedding))
+        heapq.heappush(similarities, (-score, doc))
+    results = []
+    for score, doc in [heapq.heappop(similarities) for _ in range(n)]:
+        results.append({"id": doc.id, "score": -score})
+    return results[:k]
+
+
+def library(size: int, dimensions: int, rng: np.random.Generator) -> list:
+    """ Resumes as get_user_resumes returns them, with the numpy embeddings pgvector loads """
+    embeddings = rng.standard_normal((size, dimensions), dtype=np.float32)
+    created_at = datetime(2024, 1, 1)
+    return [
+        SimpleNamespace(id=f"id-{i}", file_id=f"file-{i}", file_name=f"resume_{i}.pdf", created_at=created_at, embedding=embedding)
+        for i, embedding in enumerate(embeddings)
+    ]
+
+
+def time_per_call(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,1000,100000", help="comma separated library sizes")
+    parser.add_argument("--k", type=int, default=10, help="resumes returned per query")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--max-ratio", type=float, default=1.0, help="fail if engine / legacy time exceeds this")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    failed = False
+    print(f"{'resumes':>8}{'legacy (ms)':>14}{'engine (ms)':>14}{'build (ms)':>14}{'ratio':>8}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        resumes = library(size, args.dimensions, rng)
+        query = rng.standard_normal(args.dimensions).tolist()
+        engine = SimilarityEngine(max_bytes=2 ** 40)
+
+        expected = [result["id"] for result in legacy_similar_resumes(query, resumes, args.k)]
+        actual = [result.id for result in engine.search("user", query, args.k, load=lambda: resumes)]
+        if actual != expected:
+            print(f"{size}: top {args.k} differs from the legacy implementation")
+            failed = True
+            continue
+
+        # Fewer calls for the larger libraries, the legacy loop takes seconds at 100k
+        repeat = max(1, 10_000 // size)
+        legacy = time_per_call(lambda: legacy_similar_resumes(query, resumes, args.k), repeat)
+        current = time_per_call(lambda: engine.search("user", query, args.k, load=lambda: resumes), repeat * 10)
+        build = time_per_call(lambda: UserMatrix(resumes), repeat)
+        ratio = current / legacy
+        print(f"{size:>8}{legacy * 1e3:>14.3f}{current * 1e3:>14.3f}{build * 1e3:>14.3f}{ratio:>8.3f}")
+        if ratio > args.max_ratio:
+            print(f"{size}: engine is {ratio:.2f}x the legacy time (max {args.max_ratio})")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
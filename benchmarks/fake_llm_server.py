@@ -0,0 +1,275 @@
+"""
+Deterministic stand-in for the OpenAI and Ollama APIs, to benchmark the service without network access.
+
+Speaks the parts of both protocols the app uses:
+    GET  /v1/models, POST /v1/chat/completions (JSON or SSE stream), POST /v1/embeddings
+    GET  /api/tags, POST /api/generate (NDJSON stream or a single JSON object)
+
+Reviews are valid for BASE_PROMPT, with suggestion matches taken from the resume text, as are
+the per-category review answers and the chat answers. The same request always gets the same
+answer. Embeddings are deterministic unit vectors. Latencies are drawn from a configurable
+distribution, streamed answers are paced per piece, and server errors (HTTP 500) and rate
+limits (HTTP 429) can be injected at a given rate.
+
+Latency specs are one of:
+    fixed:MS
+    uniform:LOW_MS:HIGH_MS
+    lognormal:MEDIAN_MS:SIGMA
+
+Usage:
+    python benchmarks/fake_llm_server.py [--port 8089] [--latency lognormal:800:0.5] [--embedding-latency fixed:50]
+                                         [--token-delay-ms 5] [--error-rate 0.01] [--rate-limit-rate 0.01] [--seed 0]
+
+Then point the service at it:
+    OPENAI_BASE_URL=http://localhost:8089/v1 LLAMA_SERVER=http://localhost:8089 OPENAI_API_KEY=fake uvicorn main:app
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, List, Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.llm_prompts import BASE_PROMPT, CATEGORY_DESCRIPTIONS, CATEGORY_PROMPTS
+
+DOCUMENT = re.compile(r"---(.*?)---", re.DOTALL)
+WORD = re.compile(r"[A-Za-z][A-Za-z\-]{4,}")
+PIECE = re.compile(r"\S+\s*|\s+")
+ERRORS = {500: "Injected server error", 429: "Injected rate limit"}
+
+
+class Latency:
+    """ Latency distribution parsed from a spec such as "lognormal:800:0.5", sampled in seconds """
+
+    def __init__(self, spec: str, rng: random.Random):
+        self.rng = rng
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(param) for param in params]
+        if kind not in ("fixed", "uniform", "lognormal") or len(self.params) != {"fixed": 1, "uniform": 2, "lognormal": 2}[kind]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0] / 1000
+        if self.kind == "uniform":
+            return self.rng.uniform(*self.params) / 1000
+        median, sigma = self.params
+        return self.rng.lognormvariate(np.log(median), sigma) / 1000
+
+
+def digest(*parts: Any) -> int:
+    """ Stable seed for the answer to a request """
+    return int.from_bytes(hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).digest()[:8], "big")
+
+
+def review_category(rng: random.Random, words: List[str], name: str) -> dict:
+    match = rng.choice(words) if words else ""
+    return {
+        "score": round(rng.uniform(5.0, 9.5), 1),
+        "strengths": [f"Good {name.replace('_', ' ')}."],
+        "weaknesses": [f"Some {name.replace('_', ' ')} issues."],
+        "suggestions": [{"text": f"Consider rewording \"{match}\".", "match": match}] if match else []
+    }
+
+
+def answer(system: str, user: str, as_json: bool) -> str:
+    """ Deterministic answer to a prompt, in the shape the app expects for it """
+    rng = random.Random(digest(system, user, as_json))
+    document = DOCUMENT.search(user)
+    words = sorted(set(WORD.findall(document.group(1) if document else user)))
+
+    if system == BASE_PROMPT or '"structure_organization"' in system:
+        review = {name: review_category(rng, words, name) for name in CATEGORY_DESCRIPTIONS}
+        review["general_feedback"] = "A solid resume with room to quantify results."
+        return json.dumps(review)
+    if system == CATEGORY_PROMPTS["general_feedback"]:
+        return json.dumps({"general_feedback": "A solid resume with room to quantify results."})
+    for name, prompt in CATEGORY_PROMPTS.items():
+        if system == prompt:
+            return json.dumps(review_category(rng, words, name))
+
+    focus = rng.choice(words) if words else "your experience"
+    text = f"- Lead with measurable results.\n- Expand on **{focus}** with a concrete example.\n- Keep bullet points under two lines."
+    return json.dumps({"response": text}) if as_json else text
+
+
+def embedding(item: Any, dimensions: int) -> np.ndarray:
+    vector = np.random.default_rng(digest(item)).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(
+    latency: str = "fixed:0",
+    embedding_latency: str = "fixed:0",
+    token_delay_ms: float = 0.0,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    dimensions: int = 1536,
+    seed: int = 0
+) -> FastAPI:
+    """ Build the fake server, answers are deterministic and latencies and errors are drawn from seed """
+    rng = random.Random(seed)
+    completion_latency = Latency(latency, rng)
+    embedding_latency = Latency(embedding_latency, rng)
+    token_delay = token_delay_ms / 1000
+    app = FastAPI(title="Fake LLM server")
+
+    def injected_error() -> Optional[int]:
+        """ Status code of an injected error, or None to answer normally """
+        roll = rng.random()
+        if roll < error_rate:
+            return 500
+        if roll < error_rate + rate_limit_rate:
+            return 429
+        return None
+
+    def openai_error(status: int) -> JSONResponse:
+        error_type = "rate_limit_error" if status == 429 else "server_error"
+        return JSONResponse(status_code=status, content={"error": {"message": ERRORS[status], "type": error_type}})
+
+    async def paced(content: str) -> AsyncIterator[str]:
+        """ The pieces of an answer, after the first-token latency and then token_delay apart """
+        await asyncio.sleep(completion_latency.sample())
+        for index, piece in enumerate(PIECE.findall(content)):
+            if index and token_delay:
+                await asyncio.sleep(token_delay)
+            yield piece
+
+    async def generated(content: str):
+        """ Wait as long as streaming the whole answer would take """
+        await asyncio.sleep(completion_latency.sample() + token_delay * max(len(PIECE.findall(content)) - 1, 0))
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "created": 0, "owned_by": "fake"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error:
+            return openai_error(error)
+
+        messages = body.get("messages", [])
+        system = next((message["content"] for message in messages if message["role"] == "system"), "")
+        user = next((message["content"] for message in reversed(messages) if message["role"] == "user"), "")
+        as_json = (body.get("response_format") or {}).get("type") == "json_object"
+        content = answer(system, user, as_json)
+        completion_id = f"chatcmpl-fake-{digest(system, user) % 10 ** 12}"
+        model = body.get("model", "gpt-4o-mini")
+
+        if body.get("stream"):
+            async def events():
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+                async for piece in paced(content):
+                    yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]})}\n\n"
+                yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await generated(content)
+        prompt_tokens = (len(system) + len(user)) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error:
+            return openai_error(error)
+
+        # Text, token ids, or a list of either
+        items = body["input"]
+        if isinstance(items, str) or (items and isinstance(items[0], int)):
+            items = [items]
+        await asyncio.sleep(embedding_latency.sample())
+
+        data = []
+        for index, item in enumerate(items):
+            vector = embedding(item, body.get("dimensions") or dimensions)
+            encoded = base64.b64encode(vector.tobytes()).decode() if body.get("encoding_format") == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": encoded})
+        tokens = sum(len(item) // 4 if isinstance(item, str) else len(item) for item in items)
+        return {"object": "list", "data": data, "model": body.get("model"), "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "llama3.1:latest", "model": "llama3.1:latest", "size": 0}]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error:
+            return JSONResponse(status_code=error, content={"error": ERRORS[error]})
+
+        model = body.get("model", "llama3.1:latest")
+        # A request without a prompt only loads the model
+        if not body.get("prompt"):
+            return {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "response": "", "done": True}
+
+        content = answer(body.get("system", ""), body["prompt"], body.get("format") == "json")
+        line = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ")}
+        final = {**line, "response": "", "done": True, "done_reason": "stop", "eval_count": len(PIECE.findall(content))}
+
+        if body.get("stream", True):
+            async def lines():
+                async for piece in paced(content):
+                    yield json.dumps({**line, "response": piece, "done": False}) + "\n"
+                yield json.dumps(final) + "\n"
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+        await generated(content)
+        return {**final, "response": content}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic fake OpenAI and Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="lognormal:800:0.5", help="Time to the first token of a completion")
+    parser.add_argument("--embedding-latency", default="fixed:50")
+    parser.add_argument("--token-delay-ms", type=float, default=5.0, help="Time between streamed pieces of a completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(
+        latency=args.latency,
+        embedding_latency=args.embedding_latency,
+        token_delay_ms=args.token_delay_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        dimensions=args.dimensions,
+        seed=args.seed
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
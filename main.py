@@ -1,15 +1,56 @@
-from fastapi import FastAPI
+import asyncio
+import threading
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.api.v1.routes.resume import resume_router
 from app.api.v1.routes.chat import chat_router
 from app.api.v1.routes.auth import auth_router
 from app.core.database import database
+from app.core.dependencies import get_upload_jobs, get_process_llm, build_upload_pipeline
+from app.services.extraction_executor import extraction_executor
+from app.services.latency_router import latency_router
+from app.services.llm_cache import llm_cache
+from app.services.embedding_cache import embedding_cache
+from app.services.embedding_batcher import embedding_batcher
+from app.services.llm_clients import llm_clients
+from app.services.provider_health import provider_health
+from app.services.rate_limits import rate_limits
+from app.core.config import MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES, OLLAMA_WARM_ON_STARTUP
+
+# Allowance for the multipart envelope and form fields around the uploaded file
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+# Maximum request body size of the upload endpoints
+UPLOAD_SIZE_LIMITS = {
+    "/resumes/upload": MAX_UPLOAD_BYTES,
+    "/resumes/upload/stream": MAX_UPLOAD_BYTES,
+    "/resumes/upload-batch": MAX_BATCH_UPLOAD_BYTES,
+}
 
 
 async def lifespan(app: FastAPI):
     # Initialize database connection
     database.initialize()
+    # Build missing vector indexes in the background, large tables take long to index
+    threading.Thread(target=database.create_vector_indexes, name="vector-indexes", daemon=True).start()
+    # Start the process pool used for PDF/DOCX extraction
+    extraction_executor.start()
+    # Create the pooled LLM clients shared by every request
+    llm_clients.start()
+    # Probe the LLM providers in the background instead of before every request
+    provider_health.start()
+    # Load the LLAMA model in the background so the first review does not pay for it
+    warm_up = asyncio.create_task(get_process_llm().warm_ollama()) if OLLAMA_WARM_ON_STARTUP else None
+    # Resume upload jobs that were interrupted, e.g. by a restart
+    upload_jobs = get_upload_jobs()
+    upload_jobs.start_recovery(build_upload_pipeline)
     yield
+    await upload_jobs.stop_recovery()
+    if warm_up is not None:
+        warm_up.cancel()
+    await provider_health.stop()
+    await llm_clients.close()
+    extraction_executor.shutdown()
     database.close()
 
 app = FastAPI(lifespan=lifespan, redirect_slashes=False)
@@ -27,10 +68,35 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized uploads from their Content-Length before the body is read"""
+    max_bytes = UPLOAD_SIZE_LIMITS.get(request.url.path)
+    if max_bytes is not None:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File exceeds the maximum upload size of {max_bytes} bytes"}
+            )
+    return await call_next(request)
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Resume Reviewer API"}
 
+@app.get("/health")
+def read_health():
+    """Cached health, circuit state and latencies of the LLM providers, LLM and embedding cache counters, embedding batch sizes and rate limiter queues"""
+    return {
+        "providers": provider_health.status(),
+        "latency": latency_router.stats(),
+        "llm_cache": llm_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batches": embedding_batcher.stats(),
+        "rate_limits": rate_limits.stats()
+    }
+
 
 
 
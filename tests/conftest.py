@@ -13,6 +13,9 @@ from app.services.resume_repository import ResumeRepository
 from app.core.dependencies import get_resume_repository, get_security_repository
 from app.core.database import Database
 from app.core.models.pydantic_models import FeedbackCategory, Feedback, ChatSession
+from app.services.result_store import ResultStore
+from app.services.llm_cache import llm_cache
+from app.services.embedding_cache import embedding_cache
 
 
 @pytest.fixture(scope="module")
@@ -50,6 +53,25 @@ def test_client(mock_resume_repository, mock_security_repository):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(autouse=True)
+def reset_result_store():
+    """ Keep stored upload reviews from leaking between tests """
+    ResultStore.clear_memory()
+    yield
+
+@pytest.fixture(autouse=True)
+def reset_llm_cache():
+    """ Keep cached LLM responses from leaking between tests """
+    llm_cache.clear()
+    yield
+
+@pytest.fixture(autouse=True)
+def reset_embedding_cache():
+    """ Keep cached embeddings from leaking between tests """
+    embedding_cache.clear()
+    yield
+
+
 @pytest.fixture(scope="function")
 def test_resume():
     resume = MagicMock()
@@ -85,11 +107,28 @@ def test_resume_feedback(test_resume):
     test_data = {
         "id": test_resume.id,
         "feedback": feedback_data,
+        # Highlights "test" in test_resume.resume_text
+        "annotations": [[10, 14, "grammar_spelling", 0]],
     }
     
     resume_feedback = MagicMock(**test_data)
     return resume_feedback
 
+@pytest.fixture(scope="function")
+def test_llm_review():
+    """ Raw LLM review, in the shape BASE_PROMPT asks for """
+    category = {
+        "score": 4.5,
+        "strengths": ["Strength 1", "Strength 2"],
+        "weaknesses": ["Weakness 1", "Weakness 2"],
+        "suggestions": [{"text": "Suggestion 1", "match": "test"}, {"text": "Suggestion 2", "match": "resume"}]
+    }
+    review = {name: dict(category) for name in (
+        "structure_organization", "clarity_conciseness", "grammar_spelling", "impact_accomplishments", "ats_readability"
+    )}
+    review["general_feedback"] = "This is a test general feedback."
+    return review
+
 @pytest.fixture(scope="function")
 def test_resume_chat_history(test_resume):
     chat_history = [
@@ -1,7 +1,8 @@
+import json
 import pytest
 from uuid import uuid4
-from unittest.mock import MagicMock, patch
-from app.core.models.pydantic_models import Message, ChatSession, Feedback, FeedbackCategory
+from unittest.mock import patch
+from app.core.models.pydantic_models import Message, ChatSession
 from conftest import mock_resume_repository, test_client, test_resume, test_resume_feedback
 
 @pytest.fixture(scope="function")
@@ -112,3 +113,64 @@ def test_chat_message_invalid_file_id(test_client, mock_session):
     # Should return 404 for non-existent resume
     assert response.status_code == 404
     assert "Resume not found" in response.json()["detail"]
+
+def test_chat_stream(test_client, test_resume, test_resume_feedback):
+    """Test that a streamed chat sends tokens as they arrive and saves the whole response"""
+    test_resume.feedback = test_resume_feedback
+    
+    async def mock_stream(self, text, model, prompt):
+        for chunk in ["Add ", "metrics", "."]:
+            yield chunk
+    
+    with patch('app.services.resume_repository.ResumeRepository.get_resume') as mock_get_resume, \
+         patch('app.services.resume_repository.ResumeRepository.save_resume_chat_history') as mock_save, \
+         patch('app.services.process_llm.ProcessLLM.stream', mock_stream):
+        mock_get_resume.return_value = test_resume
+        response = test_client.post(
+            "/chat/stream",
+            data={
+                "file_id": str(uuid4()),
+                "message": "How can I improve?",
+            }
+        )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [event for event in response.text.split("\n\n") if event]
+    assert events[:3] == [
+        'event: token\ndata: {"text": "Add "}',
+        'event: token\ndata: {"text": "metrics"}',
+        'event: token\ndata: {"text": "."}',
+    ]
+    assert events[3].startswith('event: done\ndata: ')
+    done = json.loads(events[3].split("data: ", 1)[1])
+    assert done["response"] == "Add metrics."
+    assert done["prompt_usage"]["total"] <= done["prompt_usage"]["budget"]
+    
+    saved_history = mock_save.call_args.args[1]
+    assert saved_history[-2] == {"type": "user", "text": "How can I improve?"}
+    assert saved_history[-1] == {"type": "bot", "text": "Add metrics."}
+
+def test_chat_stream_error_is_not_saved(test_client, test_resume, test_resume_feedback):
+    """Test that a failed stream ends with an error event and leaves the chat history alone"""
+    test_resume.feedback = test_resume_feedback
+    
+    async def mock_stream(self, text, model, prompt):
+        yield "Partial"
+        raise RuntimeError("Connection reset")
+    
+    with patch('app.services.resume_repository.ResumeRepository.get_resume') as mock_get_resume, \
+         patch('app.services.resume_repository.ResumeRepository.save_resume_chat_history') as mock_save, \
+         patch('app.services.process_llm.ProcessLLM.stream', mock_stream):
+        mock_get_resume.return_value = test_resume
+        response = test_client.post(
+            "/chat/stream",
+            data={
+                "file_id": str(uuid4()),
+                "message": "How can I improve?",
+            }
+        )
+    
+    assert response.status_code == 200
+    assert response.text.strip().split("\n\n")[-1] == 'event: error\ndata: {"detail": "Connection reset"}'
+    mock_save.assert_not_called()
@@ -1,5 +1,5 @@
 from app.services.data_prep import DataPrep
-from app.core.models.pydantic_models import Feedback, FeedbackCategory
+from app.core.models.pydantic_models import Annotation, Feedback, FeedbackCategory
 
 
 def test_clean_text_success():
@@ -63,6 +63,27 @@ def test_clean_text_with_mixed_content():
     assert DataPrep.clean_text(text).strip() == expected.strip()
 
 
+def test_clean_lines_streams_from_iterator():
+    """Test that clean_lines consumes a line iterator lazily and yields cleaned lines as they complete"""
+    consumed = []
+
+    def lines():
+        for line in ["EXPERIENCE", "• Built a service that", "scaled well.", "SKILLS"]:
+            consumed.append(line)
+            yield line
+
+    cleaned = DataPrep.clean_lines(lines())
+    assert next(cleaned) == "EXPERIENCE"
+    assert consumed == ["EXPERIENCE"]
+    assert list(cleaned) == ["* Built a service that scaled well.", "SKILLS"]
+
+
+def test_clean_text_does_not_print(capsys):
+    """Test that cleaning does not write the document to stdout"""
+    DataPrep.clean_text("SUMMARY\n• First point\nSome text")
+    assert capsys.readouterr().out == ""
+
+
 def test_highlight_text_match():
     """Test highlighting matching text"""
     text = "This is a test"
@@ -78,6 +99,33 @@ def test_highlight_text_no_match():
     color = "bg-yellow-300"
     assert DataPrep.highlight_text(text, match, color) == text
 
+def test_highlight_matches_single_pass():
+    """Test highlighting several matches at once, including repeated occurrences"""
+    text = "Led a team. Grew the team."
+    matches = [("team", "bg-green-300"), ("Led", "bg-red-300")]
+    expected = ("<mark class='bg-red-300'>Led</mark> a <mark class='bg-green-300'>team</mark>. "
+                "Grew the <mark class='bg-green-300'>team</mark>.")
+    assert DataPrep.highlight_matches(text, matches) == expected
+
+def test_highlight_matches_overlaps():
+    """Test that overlapping matches never nest and resolve leftmost, then longest, then first listed"""
+    text = "Managed a team of engineers"
+    matches = [
+        ("a team", "bg-green-300"),
+        ("Managed a", "bg-red-300"),
+        ("team of engineers", "bg-blue-300"),
+        ("engineers", "bg-yellow-400"),
+        ("Managed a", "bg-purple-300"),
+    ]
+    expected = "<mark class='bg-red-300'>Managed a</mark> <mark class='bg-blue-300'>team of engineers</mark>"
+    assert DataPrep.highlight_matches(text, matches) == expected
+
+def test_highlight_matches_ignores_markup_and_empty_matches():
+    """Test that matches are never found inside inserted markup and empty matches are skipped"""
+    text = "Improved class attendance"
+    matches = [("class", "bg-green-300"), ("mark", "bg-red-300"), ("", "bg-blue-300")]
+    assert DataPrep.highlight_matches(text, matches) == "Improved <mark class='bg-green-300'>class</mark> attendance"
+
 def test_prep_output_success():
     """Test preparing output with valid feedback"""
     text = "This is a test resume"
@@ -130,6 +178,28 @@ def test_prep_output_success():
     assert isinstance(result_feedback.structure_organization, FeedbackCategory)
     assert result_feedback.structure_organization.score == 4.5
 
+def test_prep_review_annotations():
+    """Test that prep_review leaves the text alone and returns highlight spans over it"""
+    text = "Led a team of engineers"
+    feedback = {category: {"score": 4.0, "strengths": [], "weaknesses": [], "suggestions": []}
+                for category in ["structure_organization", "clarity_conciseness", "grammar_spelling",
+                                 "impact_accomplishments", "ats_readability"]}
+    feedback["clarity_conciseness"]["suggestions"] = [{"text": "Shorten", "match": "missing"}, {"text": "Quantify", "match": "a team"}]
+    feedback["impact_accomplishments"]["suggestions"] = [{"text": "Say how many", "match": "engineers"}]
+    feedback["general_feedback"] = "Good"
+
+    result_feedback, annotations = DataPrep.prep_review(text, feedback)
+
+    assert result_feedback.clarity_conciseness.suggestions == ["Shorten", "Quantify"]
+    assert annotations == [
+        Annotation(start=4, end=10, category="clarity_conciseness", suggestion_index=1),
+        Annotation(start=14, end=23, category="impact_accomplishments", suggestion_index=0),
+    ]
+    assert DataPrep.unpack_annotations(DataPrep.pack_annotations(annotations)) == annotations
+    assert DataPrep.render_html(text, annotations) == (
+        "Led <mark class='bg-yellow-400'>a team</mark> of <mark class='bg-blue-300'>engineers</mark>"
+    )
+
 def test_prep_output_error_handling():
     """Test error handling in prep_output"""
     text = "Test text"
@@ -138,4 +208,37 @@ def test_prep_output_error_handling():
     result_text, result_feedback = DataPrep.prep_output(text, feedback)
     
     assert result_text == text  
-    assert result_feedback is None
\ No newline at end of file
+    assert result_feedback is None
+
+def test_chunk_sections_follows_headers():
+    """Test that chunks start at headers once they hold min_chars, as spans over the text"""
+    text = (
+        "JANE DOE\n"
+        "Backend engineer building data pipelines.\n"
+        "\n"
+        "EXPERIENCE\n"
+        "  * Led the migration of 14 services to Kubernetes.\n"
+        "EDUCATION\n"
+        "B.S. Computer Science, University of Washington."
+    )
+    chunks = DataPrep.chunk_sections(text, max_chars=200, min_chars=40)
+
+    assert [chunk.section for chunk in chunks] == ["JANE DOE", "EXPERIENCE", "EDUCATION"]
+    assert text[chunks[0].start:chunks[0].end] == "JANE DOE\nBackend engineer building data pipelines."
+    assert text[chunks[1].start:chunks[1].end] == "EXPERIENCE\n  * Led the migration of 14 services to Kubernetes."
+    assert text[chunks[2].end - 1] == "."
+
+    # Short sections stay with the next one
+    merged = DataPrep.chunk_sections(text, max_chars=200, min_chars=100)
+    assert [chunk.section for chunk in merged] == ["JANE DOE", "EDUCATION"]
+
+
+def test_chunk_sections_limits_size():
+    """Test that no chunk is longer than max_chars, cutting long lines between words"""
+    text = "SUMMARY\n" + " ".join(["word"] * 100) + "\nshort line"
+    chunks = DataPrep.chunk_sections(text, max_chars=120, min_chars=10)
+
+    assert all(chunk.end - chunk.start <= 120 for chunk in chunks)
+    assert all(chunk.section == "SUMMARY" for chunk in chunks)
+    assert "".join(text[chunk.start:chunk.end] for chunk in chunks).replace("\n", "").replace(" ", "") == text.replace("\n", "").replace(" ", "")
+    assert DataPrep.chunk_sections("") == []
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+from app.core.database import Database
+
+
+@patch("app.core.database.Base.metadata.create_all")
+@patch("app.core.database.create_engine")
+def test_initialize_brings_schema_up_to_date(mock_create_engine, mock_create_all):
+    """Test that startup creates missing tables and columns, one worker at a time"""
+    conn = mock_create_engine.return_value.connect.return_value.__enter__.return_value
+    conn.execute.return_value.scalar.return_value = "0.8.0"
+    db = Database()
+    try:
+        db.initialize("postgresql://test")
+
+        statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+        assert statements[0] == "SELECT pg_advisory_xact_lock(:lock_id)"
+        mock_create_all.assert_called_once_with(conn, checkfirst=True)
+        assert "ALTER TABLE resume_feedback ADD COLUMN IF NOT EXISTS annotations JSONB" in statements
+        conn.commit.assert_called_once()
+        assert db.hnsw_iterative_scan
+    finally:
+        db._initialized = False
+
+@patch("app.core.database.Database.get_lock_connection")
+def test_vector_indexes_are_built_concurrently_by_one_worker(mock_get_lock_connection):
+    """Test that missing and invalid indexes are built without blocking writes, valid ones are kept"""
+    conn = mock_get_lock_connection.return_value.__enter__.return_value
+    # Lock taken, resume_embeddings index valid, resume_chunk_embeddings index left invalid by an interrupted build
+    conn.execute.return_value.scalar.side_effect = [True, True, False]
+
+    Database().create_vector_indexes()
+
+    statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+    assert not any(statement.startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS resume_embeddings_") for statement in statements)
+    assert "DROP INDEX CONCURRENTLY IF EXISTS resume_chunk_embeddings_embedding_hnsw_idx" in statements
+    assert any(statement.startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS resume_chunk_embeddings_") for statement in statements)
+    assert statements[-1] == "SELECT pg_advisory_unlock(:lock_id)"
+
+    # Another worker holds the lock
+    conn.execute.reset_mock()
+    conn.execute.return_value.scalar.side_effect = [False]
+    Database().create_vector_indexes()
+    assert conn.execute.call_count == 1
@@ -0,0 +1,96 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_cache import EmbeddingCache
+from app.services.file_processing import FileProcessing
+from app.services.rate_limits import ProviderLimiter, RateLimits
+
+
+def recording_flush(batches, delay: float = 0.0):
+    async def flush(texts, tokens):
+        batches.append((list(texts), tokens))
+        await asyncio.sleep(delay)
+        return [[float(len(text))] for text in texts]
+    return flush
+
+async def test_concurrent_requests_share_one_call():
+    """Test that requests within the window are sent together, each text once"""
+    batches = []
+    batcher = EmbeddingBatcher(window_ms=20, max_batch=100, max_tokens=0)
+    flush = recording_flush(batches)
+
+    results = await asyncio.gather(*(
+        batcher.embed("model", text, 1, flush) for text in ("a", "bb", "a", "ccc")
+    ))
+
+    assert results == [[1.0], [2.0], [1.0], [3.0]]
+    assert batches == [(["a", "bb", "ccc"], 3)]
+    assert batcher.stats() == {"requests": 4, "batches": 1, "mean_batch_size": 3.0, "max_batch_size": 3}
+
+async def test_batches_are_sent_at_max_size_and_token_budget():
+    batches = []
+    flush = recording_flush(batches)
+
+    by_size = EmbeddingBatcher(window_ms=10_000, max_batch=2, max_tokens=0)
+    await asyncio.wait_for(asyncio.gather(*(by_size.embed("model", text, 1, flush) for text in ("a", "b"))), 1)
+    assert batches == [(["a", "b"], 2)]
+
+    batches.clear()
+    by_tokens = EmbeddingBatcher(window_ms=5, max_batch=100, max_tokens=10)
+    await asyncio.gather(*(by_tokens.embed("model", text, 4, flush) for text in ("a", "b", "c")))
+    assert batches == [(["a", "b"], 8), (["c"], 4)]
+
+async def test_models_are_batched_separately():
+    batches = []
+    batcher = EmbeddingBatcher(window_ms=5)
+    flush = recording_flush(batches)
+
+    await asyncio.gather(batcher.embed("small", "a", 1, flush), batcher.embed("large", "a", 1, flush))
+
+    assert len(batches) == 2
+
+async def test_batch_errors_reach_every_caller():
+    async def failing(texts, tokens):
+        raise RuntimeError("embeddings unavailable")
+    batcher = EmbeddingBatcher(window_ms=5)
+
+    results = await asyncio.gather(
+        batcher.embed("model", "a", 1, failing),
+        batcher.embed("model", "b", 1, failing),
+        return_exceptions=True
+    )
+
+    assert [str(result) for result in results] == ["embeddings unavailable"] * 2
+
+async def test_cancelled_caller_does_not_cancel_the_others():
+    batches = []
+    batcher = EmbeddingBatcher(window_ms=5)
+    flush = recording_flush(batches, delay=0.05)
+
+    cancelled = asyncio.create_task(batcher.embed("model", "a", 1, flush))
+    waiting = asyncio.create_task(batcher.embed("model", "a", 1, flush))
+    await asyncio.sleep(0.02)
+    cancelled.cancel()
+
+    assert await waiting == [1.0]
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+async def test_generate_embeddings_async_coalesces_concurrent_requests():
+    """Test that concurrent callers of FileProcessing make a single embeddings call"""
+    file_processing = FileProcessing(
+        limits=RateLimits({"embeddings": ProviderLimiter("embeddings")}),
+        cache=EmbeddingCache(),
+        batcher=EmbeddingBatcher(window_ms=20)
+    )
+    file_processing.embedding_model = MagicMock(model="text-embedding-ada-002")
+    file_processing.embedding_model.embed_documents.side_effect = lambda texts: [[float(len(text))] for text in texts]
+
+    queries = ["backend engineer", "data science", "backend  engineer", "devops"]
+    results = await asyncio.gather(*(file_processing.generate_embeddings_async(query) for query in queries))
+
+    assert results == [[16.0], [12.0], [16.0], [6.0]]
+    file_processing.embedding_model.embed_documents.assert_called_once_with(["backend engineer", "data science", "devops"])
@@ -0,0 +1,77 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.file_processing import FileProcessing
+
+
+def file_processing_with(cache: EmbeddingCache) -> FileProcessing:
+    file_processing = FileProcessing(limits=MagicMock(), cache=cache)
+    file_processing.embedding_model = MagicMock(model="text-embedding-ada-002")
+    file_processing.embedding_model.embed_documents.side_effect = lambda texts: [[float(len(text)), 0.5] for text in texts]
+    return file_processing
+
+def test_key_depends_on_model_and_normalized_text():
+    text = EmbeddingCache.normalize("  Backend engineer\n\n with  Python ")
+
+    assert text == "Backend engineer with Python"
+    assert EmbeddingCache.key("model", text) == EmbeddingCache.key("model", EmbeddingCache.normalize("Backend engineer with Python"))
+    assert EmbeddingCache.key("model", text) != EmbeddingCache.key("other model", text)
+
+def test_memory_tier_evicts_least_recently_used_by_size():
+    """Test that the in-memory tier stays within its byte budget of float32 embeddings"""
+    cache = EmbeddingCache(max_bytes=16)
+
+    cache.put_many("model", {"a": [1.0, 1.0], "b": [2.0, 2.0]})
+    assert cache.get_many("model", ["a"]) == {"a": [1.0, 1.0]}
+
+    cache.put_many("model", {"c": [3.0, 3.0]})
+    assert cache.get_many("model", ["a", "b", "c"]) == {"a": [1.0, 1.0], "c": [3.0, 3.0]}
+    assert cache.stats()["bytes"] == 16
+
+def test_store_tier_is_shared_and_failures_are_misses():
+    store = MagicMock()
+    store.get_embeddings.return_value = {EmbeddingCache.key("model", "a"): np.array([1.5, 2.5], dtype="<f4").tobytes()}
+    cache = EmbeddingCache(store)
+
+    assert cache.get_many("model", ["a", "b"]) == {"a": [1.5, 2.5]}
+    # Found in memory the second time
+    assert cache.get_many("model", ["a"]) == {"a": [1.5, 2.5]}
+    assert store.get_embeddings.call_count == 1
+
+    store.get_embeddings.side_effect = Exception("connection refused")
+    assert cache.get_many("model", ["c"]) == {}
+    assert cache.stats() == {
+        "entries": 1, "bytes": 8, "max_bytes": cache.max_bytes,
+        "memory_hits": 1, "store_hits": 1, "misses": 2, "hit_rate": 0.5
+    }
+
+def test_put_many_saves_float32_blobs():
+    store = MagicMock()
+    cache = EmbeddingCache(store)
+
+    assert cache.put_many("model", {"a": [0.1, 0.2]}) == {"a": np.array([0.1, 0.2], dtype=np.float32).tolist()}
+
+    model, rows = store.save_embeddings.call_args.args
+    assert model == "model"
+    assert rows == [(EmbeddingCache.key("model", "a"), np.array([0.1, 0.2], dtype="<f4").tobytes())]
+
+def test_generate_embeddings_batch_only_embeds_missing_texts():
+    """Test that cached and repeated texts are not sent to the embeddings API"""
+    file_processing = file_processing_with(EmbeddingCache())
+
+    first = file_processing.generate_embeddings("data  science")
+    embeddings = file_processing.generate_embeddings_batch(["data science", "backend", "backend"])
+
+    assert embeddings == [first, [7.0, 0.5], [7.0, 0.5]]
+    calls = file_processing.embedding_model.embed_documents.call_args_list
+    assert [call.args[0] for call in calls] == [["data science"], ["backend"]]
+
+async def test_async_memory_hits_skip_the_rate_limiter():
+    file_processing = file_processing_with(EmbeddingCache())
+    file_processing.generate_embeddings("backend engineer")
+
+    assert await file_processing.generate_embeddings_async("backend   engineer") == [16.0, 0.5]
+    assert await file_processing.generate_embeddings_batch_async(["backend engineer"]) == [[16.0, 0.5]]
+    file_processing.limits.__getitem__.assert_not_called()
@@ -0,0 +1,76 @@
+import httpx
+import numpy as np
+from openai import AsyncOpenAI
+
+from benchmarks.fake_llm_server import create_app
+from app.services.data_prep import DataPrep
+from app.services.llm_clients import LLMClients
+from app.services.llm_prompts import BASE_PROMPT, CHAT_STREAM_PROMPT, DOCUMENT_TEMPLATE
+from app.services.process_llm import ProcessLLM
+from app.services.provider_health import ProviderHealth
+
+RESUME = "Software engineer building Python services and PostgreSQL pipelines."
+
+
+def fake_clients(**options) -> LLMClients:
+    """ LLM clients whose OpenAI and LLAMA servers are both the fake server, served in process """
+    transport = httpx.ASGITransport(app=create_app(**options))
+    clients = LLMClients()
+    clients._openai = AsyncOpenAI(
+        api_key="fake",
+        base_url="http://fake.test/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=transport)
+    )
+    clients._ollama = httpx.AsyncClient(base_url="http://fake.test", transport=transport)
+    return clients
+
+
+async def test_reviews_are_valid_and_deterministic():
+    """Test that both protocols return reviews the app can turn into Feedback, the same for the same request"""
+    clients = fake_clients()
+    process_llm = ProcessLLM(clients=clients, health=ProviderHealth({}), cache=None)
+    document = DOCUMENT_TEMPLATE.format(document=RESUME, feedback={}, chat_history="")
+
+    for model in ("openai", "ollama"):
+        first = await process_llm.process(document, model=model, prompt=BASE_PROMPT)
+        second = await process_llm.process(document, model=model, prompt=BASE_PROMPT)
+
+        feedback, annotations = DataPrep.prep_review(RESUME, first)
+        assert first == second
+        assert feedback is not None
+        assert annotations
+    await clients.close()
+
+async def test_streams_chat_from_both_protocols():
+    clients = fake_clients()
+    process_llm = ProcessLLM(clients=clients, health=ProviderHealth({}), cache=None)
+    document = DOCUMENT_TEMPLATE.format(document=RESUME, feedback={}, chat_history="user: How can I improve?")
+
+    for model in ("openai", "ollama"):
+        chunks = [chunk async for chunk in process_llm.stream(document, model=model, prompt=CHAT_STREAM_PROMPT)]
+        assert len(chunks) > 1
+        assert "".join(chunks).startswith("- ")
+    await clients.close()
+
+async def test_embeddings_are_deterministic_unit_vectors():
+    clients = fake_clients()
+
+    response = await clients.openai.embeddings.create(model="text-embedding-ada-002", input=["one", "two", "one"])
+    vectors = [np.array(item.embedding) for item in response.data]
+
+    assert [len(vector) for vector in vectors] == [1536] * 3
+    assert np.allclose(vectors[0], vectors[2])
+    assert not np.allclose(vectors[0], vectors[1])
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0, atol=1e-5)
+    await clients.close()
+
+async def test_injected_errors():
+    clients = fake_clients(error_rate=1.0)
+    health = ProviderHealth({"ollama": None}, failure_threshold=1)
+
+    result = await ProcessLLM(clients=clients, health=health, cache=None).process("text", model="ollama", prompt="")
+
+    assert result == {"error": "Unable to connect to llama server."}
+    assert not health.available("ollama")
+    await clients.close()
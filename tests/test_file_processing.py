@@ -0,0 +1,80 @@
+import asyncio
+import io
+import time
+
+import docx
+import pytest
+
+from app.services.extraction_executor import ExtractionExecutor, ExtractionQueueFullError, ExtractionTimeoutError
+from app.services.file_processing import FileProcessing
+
+
+def make_docx(*paragraphs) -> bytes:
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+async def test_extraction_executor_process_pool():
+    """Test that extraction runs in the process pool and returns cleaned text"""
+    executor = ExtractionExecutor(max_workers=1, max_queue=2, timeout=60)
+    executor.start()
+    try:
+        assert executor.running
+        txt = await executor.run(FileProcessing.extract_text, make_docx("EXPERIENCE", "• Built things."), "docx")
+    finally:
+        executor.shutdown()
+
+    assert txt == "EXPERIENCE\n* Built things."
+    assert executor.pending == 0
+
+
+async def test_extraction_executor_rejects_when_queue_full():
+    """Test that jobs beyond the queue depth are rejected instead of queued"""
+    executor = ExtractionExecutor(max_workers=0, max_queue=1, timeout=5)
+
+    slow_job = asyncio.create_task(executor.run(time.sleep, 0.2))
+    await asyncio.sleep(0)
+
+    with pytest.raises(ExtractionQueueFullError):
+        await executor.run(time.sleep, 0)
+
+    await slow_job
+    assert executor.pending == 0
+
+
+async def test_extraction_executor_timeout():
+    """Test that callers are released once a job exceeds its timeout, but its slot only once it finishes"""
+    executor = ExtractionExecutor(max_workers=0, max_queue=1, timeout=0.05)
+
+    with pytest.raises(ExtractionTimeoutError):
+        await executor.run(time.sleep, 0.3)
+
+    # The job is still running, so it still counts against the queue
+    assert executor.pending == 1
+    with pytest.raises(ExtractionQueueFullError):
+        await executor.run(time.sleep, 0)
+
+    await asyncio.sleep(0.4)
+    assert executor.pending == 0
+
+
+async def test_extraction_executor_process_pool_timeout_keeps_slot_until_done():
+    executor = ExtractionExecutor(max_workers=1, max_queue=2, timeout=0.2)
+    executor.start()
+    try:
+        with pytest.raises(ExtractionTimeoutError):
+            await executor.run(time.sleep, 1)
+        assert executor.pending == 1
+
+        # Released once the worker process really finishes the job
+        for _ in range(100):
+            if executor.pending == 0:
+                break
+            await asyncio.sleep(0.05)
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
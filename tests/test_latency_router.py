@@ -0,0 +1,96 @@
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+
+from app.services.latency_router import LatencyRouter
+from app.services.process_llm import ProcessLLM
+from app.services.provider_health import ProviderHealth
+from test_process_llm import ollama_clients
+
+
+def openai_answer(content: str) -> MagicMock:
+    response = MagicMock()
+    response.choices[0].message.content = content
+    return response
+
+
+def test_rank_prefers_available_reliable_and_fast_providers():
+    health = ProviderHealth({"openai": None, "ollama": None}, failure_threshold=1)
+    router = LatencyRouter(("openai", "ollama"), health=health)
+
+    for _ in range(10):
+        router.record("openai", 2.0)
+        router.record("ollama", 0.5)
+    assert router.rank() == ["ollama", "openai"]
+
+    # Errors outweigh latency
+    for _ in range(5):
+        router.record("ollama", 0.1, ok=False)
+    assert router.rank() == ["openai", "ollama"]
+    assert router.stats()["ollama"].error_rate == round(5 / 15, 4)
+
+    health.record_failure("openai")
+    assert router.rank() == ["ollama", "openai"]
+
+def test_hedge_delay_needs_enough_samples():
+    router = LatencyRouter(("openai", "ollama"), health=ProviderHealth({}), hedge=True, min_samples=5)
+
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        router.record("openai", seconds)
+    assert router.hedge_delay("openai") is None
+
+    router.record("openai", 1.0)
+    assert router.hedge_delay("openai") == 1.0
+    assert router.stats()["openai"].p50_ms == 300.0
+
+async def test_auto_hedges_slow_request_and_cancels_loser():
+    """Test that a request outlasting its provider's p95 is sent to the next provider, and the first answer wins"""
+    cancelled = False
+
+    async def handler(request: httpx.Request):
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        return httpx.Response(200, json={"response": json.dumps({"response": "llama"}), "done": True})
+
+    clients = ollama_clients(handler)
+    clients._openai = AsyncMock()
+    clients._openai.chat.completions.create = AsyncMock(return_value=openai_answer('{"response": "openai"}'))
+    router = LatencyRouter(("openai", "ollama"), health=ProviderHealth({}), hedge=True, min_samples=3)
+    for _ in range(3):
+        router.record("ollama", 0.05)
+        router.record("openai", 0.5)
+    process_llm = ProcessLLM(clients=clients, health=ProviderHealth({}), cache=None, router=router)
+
+    start = time.perf_counter()
+    result = await process_llm.process("text", model="auto", prompt="")
+    await asyncio.sleep(0)
+
+    assert result == {"response": "openai"}
+    assert time.perf_counter() - start < 0.5
+    assert cancelled
+    await clients.close()
+
+async def test_auto_fails_over_to_next_provider():
+    def handler(request: httpx.Request):
+        return httpx.Response(503)
+
+    clients = ollama_clients(handler)
+    clients._openai = AsyncMock()
+    clients._openai.chat.completions.create = AsyncMock(return_value=openai_answer('{"response": "openai"}'))
+    router = LatencyRouter(("openai", "ollama"), health=ProviderHealth({}))
+    router.record("ollama", 0.05)
+    router.record("openai", 0.5)
+    process_llm = ProcessLLM(clients=clients, health=ProviderHealth({}), cache=None, router=router)
+
+    result = await process_llm.process("text", model="auto", prompt="")
+
+    assert result == {"response": "openai"}
+    assert router.stats()["ollama"].error_rate == 0.5
+    await clients.close()
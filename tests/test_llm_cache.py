@@ -0,0 +1,132 @@
+import threading
+from unittest.mock import MagicMock
+
+import httpx
+
+from app.services.llm_cache import LLMCache
+from app.services.llm_clients import LLMClients
+from app.services.process_llm import ProcessLLM
+from app.services.provider_health import ProviderHealth
+
+
+def test_key_depends_on_every_input():
+    key = LLMCache.key("gpt-4o-mini", "prompt", "document", 0.2, 2000)
+
+    assert key == LLMCache.key("gpt-4o-mini", "prompt", "document", 0.2, 2000)
+    assert key != LLMCache.key("llama3.1:latest", "prompt", "document", 0.2, 2000)
+    assert key != LLMCache.key("gpt-4o-mini", "other prompt", "document", 0.2, 2000)
+    assert key != LLMCache.key("gpt-4o-mini", "prompt", "other document", 0.2, 2000)
+    assert key != LLMCache.key("gpt-4o-mini", "prompt", "document", 0.7, 2000)
+    assert key != LLMCache.key("gpt-4o-mini", "prompt", "document", 0.2, 500)
+
+def test_memory_tier_evicts_least_recently_used_by_size():
+    """Test that the in-memory tier stays within its byte budget"""
+    cache = LLMCache(max_bytes=10)
+
+    cache.put("a", "model", "aaaa")
+    cache.put("b", "model", "bbbb")
+    assert cache.get("a") == "aaaa"
+
+    cache.put("c", "model", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+    assert cache.stats()["bytes"] == 8
+
+    # Responses larger than the whole budget are not kept in memory
+    cache.put("d", "model", "d" * 11)
+    assert cache.get("d") is None
+
+def test_memory_tier_expires_entries():
+    cache = LLMCache(ttl=-1)
+
+    cache.put("a", "model", "aaaa")
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+def test_persistent_tier_fills_memory_and_counts_hits():
+    store = MagicMock()
+    store.get_response.side_effect = lambda key: '{"response": "stored"}' if key == "stored" else None
+    cache = LLMCache(store=store, ttl=60)
+
+    assert cache.get("stored") == '{"response": "stored"}'
+    assert cache.get("stored") == '{"response": "stored"}'
+    assert cache.get("missing") is None
+
+    store.get_response.assert_any_call("stored")
+    assert store.get_response.call_count == 2
+    assert cache.stats()["store_hits"] == 1
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    cache.put("new", "gpt-4o-mini", "{}")
+    store.save_response.assert_called_once_with("new", "gpt-4o-mini", "{}", 60)
+
+def test_failing_store_is_a_miss():
+    store = MagicMock()
+    store.get_response.side_effect = RuntimeError("Database is not initialized")
+    store.save_response.side_effect = RuntimeError("Database is not initialized")
+    cache = LLMCache(store=store)
+
+    assert cache.get("key") is None
+    cache.put("key", "model", "{}")
+    assert cache.get("key") == "{}"
+
+async def test_process_reuses_cached_response():
+    """Test that an identical review request does not reach the provider again"""
+    calls = 0
+
+    def handler(request: httpx.Request):
+        nonlocal calls
+        calls += 1
+        return httpx.Response(200, json={"response": '{"response": "Looks good"}', "done": True})
+
+    clients = LLMClients()
+    clients._ollama = httpx.AsyncClient(base_url="http://llama.test", transport=httpx.MockTransport(handler))
+    process_llm = ProcessLLM(clients=clients, health=ProviderHealth({}), cache=LLMCache())
+
+    first = await process_llm.process("document", model="ollama", prompt="prompt")
+    second = await process_llm.process("document", model="ollama", prompt="prompt")
+    third = await process_llm.process("other document", model="ollama", prompt="prompt")
+
+    assert first == second == third == {"response": "Looks good"}
+    assert calls == 2
+    await clients.close()
+
+async def test_process_does_not_cache_errors():
+    def handler(request: httpx.Request):
+        return httpx.Response(200, json={"response": "not json", "done": True})
+
+    clients = LLMClients()
+    clients._ollama = httpx.AsyncClient(base_url="http://llama.test", transport=httpx.MockTransport(handler))
+    cache = LLMCache()
+
+    result = await ProcessLLM(clients=clients, health=ProviderHealth({}), cache=cache).process("document", model="ollama", prompt="")
+
+    assert "error" in result
+    assert cache.stats()["entries"] == 0
+    await clients.close()
+
+async def test_process_reaches_the_store_off_the_event_loop():
+    """Test that persistent cache lookups and saves do not block the event loop, and memory hits skip them"""
+    def handler(request: httpx.Request):
+        return httpx.Response(200, json={"response": '{"response": "Looks good"}', "done": True})
+
+    loop_thread = threading.get_ident()
+    store_threads = []
+    store = MagicMock()
+    store.get_response.side_effect = lambda key: store_threads.append(threading.get_ident())
+    store.save_response.side_effect = lambda *args: store_threads.append(threading.get_ident())
+
+    clients = LLMClients()
+    clients._ollama = httpx.AsyncClient(base_url="http://llama.test", transport=httpx.MockTransport(handler))
+    process_llm = ProcessLLM(clients=clients, health=ProviderHealth({}), cache=LLMCache(store=store))
+
+    await process_llm.process("document", model="ollama", prompt="prompt")
+    await process_llm.process("document", model="ollama", prompt="prompt")
+
+    assert len(store_threads) == 2
+    assert loop_thread not in store_threads
+    assert process_llm.cache.stats()["memory_hits"] == 1
+    await clients.close()
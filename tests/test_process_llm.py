@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import httpx
+
+from app.services.llm_clients import LLMClients
+from app.services.process_llm import ProcessLLM
+from app.services.provider_health import ProviderHealth
+from app.services.rate_limits import ProviderLimiter, RateLimits
+
+
+def ollama_clients(handler) -> LLMClients:
+    """ LLM clients whose LLAMA server is served by the given request handler """
+    clients = LLMClients()
+    clients._ollama = httpx.AsyncClient(base_url="http://llama.test", transport=httpx.MockTransport(handler))
+    return clients
+
+
+async def test_process_with_ollama_awaits_shared_client():
+    """Test that concurrent calls share one async client and do not block each other"""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        assert request.url.path == "/api/generate"
+        answer = json.dumps({"response": json.loads(request.content)["prompt"].upper()})
+        return httpx.Response(200, json={"response": answer, "done": True})
+
+    clients = ollama_clients(handler)
+    limits = RateLimits({"ollama": ProviderLimiter("ollama")})
+    process_llm = ProcessLLM(clients=clients, health=ProviderHealth({}), limits=limits)
+
+    results = await asyncio.gather(*(process_llm.process(f"hello {i}", model="ollama", prompt="") for i in range(5)))
+
+    assert results == [{"response": f"HELLO {i}"} for i in range(5)]
+    assert peak == 5
+    await clients.close()
+
+async def test_process_with_ollama_connection_error_counts_as_failure():
+    def handler(request: httpx.Request):
+        raise httpx.ConnectError("refused")
+
+    clients = ollama_clients(handler)
+    health = ProviderHealth({"ollama": None}, failure_threshold=1)
+
+    result = await ProcessLLM(clients=clients, health=health).process("text", model="ollama", prompt="")
+
+    assert result == {"error": "Unable to connect to llama server."}
+    assert not health.available("ollama")
+    await clients.close()
+
+async def test_stream_with_ollama_parses_ndjson():
+    """Test that streamed NDJSON lines are yielded one piece at a time until done"""
+    def handler(request: httpx.Request):
+        assert json.loads(request.content)["stream"] is True
+        lines = [{"response": "Hello", "done": False}, {"response": " world", "done": False}, {"response": "", "done": True}]
+        return httpx.Response(200, content="\n".join(json.dumps(line) for line in lines).encode())
+
+    clients = ollama_clients(handler)
+    process_llm = ProcessLLM(clients=clients, health=ProviderHealth({}))
+
+    chunks = [chunk async for chunk in process_llm.stream("text", model="ollama", prompt="")]
+
+    assert chunks == ["Hello", " world"]
+    await clients.close()
+
+async def test_process_with_ollama_returns_feedback(test_resume_feedback):
+    """Test that reviews use Ollama's JSON mode and options, and parse into Feedback like OpenAI"""
+    content = test_resume_feedback.feedback.model_dump_json()
+
+    def handler(request: httpx.Request):
+        payload = json.loads(request.content)
+        assert payload["format"] == "json"
+        assert payload["system"] == "prompt"
+        assert payload["options"] == {"temperature": 0.2, "num_predict": 2000}
+        assert "keep_alive" in payload
+        # The response arrives in pieces, one JSON object per line
+        lines = [{"response": content[i:i + 50], "done": False} for i in range(0, len(content), 50)]
+        lines.append({"response": "", "done": True})
+        return httpx.Response(200, content="\n".join(json.dumps(line) for line in lines).encode())
+
+    clients = ollama_clients(handler)
+    result = await ProcessLLM(clients=clients, health=ProviderHealth({})).process("text", model="ollama", prompt="prompt")
+
+    assert result == test_resume_feedback.feedback
+    await clients.close()
+
+async def test_process_with_ollama_unknown_model():
+    def handler(request: httpx.Request):
+        return httpx.Response(404, json={"error": "model 'llama3.1:latest' not found"})
+
+    clients = ollama_clients(handler)
+    health = ProviderHealth({"ollama": None}, failure_threshold=1)
+
+    result = await ProcessLLM(clients=clients, health=health).process("text", model="ollama", prompt="")
+
+    assert "not found" in result["error"]
+    # A rejected request is not an outage
+    assert health.available("ollama")
+    await clients.close()
+
+async def test_process_with_ollama_waits_for_free_slot():
+    """Test that calls beyond the in-flight limit queue instead of reaching the server"""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return httpx.Response(200, json={"response": "{}", "done": True})
+
+    clients = ollama_clients(handler)
+    limits = RateLimits({"ollama": ProviderLimiter("ollama", max_in_flight=2)})
+    process_llm = ProcessLLM(clients=clients, health=ProviderHealth({}), limits=limits)
+
+    results = await asyncio.gather(*(process_llm.process(f"text {i}", model="ollama", prompt="") for i in range(6)))
+
+    assert results == [{}] * 6
+    assert peak == 2
+    assert limits.stats()["ollama"].admitted == 6
+    await clients.close()
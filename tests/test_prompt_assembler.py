@@ -0,0 +1,65 @@
+import json
+
+from app.core.models.pydantic_models import Message
+from app.services.llm_prompts import DOCUMENT_TEMPLATE
+from app.services.prompt_assembler import PromptAssembler
+
+
+def test_review_within_budget_is_unchanged():
+    """Test that a resume that fits is rendered exactly as before"""
+    assembler = PromptAssembler({"openai": 16000})
+
+    document, usage = assembler.review("Python developer", "openai", prompt="prompt")
+
+    assert document == DOCUMENT_TEMPLATE.format(document="Python developer", feedback={}, chat_history="")
+    assert not usage.document_truncated
+    assert usage.total == usage.system + assembler.count(document, "openai")
+
+def test_review_truncates_long_resume_to_budget():
+    assembler = PromptAssembler({"ollama": 300})
+
+    document, usage = assembler.review("experience " * 2000, "ollama", prompt="prompt")
+
+    assert usage.document_truncated
+    assert usage.total <= usage.budget
+    assert "…" in document
+
+def test_chat_serializes_feedback_as_json(test_resume_feedback):
+    """Test that feedback is sent as compact JSON rather than its Python repr"""
+    assembler = PromptAssembler({"openai": 16000})
+    feedback = test_resume_feedback.feedback
+
+    document, usage = assembler.chat("resume", feedback, [], "Hi", "openai", prompt="prompt")
+
+    assert feedback.model_dump_json() in document
+    assert "FeedbackCategory(" not in document
+    assert "---\nuser: Hi---" in document
+    assert usage.feedback == assembler.count(feedback.model_dump_json(), "openai")
+
+def test_chat_compacts_and_drops_older_turns():
+    """Test that recent turns are kept verbatim, older ones cut short, and the oldest left out"""
+    assembler = PromptAssembler({"openai": 400}, recent_turns=2, compact_turn_tokens=10)
+    messages = [Message(type="user" if i % 2 == 0 else "bot", text=f"turn {i} " + "word " * 50) for i in range(20)]
+
+    document, usage = assembler.chat("resume", {}, messages, "What next?", "openai", prompt="prompt")
+
+    assert usage.total <= usage.budget
+    assert messages[-1].text in document
+    assert messages[-2].text in document
+    assert messages[-3].text not in document
+    assert usage.compacted_turns > 0
+    assert usage.dropped_turns > 0
+    assert f"[{usage.dropped_turns} earlier messages omitted]" in document
+    assert not usage.document_truncated
+
+def test_chat_truncates_resume_before_recent_turns():
+    assembler = PromptAssembler({"openai": 300}, recent_turns=2)
+    messages = [Message(type="user", text="Hello"), Message(type="bot", text="Hi there!")]
+
+    document, usage = assembler.chat("skill " * 2000, {}, messages, "Thanks", "openai", prompt="prompt")
+
+    assert usage.document_truncated
+    assert usage.dropped_turns == 0
+    assert "user: Hello\nbot: Hi there!\nuser: Thanks" in document
+    assert usage.total <= usage.budget
+    assert json.loads(usage.model_dump_json())["budget"] == 300
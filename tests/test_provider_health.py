@@ -0,0 +1,107 @@
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.provider_health import ProviderHealth, CLOSED, OPEN, HALF_OPEN
+from app.services.process_llm import ProcessLLM
+
+
+def test_circuit_opens_after_repeated_failures():
+    """Test that requests fail fast once a provider failed too many times in a row"""
+    health = ProviderHealth({"openai": MagicMock()}, failure_threshold=3, recovery_seconds=60)
+
+    for _ in range(2):
+        health.record_failure("openai", "timeout")
+    assert health.available("openai")
+
+    health.record_failure("openai", "timeout")
+    assert not health.available("openai")
+    assert health.status()["openai"].state == OPEN
+    assert health.status()["openai"].last_error == "timeout"
+
+def test_circuit_half_opens_after_recovery_time():
+    """Test that an open circuit lets a trial through after the recovery time and closes on success"""
+    health = ProviderHealth({"ollama": MagicMock()}, failure_threshold=1, recovery_seconds=0.05)
+
+    health.record_failure("ollama")
+    assert not health.available("ollama")
+
+    time.sleep(0.06)
+    assert health.available("ollama")
+    assert health.status()["ollama"].state == HALF_OPEN
+
+    health.record_success("ollama")
+    assert health.status()["ollama"].state == CLOSED
+    assert health.status()["ollama"].consecutive_failures == 0
+
+def test_half_open_circuit_admits_one_trial():
+    """Test that a half open circuit lets a single trial through and rejects the rest until it finishes"""
+    health = ProviderHealth({"openai": MagicMock()}, failure_threshold=1, recovery_seconds=0.05)
+
+    health.record_failure("openai")
+    time.sleep(0.06)
+    assert health.available("openai", admit=False)
+    assert health.available("openai")
+    assert not health.available("openai")
+    assert not health.available("openai", admit=False)
+
+    health.record_failure("openai")
+    assert health.status()["openai"].state == OPEN
+    time.sleep(0.06)
+    assert health.available("openai")
+    # A trial that never reports back is given up on
+    time.sleep(0.06)
+    assert health.available("openai")
+    assert not health.available("openai")
+
+    health.record_success("openai")
+    assert health.available("openai")
+    assert health.available("openai")
+
+def test_failed_trial_reopens_circuit():
+    health = ProviderHealth({"ollama": MagicMock()}, failure_threshold=3, recovery_seconds=0)
+
+    for _ in range(3):
+        health.record_failure("ollama")
+    assert health.available("ollama")
+
+    health.record_failure("ollama")
+    assert health.status()["ollama"].state == OPEN
+
+async def test_check_records_probe_outcome_and_latency():
+    """Test that background probes are cached with their latency"""
+    probe = AsyncMock(side_effect=[True, ConnectionError("refused")])
+    health = ProviderHealth({"openai": probe}, failure_threshold=1, recovery_seconds=60)
+
+    await health.check("openai")
+    status = health.status()["openai"]
+    assert status.healthy is True
+    assert status.latency_ms is not None
+    assert status.last_checked is not None
+
+    await health.check("openai")
+    status = health.status()["openai"]
+    assert status.healthy is False
+    assert status.state == OPEN
+    assert status.last_error == "refused"
+
+    # No probe while the circuit is open
+    await health.check("openai")
+    assert probe.call_count == 2
+
+async def test_process_fails_fast_without_probing():
+    """Test that an open circuit skips the provider entirely"""
+    health = ProviderHealth({"ollama": AsyncMock()}, failure_threshold=1, recovery_seconds=60)
+    health.record_failure("ollama")
+    clients = MagicMock()
+
+    result = await ProcessLLM(clients=clients, health=health).process("text", model="ollama", prompt="prompt")
+
+    assert result == {"error": "Unable to connect to llama server."}
+    clients.ollama.get.assert_not_called()
+    clients.ollama.post.assert_not_called()
+
+def test_health_endpoint(test_client):
+    response = test_client.get("/health")
+
+    assert response.status_code == 200
+    assert set(response.json()["providers"]) == {"openai", "ollama"}
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from app.services.rate_limits import ProviderLimiter, QueueTimeoutError, TokenBucket
+
+
+def rate_limit_error() -> RateLimitError:
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_token_bucket_refills_over_a_minute():
+    bucket = TokenBucket(60)
+
+    bucket.take(60)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
+    # Requests larger than the bucket wait for a full bucket rather than forever
+    assert bucket.wait_time(1000) <= 60
+    assert TokenBucket(0).wait_time(10 ** 9) == 0
+
+async def test_queue_is_first_come_first_served():
+    """Test that calls waiting for a slot are admitted in arrival order"""
+    limiter = ProviderLimiter("openai", max_in_flight=1)
+    order = []
+
+    async def call(index: int):
+        async with limiter.slot():
+            order.append(index)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(call(index) for index in range(5)))
+
+    assert order == list(range(5))
+    stats = limiter.stats()
+    assert stats.admitted == 5
+    assert stats.in_flight == 0
+    assert stats.queued == 0
+    assert stats.max_wait_ms >= 30
+
+async def test_request_rate_spreads_out_bursts():
+    limiter = ProviderLimiter("openai", requests_per_minute=600)
+    limiter.requests.level = 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limiter.run(lambda: asyncio.sleep(0)) for _ in range(3)))
+
+    # One request every 0.1s once the bucket is empty
+    assert time.perf_counter() - start >= 0.18
+
+async def test_queue_deadline_gives_up():
+    limiter = ProviderLimiter("openai", max_in_flight=1, queue_timeout=0.05)
+
+    async with limiter.slot():
+        with pytest.raises(QueueTimeoutError):
+            async with limiter.slot():
+                pass
+
+    assert limiter.stats().timeouts == 1
+    # The queue is free again for the next call
+    async with limiter.slot():
+        assert limiter.stats().in_flight == 1
+
+async def test_run_retries_rate_limited_calls():
+    """Test that HTTP 429 responses are retried with backoff instead of failing the call"""
+    limiter = ProviderLimiter("openai", attempts=3)
+    attempts = 0
+
+    async def call():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise rate_limit_error()
+        return "ok"
+
+    assert await limiter.run(call) == "ok"
+    assert attempts == 3
+    assert limiter.stats().rate_limited == 2
+
+async def test_run_gives_up_after_last_attempt():
+    limiter = ProviderLimiter("openai", attempts=1)
+
+    async def call():
+        raise rate_limit_error()
+
+    with pytest.raises(RateLimitError):
+        await limiter.run(call)
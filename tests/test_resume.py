@@ -1,11 +1,27 @@
 from conftest import mock_db, mock_security_repository, test_client, test_resume, test_resume_feedback, test_resume_chat_history, test_resume_embedding
-from main import app
-from unittest.mock import MagicMock, patch, mock_open
+from main import app, UPLOAD_FORM_OVERHEAD
+from fastapi import UploadFile
+import asyncio
+import io
+import json
+import re
+import zipfile
+import pytest
+from tempfile import SpooledTemporaryFile
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 import numpy as np
 
+from app.core.config import MAX_UPLOAD_BYTES, SIMILAR_EXACT_SCAN_MAX_ROWS
 from app.services.resume_repository import ResumeRepository
-from app.core.utils.security import hash_password, verify_password
-from app.services.file_processing import FileProcessing
+from app.services.file_processing import FileProcessing, UploadTooLargeError
+from app.core.models.pydantic_models import Annotation, StoredReview, UploadJobStatus
+from app.core.dependencies import get_upload_jobs
+from app.services.job_repository import JobRepository
+from app.services.upload_jobs import UploadJobs
+from app.services.llm_prompts import CATEGORY_PROMPTS
+from app.services.upload_pipeline import STAGES
+from app.api.v1.routes.resume import upload_resume_stream
 
 def test_get_all_resumes_success(test_client, mock_session, test_resume):
     """ Test successful retrieval of all resumes through resume root endpoint"""  
@@ -71,6 +87,8 @@ def test_get_resume_success(test_client, mock_session, test_resume, test_resume_
 
     assert response.status_code == 200
     assert response_data["extracted_text"] == test_resume.resume_text
+    assert response_data["annotations"] == [{"start": 10, "end": 14, "category": "grammar_spelling", "suggestion_index": 0}]
+    assert "highlighted_text" not in response_data
     
     feedback_data = response_data["feedback"]
     assert isinstance(feedback_data, dict)
@@ -82,6 +100,21 @@ def test_get_resume_success(test_client, mock_session, test_resume, test_resume_
     assert mock_session.query.call_count == query_count + 1
     assert mock_session.close.call_count == close_count + 1
 
+def test_get_resume_highlighted(test_client, mock_session, test_resume, test_resume_feedback):
+    """ Test that highlights are only rendered into the text when the client asks for them """
+    test_resume.feedback = test_resume_feedback
+    mock_session.query.return_value.options.return_value.filter.return_value.first.return_value = test_resume
+    
+    response = test_client.post("/resumes/file",
+        data={
+            "file_id": str(test_resume.file_id),
+            "highlight": "true"
+        })
+    
+    assert response.status_code == 200
+    assert response.json()["extracted_text"] == test_resume.resume_text
+    assert response.json()["highlighted_text"] == "This is a <mark class='bg-red-300'>test</mark> resume text."
+
 def test_get_resume_no_file_id(test_client, mock_session):
     query_count = mock_session.query.call_count
     close_count = mock_session.close.call_count
@@ -100,32 +133,24 @@ def test_get_resume_no_file_id(test_client, mock_session):
     assert mock_session.close.call_count == close_count + 1
     
 @patch("app.services.process_llm.ProcessLLM.process")
-@patch("app.services.file_processing.FileProcessing.generate_embeddings")
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
 @patch("app.services.file_processing.FileProcessing.extract")
-@patch("app.services.file_processing.FileProcessing.generate_file_id")
-@patch("builtins.open", new_callable=mock_open)
-@patch("os.path.exists")
-@patch("os.remove")
-def test_upload_resume_success(mock_remove, mock_exists, mock_open_file, mock_generate_file_id, 
-                             mock_extract, mock_generate_embeddings, mock_process, 
+def test_upload_resume_success(mock_extract, mock_generate_embeddings, mock_process, 
                              test_client, mock_session, test_resume, 
                              test_resume_embedding, test_resume_feedback):
     """Test successful upload of a resume through upload endpoint"""
-    mock_exists.return_value = True
-    mock_generate_file_id.return_value = test_resume.file_id
     mock_extract.return_value = test_resume.resume_text
-    mock_generate_embeddings.return_value = test_resume_embedding.embedding
+    mock_generate_embeddings.return_value = [test_resume_embedding.embedding]
     
-    processed_text = "Processed resume text"
     mock_process.return_value = test_resume_feedback.feedback
-    mock_prep_output = MagicMock(return_value=(processed_text, test_resume_feedback.feedback))
+    mock_prep_review = MagicMock(return_value=(test_resume_feedback.feedback, []))
     
     mock_session.query.return_value.filter.return_value.first.return_value = None  # No existing resume
     
     file_bytes = bytes(test_resume.resume_text, "utf-8")
     test_filename = "test_resume.pdf"
     
-    with patch('app.api.v1.routes.resume.DataPrep.prep_output', mock_prep_output):
+    with patch('app.services.upload_pipeline.DataPrep.prep_review', mock_prep_review):
         response = test_client.post(
             "/resumes/upload",
             files={"file": (test_filename, file_bytes, "application/pdf")},
@@ -135,23 +160,83 @@ def test_upload_resume_success(mock_remove, mock_exists, mock_open_file, mock_ge
     assert response.status_code == 200
     response_data = response.json()
     
-    assert "extracted_text" in response_data
+    # The text is returned and stored as extracted, highlights travel as annotations
+    assert response_data["extracted_text"] == test_resume.resume_text
+    assert response_data["annotations"] == []
     assert "feedback" in response_data
+    assert mock_session.add.call_args.args[0].resume_text == test_resume.resume_text
     
-    mock_open_file.assert_called_once()
+    # Extraction reads straight from the spooled upload, no temp file is written
     mock_extract.assert_called_once()
-    mock_remove.assert_called_once_with(f"temp.pdf")
+    source, file_ext = mock_extract.call_args.args
+    assert not isinstance(source, str)
+    assert file_ext == "pdf"
     
     mock_process.assert_called_once()
-    mock_generate_embeddings.assert_called_once_with(test_resume.resume_text)
+    mock_generate_embeddings.assert_called_once_with([test_resume.resume_text])
     
     mock_session.add.assert_called_once()
-    mock_session.commit.assert_called_once()
+    mock_session.merge.assert_called_once()  # review stored for content-addressed reuse
+    assert mock_session.commit.call_count == 2
+    
+@patch("app.services.result_store.ResultStore.get")
+@patch("app.services.process_llm.ProcessLLM.process")
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
+@patch("app.services.file_processing.FileProcessing.extract")
+def test_upload_resume_result_store_hit(mock_extract, mock_generate_embeddings, mock_process, mock_result_store_get,
+                                        test_client, test_resume, test_resume_feedback):
+    """Test that a re-upload of reviewed content skips extraction, the LLM and embeddings"""
+    mock_result_store_get.return_value = StoredReview(
+        extracted_text=test_resume.resume_text,
+        annotations=[Annotation(start=10, end=14, category="grammar_spelling", suggestion_index=0)],
+        feedback=test_resume_feedback.feedback,
+        embedding=[0.0] * 1536
+    )
     
-def test_get_similar_resumes_success(test_client, mock_session, test_resume):
+    response = test_client.post(
+        "/resumes/upload",
+        files={"file": ("test_resume.pdf", b"same bytes as before", "application/pdf")},
+        data={"model_option": "openai"}
+    )
+    
+    assert response.status_code == 200
+    assert response.json()["extracted_text"] == test_resume.resume_text
+    assert response.json()["annotations"][0]["category"] == "grammar_spelling"
+    assert response.json()["feedback"]["overall_score"] == test_resume_feedback.feedback.overall_score
+    
+    mock_result_store_get.assert_called_once()
+    mock_extract.assert_not_called()
+    mock_process.assert_not_called()
+    mock_generate_embeddings.assert_not_called()
+    
+async def test_ingest_hashes_and_spools_upload():
+    """ Test that ingest streams the upload into a spool and hashes it like generate_file_id """
+    file_bytes = b"%PDF-1.4 resume content" * 10000
+    upload = UploadFile(file=io.BytesIO(file_bytes), filename="test_resume.pdf")
+    file_processing = FileProcessing()
+    
+    file_id, spool = await file_processing.ingest(upload)
+    
+    assert file_id == file_processing.generate_file_id(file_bytes)
+    assert spool.read() == file_bytes
+    spool.close()
+
+async def test_ingest_rejects_oversized_upload():
+    """ Test that ingest stops reading once the upload exceeds the maximum size """
+    upload = UploadFile(file=io.BytesIO(b"x" * 1024), filename="test_resume.pdf")
+    
+    with pytest.raises(UploadTooLargeError):
+        await FileProcessing().ingest(upload, max_bytes=512)
+
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
+def test_get_similar_resumes_success(mock_generate_embeddings, test_client, mock_session, test_resume):
     """ Test successful retrieval of similar resumes through similar resumes endpoint"""    
-    test_resume.embedding = np.random.rand(1536)
-    mock_session.query.return_value.join.return_value.filter.return_value.all.return_value = [test_resume]
+    mock_generate_embeddings.return_value = [np.random.rand(1536).tolist()]
+    row = MagicMock(id=test_resume.id, file_id=test_resume.file_id, file_name=test_resume.file_name,
+                    created_at=test_resume.created_at, distance=0.25)
+    search = mock_session.query.return_value.join.return_value.filter.return_value.order_by.return_value
+    search.limit.return_value.all.return_value = [row]
+    mock_session.query.return_value.join.return_value.filter.return_value.scalar.return_value = 1  # vectors of the user
     
     query_count = mock_session.query.call_count
     close_count = mock_session.close.call_count
@@ -159,19 +244,161 @@ def test_get_similar_resumes_success(test_client, mock_session, test_resume):
     response = test_client.post("/resumes/similar-resumes", 
         data={
             "user_id": str(test_resume.user_id),
-            "query": "test query"
+            "query": "test query",
+            "top_k": 3
         })
     
-    query_embedding = FileProcessing().generate_embeddings("test query")
-    expected_score = np.dot(query_embedding, test_resume.embedding) / (np.linalg.norm(query_embedding) * np.linalg.norm(test_resume.embedding))
-    
     assert response.status_code == 200
     assert len(response.json()) == 1
     
-    assert mock_session.query.call_count == query_count + 1
+    # Ranked by the database, k rows at most and no embeddings sent back
+    search.limit.assert_called_with(3)
+    # Counting the user's vectors, then ranking them
+    assert mock_session.query.call_count == query_count + 2
     assert mock_session.close.call_count == close_count + 1
-      
-    assert abs(np.float64(response.json()[0]["score"]) - np.float64(expected_score)) < 0.0001
+    assert "embedding" not in response.json()[0]
+    assert response.json()[0]["file_id"] == str(test_resume.file_id)
+    assert abs(response.json()[0]["score"] - 0.75) < 0.0001
+
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
+def test_get_similar_resumes_min_score(mock_generate_embeddings, test_client, mock_session, test_resume):
+    """ Test that resumes below min_score are left out of similar resumes """
+    mock_generate_embeddings.return_value = [np.random.rand(1536).tolist()]
+    rows = [
+        MagicMock(id=test_resume.id, file_id=test_resume.file_id, file_name="close.pdf",
+                  created_at=test_resume.created_at, distance=distance)
+        for distance in (0.1, 0.6)
+    ]
+    search = mock_session.query.return_value.join.return_value.filter.return_value.order_by.return_value
+    search.limit.return_value.all.return_value = rows
+    mock_session.query.return_value.join.return_value.filter.return_value.scalar.return_value = len(rows)  # vectors of the user
+    
+    response = test_client.post("/resumes/similar-resumes",
+        data={
+            "user_id": str(test_resume.user_id),
+            "query": "test query",
+            "min_score": 0.5
+        })
+    
+    assert response.status_code == 200
+    assert [round(result["score"], 4) for result in response.json()] == [0.9]
+
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
+def test_get_similar_resumes_by_chunks(mock_generate_embeddings, test_client, mock_session, test_resume):
+    """ Test ranking similar resumes by their best chunk and by the mean of their best chunks """
+    mock_generate_embeddings.return_value = [np.random.rand(1536).tolist()]
+    def chunk_row(resume_id, section, distance):
+        return MagicMock(id=resume_id, file_id=f"file-{resume_id}", file_name=f"{resume_id}.pdf",
+                         created_at=test_resume.created_at, section=section, start_offset=0, end_offset=10, distance=distance)
+    # Nearest chunks first: "a" has one very close chunk, "b" several close ones
+    rows = [chunk_row("a", "SKILLS", 0.1), chunk_row("b", "EXPERIENCE", 0.2), chunk_row("b", "SUMMARY", 0.25),
+            chunk_row("b", "PROJECTS", 0.3), chunk_row("a", "EDUCATION", 0.6)]
+    search = mock_session.query.return_value.join.return_value.filter.return_value.order_by.return_value
+    search.limit.return_value.all.return_value = rows
+    mock_session.query.return_value.join.return_value.filter.return_value.scalar.return_value = len(rows)  # vectors of the user
+
+    max_sim = test_client.post("/resumes/similar-resumes",
+        data={"user_id": str(test_resume.user_id), "query": "kubernetes", "mode": "max_sim", "top_k": 2})
+
+    assert max_sim.status_code == 200
+    assert [result["id"] for result in max_sim.json()] == ["a", "b"]
+    assert max_sim.json()[0]["match"] == {"section": "SKILLS", "start": 0, "end": 10}
+    assert abs(max_sim.json()[0]["score"] - 0.9) < 1e-6
+    search.limit.assert_called_with(2 * 8)
+
+    aggregate = test_client.post("/resumes/similar-resumes",
+        data={"user_id": str(test_resume.user_id), "query": "kubernetes", "mode": "aggregate", "top_k": 2})
+
+    # a: (0.9 + 0.4 + 0.4 for its chunk beyond the candidates) / 3, b: (0.8 + 0.75 + 0.7) / 3
+    assert [result["id"] for result in aggregate.json()] == ["b", "a"]
+    assert abs(aggregate.json()[0]["score"] - 0.75) < 1e-6
+    assert abs(aggregate.json()[1]["score"] - 1.7 / 3) < 1e-6
+
+class SharedCorpusSession:
+    """
+    Session over resume vectors of many users that plans nearest neighbour queries like Postgres does:
+    a plain HNSW scan finds ef_search rows of any user, then drops the other users' rows
+    """
+
+    def __init__(self, corpus, user_id):
+        self.corpus = sorted(corpus, key=lambda row: row.distance)
+        self.user_id = user_id
+        self.user_rows = [row for row in self.corpus if row.user_id == user_id]
+        self.settings = {"hnsw.ef_search": "40", "enable_indexscan": "on", "hnsw.iterative_scan": "off"}
+
+    def execute(self, statement, params=None):
+        for name, value in re.findall(r"set_config\('([\w.]+)', ('\w+'|:\w+)", str(statement)):
+            self.settings[name] = params[value[1:]] if value.startswith(":") else value.strip("'")
+
+    def query(self, *columns):
+        return self
+
+    def join(self, *args):
+        return self
+
+    def filter(self, *args):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def scalar(self):
+        return len(self.user_rows)
+
+    def limit(self, limit):
+        if self.settings["enable_indexscan"] == "off" or self.settings["hnsw.iterative_scan"] != "off":
+            self.rows = self.user_rows[:limit]
+        else:
+            visited = self.corpus[:int(self.settings["hnsw.ef_search"])]
+            self.rows = [row for row in visited if row.user_id == self.user_id][:limit]
+        return self
+
+    def all(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+@pytest.mark.parametrize("user_vectors, iterative_scan", [
+    (20, True), (SIMILAR_EXACT_SCAN_MAX_ROWS + 1, True), (SIMILAR_EXACT_SCAN_MAX_ROWS + 1, False)
+])
+def test_search_similar_in_a_shared_corpus(test_resume, user_vectors, iterative_scan):
+    """ Test that a user gets k similar resumes when other users' vectors are nearer to the query """
+    def row(user_id, index, distance):
+        return SimpleNamespace(user_id=user_id, id=f"{user_id}-{index}", file_id=f"file-{user_id}-{index}",
+                         file_name=f"{index}.pdf", created_at=test_resume.created_at, distance=distance)
+    # Other users own the 1000 nearest vectors
+    corpus = [row("others", index, index / 100_000) for index in range(1000)]
+    corpus += [row("user", index, 0.5 + index / 100_000) for index in range(user_vectors)]
+    session = SharedCorpusSession(corpus, "user")
+    db = MagicMock(hnsw_iterative_scan=iterative_scan)
+    db.get_session.return_value = session
+
+    results = ResumeRepository(db).search_similar("user", [0.0] * 1536, 10)
+
+    assert [result.id for result in results] == [f"user-{index}" for index in range(10)]
+    exact = user_vectors <= SIMILAR_EXACT_SCAN_MAX_ROWS or not iterative_scan
+    assert session.settings["enable_indexscan"] == ("off" if exact else "on")
+    assert session.settings["hnsw.iterative_scan"] == ("off" if exact else "strict_order")
+
+def test_get_similar_resumes_invalid_mode(test_client, test_resume):
+    """ Test that the search mode is validated """
+    response = test_client.post("/resumes/similar-resumes",
+        data={"user_id": str(test_resume.user_id), "query": "test query", "mode": "best"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid search mode"
+
+def test_get_similar_resumes_invalid_top_k(test_client, test_resume):
+    """ Test that top_k must be positive """
+    response = test_client.post("/resumes/similar-resumes",
+        data={
+            "user_id": str(test_resume.user_id),
+            "query": "test query",
+            "top_k": 0
+        })
+    
+    assert response.status_code == 422
 
 @patch("app.services.file_processing.FileProcessing.extract")
 def test_upload_resume_unsupported_file_type(mock_extract, test_client, test_resume):
@@ -190,27 +417,49 @@ def test_upload_resume_unsupported_file_type(mock_extract, test_client, test_res
     assert "Unsupported file type" in response.json()["detail"]
 
 @patch("app.services.process_llm.ProcessLLM.process")
-@patch("app.services.file_processing.FileProcessing.generate_embeddings")
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
 @patch("app.services.file_processing.FileProcessing.extract")
 @patch("app.services.file_processing.FileProcessing.generate_file_id")
 def test_upload_resume_missing_user_id(mock_generate_file_id, mock_extract, mock_generate_embeddings, mock_process, 
-                                     test_client, test_resume, test_resume_embedding, test_resume_feedback):
+                                     test_client, mock_session, test_resume, test_resume_embedding, test_llm_review):
     """ Test upload when user_id is missing """
     mock_extract.return_value = test_resume.resume_text
     mock_generate_file_id.return_value = test_resume.file_id
-    mock_generate_embeddings.return_value = test_resume_embedding.embedding
-    mock_process.return_value = test_resume_feedback.feedback
+    mock_generate_embeddings.return_value = [test_resume_embedding.embedding]
+    mock_process.return_value = test_llm_review
     
     file_bytes = bytes(test_resume.resume_text, "utf-8")
     test_filename = "test_resume.pdf"
     
-    # Don't provide user_id in the form data
+    # Don't provide user_id in the form data, resumes.user_id is NOT NULL
+    not_null = Exception('null value in column "user_id" violates not-null constraint')
+    with patch.object(mock_session, "commit", side_effect=not_null):
+        response = test_client.post("/resumes/upload",
+            files={"file": (test_filename, file_bytes, "application/pdf")},
+            data={"model_option": "openai"}
+        )
+    
+    assert response.status_code == 500  # Should not work without user_id
+
+@patch("app.services.resume_repository.ResumeRepository.save_resume_feedback")
+@patch("app.services.process_llm.ProcessLLM.process")
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
+@patch("app.services.file_processing.FileProcessing.extract")
+def test_upload_resume_provider_error(mock_extract, mock_generate_embeddings, mock_process, mock_save,
+                                      test_client, test_resume, test_resume_embedding):
+    """ Test that a provider error is reported as a bad gateway with its message, and nothing is saved """
+    mock_extract.return_value = test_resume.resume_text
+    mock_generate_embeddings.return_value = [test_resume_embedding.embedding]
+    mock_process.return_value = {"error": "Error processing resume: Rate limit reached for gpt-4o-mini"}
+    
     response = test_client.post("/resumes/upload",
-        files={"file": (test_filename, file_bytes, "application/pdf")},
-        data={"model_option": "openai"}
+        files={"file": ("test_resume.pdf", b"rate limited resume", "application/pdf")},
+        data={"model_option": "openai", "user_id": str(test_resume.user_id)}
     )
     
-    assert response.status_code == 500  # Should not work without user_id
+    assert response.status_code == 502
+    assert response.json() == {"detail": "Error processing resume: Rate limit reached for gpt-4o-mini"}
+    mock_save.assert_not_called()
 
 def test_get_resume_not_found(test_client, mock_session, test_resume):
     """ Test getting a non-existent resume """
@@ -244,12 +493,13 @@ def test_get_similar_resumes_no_user_id(test_client):
     assert response.status_code == 422  # Should be validation error
     assert "field required" in str(response.json()["detail"][0]["msg"]).lower()
 
-@patch("app.services.file_processing.FileProcessing.generate_embeddings")
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
 def test_get_similar_resumes_no_resumes(mock_generate_embeddings, test_client, mock_session):
     """ Test getting similar resumes when user has no resumes """
     # Setup mock to return empty list (no resumes)
-    mock_session.query.return_value.join.return_value.filter.return_value.all.return_value = []
-    mock_generate_embeddings.return_value = np.random.rand(1536)
+    mock_session.query.return_value.join.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = []
+    mock_session.query.return_value.join.return_value.filter.return_value.scalar.return_value = 0
+    mock_generate_embeddings.return_value = [np.random.rand(1536).tolist()]
     
     response = test_client.post("/resumes/similar-resumes",
         data={
@@ -260,3 +510,229 @@ def test_get_similar_resumes_no_resumes(mock_generate_embeddings, test_client, m
     
     assert response.status_code == 200
     assert len(response.json()) == 0
+
+@pytest.fixture(scope="function")
+def mock_job_repository():
+    """ Upload job repository backed by mocks, installed in place of the shared job runner """
+    job_repository = MagicMock(spec=JobRepository)
+    app.dependency_overrides[get_upload_jobs] = lambda: UploadJobs(job_repository)
+    yield job_repository
+    del app.dependency_overrides[get_upload_jobs]
+
+def test_upload_resume_background_job(test_client, test_resume, test_resume_feedback, mock_job_repository):
+    """ Test that a background upload returns 202 right away and records each pipeline stage """
+    file_bytes = b"background resume bytes"
+    mock_job_repository.create_job.return_value = "job-1"
+    mock_job_repository.get_job_input.return_value = MagicMock(
+        id="job-1",
+        file_id=test_resume.file_id,
+        file_name="test_resume.pdf",
+        model_option="openai",
+        user_id=None,
+        status="queued",
+        stage=None,
+        payload=file_bytes
+    )
+    
+    async def fake_run(source, on_stage, **kwargs):
+        for stage in STAGES:
+            await on_stage(stage)
+        return {"extracted_text": test_resume.resume_text, "feedback": test_resume_feedback.feedback}
+    
+    with patch("app.services.upload_pipeline.UploadPipeline.run", side_effect=fake_run) as mock_run:
+        response = test_client.post("/resumes/upload",
+            files={"file": ("test_resume.pdf", file_bytes, "application/pdf")},
+            data={"model_option": "openai", "background": "true"}
+        )
+    
+    assert response.status_code == 202
+    assert response.json() == {"job_id": "job-1", "status": "queued"}
+    assert response.headers["location"] == "/resumes/jobs/job-1"
+    
+    create_args = mock_job_repository.create_job.call_args.args
+    assert create_args[2] == "test_resume.pdf"
+    assert create_args[4] == file_bytes
+    
+    # The background task ran the pipeline on the persisted payload
+    assert mock_run.call_args.kwargs["source"] == file_bytes
+    updates = [c.kwargs for c in mock_job_repository.update_job.call_args_list]
+    assert updates[0] == {"status": "running"}
+    assert [u["stage"] for u in updates if "stage" in u] == list(STAGES)
+    assert updates[-1]["status"] == "completed"
+    assert updates[-1]["result"]["extracted_text"] == test_resume.resume_text
+
+async def test_upload_job_heartbeat_during_a_long_stage(test_resume):
+    """ Test that a running job keeps touching its row, so that recovery does not run it a second time """
+    job_repository = MagicMock(spec=JobRepository)
+    job_repository.get_job_input.return_value = MagicMock(
+        id="job-1", file_id=test_resume.file_id, file_name="test_resume.pdf", model_option="openai",
+        user_id=None, status="queued", stage=None, payload=b"resume bytes"
+    )
+    pipeline = MagicMock()
+
+    async def slow_review(**kwargs):
+        await asyncio.sleep(0.2)
+        return {"extracted_text": test_resume.resume_text}
+    pipeline.run.side_effect = slow_review
+
+    await UploadJobs(job_repository, heartbeat_interval=0.03).run("job-1", pipeline)
+    touches = job_repository.touch_job.call_count
+    await asyncio.sleep(0.1)
+
+    assert touches >= 3
+    job_repository.touch_job.assert_called_with("job-1")
+    # Stopped once the job finished
+    assert job_repository.touch_job.call_count == touches
+
+def test_get_upload_job(test_client, test_resume, mock_job_repository):
+    """ Test polling a background upload job """
+    mock_job_repository.get_job.return_value = UploadJobStatus(
+        job_id="job-1", file_id=str(test_resume.file_id), file_name="test_resume.pdf", status="running", stage="extracted"
+    )
+    
+    response = test_client.get("/resumes/jobs/job-1")
+    
+    assert response.status_code == 200
+    assert response.json()["status"] == "running"
+    assert response.json()["stage"] == "extracted"
+    
+    mock_job_repository.get_job.return_value = None
+    response = test_client.get("/resumes/jobs/missing")
+    
+    assert response.status_code == 404
+
+def test_stream_upload_job_events(test_client, test_resume, mock_job_repository):
+    """ Test that the event stream polls job progress until the job completes """
+    running = UploadJobStatus(
+        job_id="job-1", file_id=str(test_resume.file_id), file_name="test_resume.pdf", status="running", stage="reviewed"
+    )
+    completed = running.model_copy(update={"status": "completed", "stage": "saved", "result": {"extracted_text": "text"}})
+    mock_job_repository.get_job.side_effect = [running, running, completed]
+    
+    response = test_client.get("/resumes/jobs/job-1/events")
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [e for e in response.text.split("\n\n") if e]
+    assert events[0].startswith("event: running")
+    assert events[-1].startswith("event: completed")
+    assert '"stage":"saved"' in events[-1]
+
+@patch("app.services.result_store.ResultStore.get", return_value=None)
+@patch("app.services.process_llm.ProcessLLM.process")
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
+@patch("app.services.file_processing.FileProcessing.extract")
+def test_upload_resume_stream_parallel_review(mock_extract, mock_generate_embeddings, mock_process, mock_result_store_get,
+                                              test_client, mock_session, test_resume_embedding):
+    """ Test that a streamed upload sends each category's feedback before the whole result """
+    mock_extract.return_value = "Experienced Python developer."
+    mock_generate_embeddings.return_value = [test_resume_embedding.embedding]
+    category = {"score": 7.0, "strengths": ["Clear"], "weaknesses": [], "suggestions": []}
+    mock_process.side_effect = lambda document, model, prompt: (
+        {"general_feedback": "Good"} if prompt == CATEGORY_PROMPTS["general_feedback"] else category
+    )
+    
+    response = test_client.post(
+        "/resumes/upload/stream",
+        files={"file": ("test_resume.pdf", b"pdf bytes", "application/pdf")}
+    )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [e.split("\n", 1) for e in response.text.split("\n\n") if e]
+    names = [name for name, _ in events]
+    assert names.count("event: feedback") == len(CATEGORY_PROMPTS)
+    saved = events.index(["event: stage", 'data: {"stage": "saved"}'])
+    assert all(names[index] != "event: feedback" for index in range(saved, len(events)))
+    assert names[-1] == "event: done"
+    assert mock_process.call_count == len(CATEGORY_PROMPTS)
+    
+    done = json.loads(events[-1][1][len("data: "):])
+    assert done["feedback"]["overall_score"] == 7.0
+    assert done["feedback"]["general_feedback"] == "Good"
+
+@pytest.mark.parametrize("path", ["/resumes/upload", "/resumes/upload/stream"])
+@patch("app.services.file_processing.FileProcessing.ingest")
+def test_upload_rejects_oversized_body_before_reading_it(mock_ingest, test_client, path):
+    """ Test that single file uploads over the size limit are refused from their Content-Length """
+    response = test_client.post(path,
+        files={"file": ("test_resume.pdf", b"x" * (MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD + 1), "application/pdf")}
+    )
+    
+    assert response.status_code == 413
+    mock_ingest.assert_not_called()
+
+def test_upload_resume_stream_invalid_review_mode(test_client):
+    response = test_client.post(
+        "/resumes/upload/stream",
+        files={"file": ("test_resume.pdf", b"pdf bytes", "application/pdf")},
+        data={"review_mode": "sequential"}
+    )
+    
+    assert response.status_code == 400
+
+async def test_upload_resume_stream_closes_spool_when_never_read():
+    """ Test that the upload spool is closed even if the event stream is never read """
+    spool = SpooledTemporaryFile()
+    file_processing = MagicMock()
+    file_processing.ingest = AsyncMock(return_value=("file-id", spool))
+    upload_pipeline = MagicMock()
+    upload_pipeline.run = AsyncMock(return_value={})
+    file = UploadFile(io.BytesIO(b"pdf bytes"), filename="test_resume.pdf")
+
+    response = await upload_resume_stream(file=file, model_option="openai", user_id=None, review_mode="parallel",
+                                          file_processing=file_processing, upload_pipeline=upload_pipeline)
+
+    for _ in range(3):
+        await asyncio.sleep(0)
+    assert response.media_type == "text/event-stream"
+    upload_pipeline.run.assert_awaited_once()
+    assert spool.closed
+
+@patch("app.services.process_llm.ProcessLLM.process")
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
+@patch("app.services.file_processing.FileProcessing.extract")
+def test_upload_resume_batch(mock_extract, mock_generate_embeddings_batch, mock_process,
+                             test_client, mock_session, test_resume_feedback):
+    """ Test batch upload of plain files and a zip archive, with duplicates, streamed as NDJSON """
+    mock_extract.side_effect = lambda source, file_ext: f"Resume text {source.decode()}"
+    mock_generate_embeddings_batch.side_effect = lambda texts: [[float(i)] * 1536 for i in range(len(texts))]
+    mock_process.return_value = test_resume_feedback.feedback
+    mock_prep_review = MagicMock(side_effect=lambda text, feedback: (feedback, []))
+    mock_session.query.return_value.filter.return_value.all.return_value = []  # No existing resumes
+    add_all_count = mock_session.add_all.call_count
+    
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("cohort/one.pdf", b"one")
+        zf.writestr("cohort/two.pdf", b"two")
+    
+    with patch('app.services.upload_pipeline.DataPrep.prep_review', mock_prep_review):
+        response = test_client.post("/resumes/upload-batch",
+            files=[
+                ("files", ("cohort.zip", archive.getvalue(), "application/zip")),
+                ("files", ("three.pdf", b"three", "application/pdf")),
+                ("files", ("one-again.pdf", b"one", "application/pdf")),
+            ],
+            data={"user_id": "test_user_id", "model_option": "openai"}
+        )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = [json.loads(line) for line in response.text.splitlines()]
+    
+    by_status = {}
+    for result in results:
+        by_status.setdefault(result["status"], []).append(result)
+    
+    assert [r["file_name"] for r in by_status["duplicate"]] == ["one-again.pdf"]
+    assert sorted(r["file_name"] for r in by_status["completed"]) == ["one.pdf", "three.pdf", "two.pdf"]
+    assert results[-1]["status"] == "saved"
+    assert len(results[-1]["file_ids"]) == 3
+    
+    # One embeddings request for the resumes, one for all of their section chunks, and one bulk insert
+    assert mock_generate_embeddings_batch.call_count == 2
+    assert all(len(call.args[0]) == 3 for call in mock_generate_embeddings_batch.call_args_list)
+    assert mock_process.call_count == 3
+    assert mock_session.add_all.call_count == add_all_count + 1
+    assert len(mock_session.add_all.call_args.args[0]) == 3
@@ -0,0 +1,121 @@
+from conftest import mock_db, mock_security_repository, test_client, test_resume, test_resume_feedback
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from app.core.models.pydantic_models import SimpleResume
+from app.services.resume_repository import ResumeRepository
+from app.services.similarity_engine import SimilarityEngine, similarity_engine
+
+
+def resumes_for(embeddings):
+    return [
+        SimpleResume(id=f"id-{i}", file_id=f"file-{i}", file_name=f"resume_{i}.pdf", created_at=datetime(2024, 1, 1), embedding=list(embedding))
+        for i, embedding in enumerate(embeddings)
+    ]
+
+def test_search_matches_brute_force_ranking():
+    """Test that the top k are the k best cosine similarities, best first"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((50, 16))
+    query = rng.standard_normal(16)
+    engine = SimilarityEngine()
+
+    results = engine.search("user", query, 5, load=lambda: resumes_for(embeddings))
+
+    scores = embeddings @ query / (np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query))
+    expected = np.argsort(-scores)[:5]
+    assert [result.id for result in results] == [f"id-{i}" for i in expected]
+    assert np.allclose([result.score for result in results], scores[expected], atol=1e-5)
+
+def test_search_orders_equal_scores_by_row():
+    """Test that equal scores, which the previous heap of resumes could not compare, are ranked"""
+    embeddings = [[1.0, 0.0], [0.0, 1.0], [2.0, 0.0], [1.0, 0.0]]
+    engine = SimilarityEngine()
+
+    results = engine.search("user", [1.0, 0.0], 10, load=lambda: resumes_for(embeddings))
+
+    assert [result.id for result in results] == ["id-0", "id-2", "id-3", "id-1"]
+    assert "embedding" not in results[0].model_dump()
+
+def test_search_applies_min_score_and_handles_no_resumes():
+    engine = SimilarityEngine()
+
+    results = engine.search("user", [1.0, 0.0], 10, load=lambda: resumes_for([[1.0, 0.0], [0.0, 1.0]]), min_score=0.5)
+    assert [result.id for result in results] == ["id-0"]
+
+    assert engine.search("empty", [1.0, 0.0], 10, load=lambda: []) == []
+
+def test_matrix_is_cached_until_invalidated():
+    """Test that the embeddings of a user are loaded once, and again after a save"""
+    load = MagicMock(return_value=resumes_for([[1.0, 0.0], [0.0, 1.0]]))
+    engine = SimilarityEngine()
+
+    engine.search("user", [1.0, 0.0], 1, load=load)
+    engine.search("user", [0.0, 1.0], 1, load=load)
+    assert load.call_count == 1
+
+    engine.invalidate("user")
+    engine.search("user", [1.0, 0.0], 1, load=load)
+    assert load.call_count == 2
+
+def test_matrix_loaded_during_a_save_is_not_cached():
+    engine = SimilarityEngine()
+
+    def load():
+        engine.invalidate("user")
+        return resumes_for([[1.0, 0.0]])
+
+    engine.search("user", [1.0, 0.0], 1, load=load)
+    load_again = MagicMock(return_value=resumes_for([[1.0, 0.0]]))
+    engine.search("user", [1.0, 0.0], 1, load=load_again)
+    load_again.assert_called_once()
+
+def test_cache_evicts_least_recently_used_by_size():
+    """Test that the cached matrices stay within their byte budget"""
+    matrix_bytes = 2 * 2 * 4
+    engine = SimilarityEngine(max_bytes=2 * matrix_bytes)
+    load = MagicMock(return_value=resumes_for([[1.0, 0.0], [0.0, 1.0]]))
+
+    for user in ("a", "b", "a", "c", "a", "b"):
+        engine.search(user, [1.0, 0.0], 1, load=load)
+
+    # a was used after b, so c evicts b and b is loaded again
+    assert load.call_count == 4
+
+def test_save_resume_feedback_invalidates_the_user(mock_db, test_resume, test_resume_feedback):
+    engine = MagicMock(spec=SimilarityEngine)
+    repository = ResumeRepository(mock_db, similarity=engine)
+
+    repository.save_resume_feedback(
+        user_id=test_resume.user_id,
+        file_id=test_resume.file_id,
+        file_name=test_resume.file_name,
+        resume_text=test_resume.resume_text,
+        feedback=test_resume_feedback.feedback,
+        embedding=[0.0] * 1536
+    )
+
+    engine.invalidate.assert_called_once_with(test_resume.user_id)
+
+@patch("app.api.v1.routes.resume.SIMILAR_RESUMES_BACKEND", "memory")
+@patch("app.services.file_processing.FileProcessing.generate_embeddings_batch")
+def test_get_similar_resumes_in_memory(mock_generate_embeddings, test_client, mock_session, test_resume):
+    """Test the similar resumes endpoint with ranking in the process"""
+    similarity_engine.clear()
+    mock_generate_embeddings.return_value = [[1.0] + [0.0] * 1535]
+    rows = []
+    for i, first in enumerate((0.0, 1.0)):
+        row = MagicMock(id=f"id-{i}", file_id=f"file-{i}", file_name=f"resume_{i}.pdf", created_at=test_resume.created_at)
+        row.embedding = np.array([first, 1.0] + [0.0] * 1534)
+        rows.append(row)
+    mock_session.query.return_value.join.return_value.filter.return_value.all.return_value = rows
+
+    response = test_client.post("/resumes/similar-resumes",
+        data={"user_id": str(test_resume.user_id), "query": "test query", "top_k": 1})
+
+    assert response.status_code == 200
+    assert [result["id"] for result in response.json()] == ["id-1"]
+    assert abs(response.json()[0]["score"] - np.sqrt(0.5)) < 1e-5
+    similarity_engine.clear()
@@ -0,0 +1,346 @@
+import asyncio
+import threading
+import time
+from tempfile import SpooledTemporaryFile
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.models.pydantic_models import FeedbackCategory
+from app.services.category_review import REVIEW_PARALLEL
+from app.services.llm_prompts import CATEGORY_PROMPTS, CATEGORY_PROMPT_VERSION
+from app.services.resume_repository import ResumeRepository
+from app.services.singleflight import SingleFlight
+from app.services.upload_pipeline import ReviewFailedError, UploadPipeline, EXTRACTED, REVIEWED, EMBEDDED, SAVED
+
+
+@pytest.fixture(scope="function")
+def pipeline():
+    file_processing = MagicMock()
+
+    async def extract_async(source, file_ext):
+        return "This is a test resume text."
+    file_processing.extract_async.side_effect = extract_async
+
+    async def generate_embeddings_async(text):
+        return await asyncio.to_thread(file_processing.generate_embeddings, text)
+    file_processing.generate_embeddings_async.side_effect = generate_embeddings_async
+
+    result_store = MagicMock()
+    result_store.get.return_value = None
+
+    process_llm = MagicMock()
+    process_llm.process = AsyncMock()
+
+    return UploadPipeline(
+        resume_repository=MagicMock(),
+        file_processing=file_processing,
+        process_llm=process_llm,
+        result_store=result_store
+    )
+
+
+async def test_review_and_embedding_run_concurrently(pipeline, test_resume, test_llm_review):
+    """Test that the LLM review and the embedding overlap instead of running back to back"""
+    async def slow_review(*args, **kwargs):
+        await asyncio.sleep(0.3)
+        return test_llm_review
+
+    def slow_embedding(text):
+        time.sleep(0.3)
+        return [0.0] * 1536
+
+    pipeline.process_llm.process.side_effect = slow_review
+    pipeline.file_processing.generate_embeddings.side_effect = slow_embedding
+    stages = []
+
+    async def on_stage(stage):
+        stages.append(stage)
+
+    start = time.perf_counter()
+    await pipeline.run(b"pdf bytes", str(test_resume.file_id), "test_resume.pdf", "pdf", on_stage=on_stage)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.55
+    assert stages[0] == EXTRACTED
+    assert sorted(stages[1:3]) == sorted([REVIEWED, EMBEDDED])
+    assert stages[3] == SAVED
+    pipeline.resume_repository.save_resume_feedback.assert_called_once()
+
+
+async def test_review_failure_cancels_embedding(pipeline, test_resume):
+    """Test that a failing review surfaces its own error without waiting for the embedding"""
+    embedding_done = asyncio.Event()
+
+    async def failing_review(*args, **kwargs):
+        raise RuntimeError("LLM unavailable")
+
+    async def slow_embedding_stage(stage):
+        if stage == EMBEDDED:
+            embedding_done.set()
+
+    pipeline.process_llm.process.side_effect = failing_review
+    pipeline.file_processing.generate_embeddings.side_effect = lambda text: time.sleep(0.2) or [0.0] * 1536
+
+    with pytest.raises(RuntimeError, match="LLM unavailable"):
+        await pipeline.run(b"pdf bytes", str(test_resume.file_id), "test_resume.pdf", "pdf", on_stage=slow_embedding_stage)
+
+    assert not embedding_done.is_set()
+    pipeline.resume_repository.save_resume_feedback.assert_not_called()
+
+
+async def test_upload_saves_section_chunk_embeddings(pipeline, test_resume, test_llm_review):
+    """Test that the resume is embedded whole and per section, and the chunks are saved with their spans"""
+    summary = "SUMMARY\n" + "Backend engineer building distributed systems and data pipelines. " * 4
+    experience = "EXPERIENCE\n" + "* Led the migration of fourteen services to Kubernetes at scale. " * 4
+    text = summary.strip() + "\n" + experience.strip()
+
+    async def extract_async(source, file_ext):
+        return text
+    pipeline.file_processing.extract_async.side_effect = extract_async
+    pipeline.file_processing.generate_embeddings.side_effect = lambda text: [float(len(text))]
+    pipeline.process_llm.process.return_value = test_llm_review
+
+    await pipeline.run(b"pdf bytes", str(test_resume.file_id), "test_resume.pdf", "pdf")
+
+    saved = pipeline.resume_repository.save_resume_feedback.call_args.kwargs
+    assert saved["embedding"] == [float(len(text))]
+    assert [chunk.section for chunk, _ in saved["chunks"]] == ["SUMMARY", "EXPERIENCE"]
+    for chunk, embedding in saved["chunks"]:
+        assert embedding == [float(chunk.end - chunk.start)]
+    assert text[saved["chunks"][1][0].start:].startswith("EXPERIENCE")
+
+
+async def test_duplicate_uploads_share_one_run(pipeline, test_resume, test_llm_review):
+    """Test that concurrent uploads of the same file make one LLM call, one embedding and one save"""
+    async def slow_review(*args, **kwargs):
+        await asyncio.sleep(0.1)
+        return test_llm_review
+
+    pipeline.process_llm.process.side_effect = slow_review
+    pipeline.file_processing.generate_embeddings.return_value = [0.0] * 1536
+    follower_stages = []
+
+    async def on_stage(stage):
+        follower_stages.append(stage)
+
+    file_id = str(test_resume.file_id)
+    first, second = await asyncio.gather(
+        pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf"),
+        pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf", on_stage=on_stage),
+    )
+
+    assert first is second
+    assert pipeline.process_llm.process.call_count == 1
+    # The resume and its only section chunk
+    assert pipeline.file_processing.generate_embeddings.call_count == 2
+    pipeline.resume_repository.save_resume_feedback.assert_called_once()
+    assert follower_stages == [EXTRACTED, REVIEWED, EMBEDDED, SAVED]
+
+    # Nothing is remembered once the run is over
+    await pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf")
+    assert pipeline.process_llm.process.call_count == 2
+
+
+async def test_shared_run_outlives_the_file_of_the_caller_that_started_it(pipeline, test_resume, test_llm_review):
+    """Test that a follower still gets the result when the first caller goes away and closes its upload file"""
+    extracted_from = []
+
+    async def extract_async(source, file_ext):
+        await asyncio.sleep(0.1)
+        extracted_from.append(source)
+        return "This is a test resume text."
+
+    pipeline.file_processing.extract_async.side_effect = extract_async
+    pipeline.process_llm.process.return_value = test_llm_review
+    pipeline.file_processing.generate_embeddings.return_value = [0.0] * 1536
+    file_id = str(test_resume.file_id)
+
+    async def first_caller():
+        with SpooledTemporaryFile() as spool:
+            spool.write(b"pdf bytes")
+            spool.seek(0)
+            await pipeline.run(spool, file_id, "test_resume.pdf", "pdf")
+
+    first = asyncio.create_task(first_caller())
+    await asyncio.sleep(0)
+    second = asyncio.create_task(pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf"))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    result = await second
+    assert result["extracted_text"] == "This is a test resume text."
+    assert extracted_from == [b"pdf bytes"]
+    pipeline.resume_repository.save_resume_feedback.assert_called_once()
+
+
+async def test_same_file_uploaded_by_two_users_is_saved_for_each(pipeline, test_resume, test_llm_review):
+    """Test that a user uploading a file another user already has gets their own resume"""
+    saved = {}
+
+    def save_resume_feedback(**kwargs):
+        saved[(kwargs["file_id"], kwargs["user_id"])] = MagicMock(
+            resume_text=kwargs["resume_text"],
+            feedback=MagicMock(feedback=kwargs["feedback"], annotations=[])
+        )
+
+    pipeline.resume_repository.get_resume.side_effect = lambda file_id, user_id=None: saved.get((file_id, user_id))
+    pipeline.resume_repository.save_resume_feedback.side_effect = save_resume_feedback
+    pipeline.process_llm.process.return_value = test_llm_review
+    pipeline.file_processing.generate_embeddings.return_value = [0.0] * 1536
+
+    file_id = str(test_resume.file_id)
+    await pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf", user_id="user-a")
+    await pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf", user_id="user-b")
+    await pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf", user_id="user-b")
+
+    assert set(saved) == {(file_id, "user-a"), (file_id, "user-b")}
+    assert pipeline.resume_repository.save_resume_feedback.call_count == 2
+
+
+async def test_advisory_lock_waits_for_other_worker(mock_db, mock_session):
+    """Test that the upload lock is polled on a dedicated connection until free, and released off the event loop"""
+    mock_session.reset_mock()
+    connection = MagicMock()
+    connection.execute.return_value.scalar.side_effect = [False, False, True, None]
+    mock_db.get_lock_connection.return_value = connection
+    loop_thread = threading.get_ident()
+    release_threads = []
+    connection.close.side_effect = lambda: release_threads.append(threading.get_ident())
+    repository = ResumeRepository(mock_db)
+
+    async with repository.advisory_lock("upload:file:openai", poll_interval=0.01) as acquired:
+        assert acquired
+
+    statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+    assert statements.count("SELECT pg_try_advisory_lock(:lock_id)") == 3
+    assert statements[-1] == "SELECT pg_advisory_unlock(:lock_id)"
+    connection.close.assert_called_once()
+    assert release_threads and loop_thread not in release_threads
+    # No pooled session is held while the block runs
+    mock_session.execute.assert_not_called()
+
+
+async def test_advisory_lock_gives_up_after_timeout(mock_db):
+    connection = MagicMock()
+    connection.execute.return_value.scalar.return_value = False
+    mock_db.get_lock_connection.return_value = connection
+    repository = ResumeRepository(mock_db)
+
+    async with repository.advisory_lock("upload:file:openai", timeout=0.05, poll_interval=0.01) as acquired:
+        assert not acquired
+
+    assert "pg_advisory_unlock" not in str(connection.execute.call_args_list[-1])
+    connection.close.assert_called_once()
+
+
+async def test_uploads_of_different_users_do_not_share_a_run(pipeline, test_resume, test_llm_review):
+    """Test that a user joining an upload in flight still gets its own resume saved"""
+    async def slow_review(*args, **kwargs):
+        await asyncio.sleep(0.1)
+        return test_llm_review
+
+    pipeline.process_llm.process.side_effect = slow_review
+    pipeline.file_processing.generate_embeddings.return_value = [0.0] * 1536
+    pipeline.resume_repository.get_resume.return_value = None
+
+    file_id = str(test_resume.file_id)
+    await asyncio.gather(
+        pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf"),
+        pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf", user_id="user-a"),
+        pipeline.run(b"pdf bytes", file_id, "test_resume.pdf", "pdf", user_id="user-b"),
+    )
+
+    saved_for = [call.kwargs["user_id"] for call in pipeline.resume_repository.save_resume_feedback.call_args_list]
+    assert sorted(saved_for, key=str) == sorted([None, "user-a", "user-b"], key=str)
+
+
+async def test_singleflight_survives_one_caller_going_away():
+    """Test that shared work keeps running for the remaining callers and stops when none are left"""
+    flights = SingleFlight()
+    started = 0
+
+    async def work():
+        nonlocal started
+        started += 1
+        await asyncio.sleep(0.05)
+        return "done"
+
+    leaving = asyncio.create_task(flights.do("key", work))
+    staying = asyncio.create_task(flights.do("key", work))
+    await asyncio.sleep(0)
+    leaving.cancel()
+
+    assert await staying == "done"
+    assert started == 1
+    assert "key" not in flights
+
+    abandoned = asyncio.create_task(flights.do("key", work))
+    await asyncio.sleep(0)
+    shared = flights._flights["key"][0]
+    abandoned.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await shared
+    assert "key" not in flights
+
+
+def raw_category(score: float, match: str = "") -> dict:
+    suggestions = [{"text": "Fix it", "match": match}] if match else []
+    return {"score": score, "strengths": ["Good"], "weaknesses": [], "suggestions": suggestions}
+
+
+async def test_parallel_review_streams_categories_as_they_complete(pipeline, test_resume):
+    """Test that every category is reviewed concurrently and reported as soon as it is done"""
+    delays = {category: 0.05 * (index + 1) for index, category in enumerate(CATEGORY_PROMPTS)}
+
+    async def review(document, model, prompt):
+        part = next(part for part, part_prompt in CATEGORY_PROMPTS.items() if part_prompt == prompt)
+        await asyncio.sleep(delays[part])
+        return {"general_feedback": "Solid resume"} if part == "general_feedback" else raw_category(8.0, "test")
+
+    pipeline.process_llm.process.side_effect = review
+    pipeline.file_processing.generate_embeddings.return_value = [0.0] * 1536
+    parts = []
+
+    async def on_feedback(field, value):
+        parts.append((field, value))
+
+    start = time.perf_counter()
+    result = await pipeline.run(
+        b"pdf bytes", str(test_resume.file_id), "test_resume.pdf", "pdf",
+        review_mode=REVIEW_PARALLEL, on_feedback=on_feedback
+    )
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < sum(delays.values()) / 2
+    assert [field for field, _ in parts] == list(CATEGORY_PROMPTS)
+    assert isinstance(parts[0][1], FeedbackCategory)
+    assert parts[-1] == ("general_feedback", "Solid resume")
+    assert result["feedback"].overall_score == 8.0
+    assert result["feedback"].general_feedback == "Solid resume"
+    assert {annotation.category for annotation in result["annotations"]} == {"structure_organization"}
+    assert pipeline.result_store.put.call_args.args[2] == CATEGORY_PROMPT_VERSION
+
+
+async def test_parallel_review_failure_cancels_other_categories(pipeline, test_resume):
+    cancelled = 0
+
+    async def review(document, model, prompt):
+        nonlocal cancelled
+        if prompt == CATEGORY_PROMPTS["grammar_spelling"]:
+            return {"error": "Unable to connect to OpenAI server."}
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled += 1
+            raise
+
+    pipeline.process_llm.process.side_effect = review
+    pipeline.file_processing.generate_embeddings.return_value = [0.0] * 1536
+
+    with pytest.raises(ReviewFailedError, match="Unable to connect to OpenAI server."):
+        await pipeline.run(b"pdf bytes", str(test_resume.file_id), "test_resume.pdf", "pdf", review_mode=REVIEW_PARALLEL)
+
+    assert cancelled == len(CATEGORY_PROMPTS) - 1
+    pipeline.resume_repository.save_resume_feedback.assert_not_called()
+    pipeline.result_store.put.assert_not_called()